@@ -1,6 +1,9 @@
 import streamlit as st
 from datetime import datetime
 from maddehours import maddehours_page
+import uuid
+from utils import llm_telemetry
+from utils.exports import download
 
 # Import your custom pages
 from base import base_page
@@ -39,33 +42,50 @@ def main():
         "🔢 Madde"
     ])
 
-    # Navigation
-    if page == "💡 Info":
-        base_page()
-    elif page == "📝 SurveyBuilder (soon)":
-        survey_builder_page()
-    elif page == "🧼 betterDATA":
-        better_data_page()
-    elif page == "🏷️ autoCODE beta":
-        auto_code_tool_page()
-    elif page == "🗃️ manuCODE":  # New page handler
-        binary_coding_page()
-    elif page == "☢️ Bad Ids":
-        bad_ids_page()
-    elif page == "🎙️ Whisper":
-        whisper_page()
-    elif page == "🤖 Interview Bot":
-        interview_bot_page()
-    elif page == "✍️ goethe":
-        goethe_page()
-    elif page == "👤 PersonaBot (soon)":
-        persona_bot_page()
-    elif page == "🚀 Onboarding (soon)":
-        onboarding_page()
-    elif page == "📚 Knowledge Now (soon)":
-        knowledge_manager_page()
-    elif page == "🔢 Madde":
-        maddehours_page()
+    # Navigation; model calls made by the page are recorded under its name and
+    # this browser session
+    if 'telemetry_session' not in st.session_state:
+        st.session_state.telemetry_session = uuid.uuid4().hex
+    session = st.session_state.telemetry_session
+    with llm_telemetry.scope(session=session, page=page):
+        if page == "💡 Info":
+            base_page()
+        elif page == "📝 SurveyBuilder (soon)":
+            survey_builder_page()
+        elif page == "🧼 betterDATA":
+            better_data_page()
+        elif page == "🏷️ autoCODE beta":
+            auto_code_tool_page()
+        elif page == "🗃️ manuCODE":  # New page handler
+            binary_coding_page()
+        elif page == "☢️ Bad Ids":
+            bad_ids_page()
+        elif page == "🎙️ Whisper":
+            whisper_page()
+        elif page == "🤖 Interview Bot":
+            interview_bot_page()
+        elif page == "✍️ goethe":
+            goethe_page()
+        elif page == "👤 PersonaBot (soon)":
+            persona_bot_page()
+        elif page == "🚀 Onboarding (soon)":
+            onboarding_page()
+        elif page == "📚 Knowledge Now (soon)":
+            knowledge_manager_page()
+        elif page == "🔢 Madde":
+            maddehours_page()
+
+    # Model calls of this session, per page and job
+    with st.sidebar.expander("📈 LLM usage"):
+        calls = llm_telemetry.records(session)
+        if not calls:
+            st.write("No model calls yet.")
+        else:
+            st.dataframe(llm_telemetry.rollup(calls=calls), hide_index=True)
+            download(
+                "Download call log (JSONL)", lambda: llm_telemetry.export_jsonl(session), "llm_calls.jsonl",
+                key='llm_calls', version=(len(calls), calls[-1]['time']),
+            )
 
     # Footer
     st.write("\n\n")
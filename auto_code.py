@@ -1,10 +1,36 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
 import time
-import io
 import matplotlib.pyplot as plt
-from utils.data_utils import generate_coding_schema, classify_review
+from utils.data_utils import (
+    generate_coding_schema, classify_review, classification_prompt,
+    classify_reviews_batch, batch_classification_prompt, pack_reviews, BATCH_TOKEN_BUDGET, CLASSIFICATION_MODEL,
+)
+from utils.classification_cache import ClassificationCache, group_answers
+from utils.answer_clusters import DEFAULT_TIGHTNESS, EMBEDDING_BACKENDS, representative_plan
+from utils.batch_classification import BATCH_BACKENDS, COMPLETED, RUNNING, collect_batch, submit_batch
+from utils.cascade import DEFAULT_CONFIDENCE, DEFAULT_TRAINING_SIZE, CascadeClassifier
+from utils.classification_jobs import ClassificationJobs, JobMismatchError, is_owner_key, jobs_path, new_owner_key
+from utils.dataset_cache import dataset_columns, preview_dataset, load_dataset, upload_key
+from utils.exports import download, frame_version, to_csv, to_parquet, to_xlsx
+from utils.result_cache import session_cache
+from utils.schema_sample import DEFAULT_TOKEN_BUDGET, build_schema_sample
+from utils import llm_telemetry
+from utils.llm_pool import (
+    DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE,
+    RateLimiter, estimate_tokens, format_eta, map_as_completed,
+)
+
+def job_owner():
+    # Jobs belong to a private key kept in the page address: bookmarking the
+    # page brings a user back to their jobs, and other sessions don't see them
+    if 'job_owner' not in st.session_state:
+        owner = st.experimental_get_query_params().get('jobs', [None])[0]
+        st.session_state.job_owner = owner if is_owner_key(owner) else new_owner_key()
+    st.experimental_set_query_params(jobs=st.session_state.job_owner)
+    return st.session_state.job_owner
 
 def auto_code_tool_page():
     st.image("img/autocode.png")
@@ -23,16 +49,15 @@ def auto_code_tool_page():
     schema_file = st.file_uploader("Upload a coding schema XLSX file (optional)", type=["xlsx"])
 
     if uploaded_file is not None:
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        elif uploaded_file.name.endswith('.xlsx'):
-            df = pd.read_excel(uploaded_file)
+        columns = dataset_columns(uploaded_file)
 
         st.write("First 5 rows of the uploaded DataFrame:")
-        st.write(df.head())
+        st.write(preview_dataset(uploaded_file))
 
-        column_name = st.selectbox("Choose column for coding", options=df.columns)
-        id_column = st.selectbox("Choose ID column", options=df.columns)
+        column_name = st.selectbox("Choose column for coding", options=columns)
+        id_column = st.selectbox("Choose ID column", options=columns)
+        # Only the two columns autoCODE works with are loaded from the cache
+        df = load_dataset(uploaded_file, columns=list(dict.fromkeys([column_name, id_column])))
         question_text = st.text_input("Input the question from the questionnaire")
 
         if schema_file is None:
@@ -47,8 +72,18 @@ def auto_code_tool_page():
             with col4:
                 language = st.selectbox("Select language", options=["German", "French", "English"])
 
-            sample_reviews = df[column_name].dropna().sample(n=sample_size, replace=False).to_list()
-            reviews_text = "\n\n".join([str(review) for review in sample_reviews])
+            col1, col2 = st.columns(2)
+            with col1:
+                sample_token_budget = st.number_input("Sample token budget", min_value=500, value=DEFAULT_TOKEN_BUDGET, step=500)
+            with col2:
+                sample_seed = st.number_input("Sample seed", min_value=0, value=0, step=1)
+
+            # Same dataset, column and seed give the same sample on every rerun
+            sample_key = (upload_key(uploaded_file), column_name, sample_size, sample_token_budget, sample_seed)
+            sample_reviews = session_cache('autocode_schema_samples', 16).get_or_compute(
+                sample_key, lambda: build_schema_sample(df[column_name], sample_size, sample_token_budget, sample_seed)
+            )
+            reviews_text = "\n\n".join(sample_reviews)
 
             if st.button("Generate Coding Schema"):
                 with st.spinner('Generating coding schema...'):
@@ -70,93 +105,299 @@ def auto_code_tool_page():
             st.write("Saved Edited Coding Schema:")
             st.write(st.session_state.schema_df)
 
+    # One connection per session, reused across reruns
+    owner = job_owner()
+    jobs = session_cache('classification_jobs', 1).get_or_compute(owner, lambda: ClassificationJobs(jobs_path(owner)))
+
     if uploaded_file is not None and 'schema_df' in st.session_state and question_text:
+        job_name = st.text_input("Job name", f"{uploaded_file.name} - {column_name}")
+        with st.expander("Rate limits"):
+            batched = st.checkbox("Send several reviews per request", value=True)
+            batch_token_budget = st.number_input("Prompt tokens per request", min_value=500, value=BATCH_TOKEN_BUDGET, step=500, disabled=not batched)
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                max_workers = st.number_input("Parallel requests", min_value=1, max_value=64, value=DEFAULT_MAX_WORKERS, step=1)
+            with col2:
+                requests_per_minute = st.number_input("Requests per minute", min_value=1, value=DEFAULT_REQUESTS_PER_MINUTE, step=50)
+            with col3:
+                tokens_per_minute = st.number_input("Tokens per minute", min_value=1000, value=DEFAULT_TOKENS_PER_MINUTE, step=1000)
+
+        with st.expander("Cluster similar answers"):
+            clustered = st.checkbox("Classify only cluster representatives", value=False)
+            col1, col2 = st.columns(2)
+            with col1:
+                embedding_backend = st.selectbox("Vectorizer", options=list(EMBEDDING_BACKENDS), disabled=not clustered)
+            with col2:
+                tightness = st.slider(
+                    "Cluster tightness", min_value=0.5, max_value=0.99, value=DEFAULT_TIGHTNESS, step=0.01, disabled=not clustered,
+                    help="Minimum similarity for an answer to take over the codes of its cluster representative. Higher is more accurate, lower saves more calls.",
+                )
+
+        with st.expander("Local cascade model"):
+            cascade = st.checkbox("Let a local model label the answers it is sure about", value=False)
+            col1, col2 = st.columns(2)
+            with col1:
+                training_size = st.number_input("Answers labelled by the LLM first", min_value=50, value=DEFAULT_TRAINING_SIZE, step=50, disabled=not cascade)
+            with col2:
+                confidence = st.slider(
+                    "Local model confidence", min_value=0.6, max_value=0.99, value=DEFAULT_CONFIDENCE, step=0.01, disabled=not cascade,
+                    help="An answer is labelled locally only if the local model is at least this sure about every code.",
+                )
+
+        with st.expander("Batch mode"):
+            batch_mode = st.checkbox(
+                "Submit as an offline batch job", value=False,
+                help="For large overnight runs: requests are sent to a batch backend at lower cost and the results are fetched later from the job below. Not combined with the local cascade model.",
+            )
+            batch_backend = st.selectbox("Batch backend", options=list(BATCH_BACKENDS), disabled=not batch_mode)
+
+        if job_name in jobs.names():
+            done, total = jobs.progress(job_name)
+            st.caption(f"Job '{job_name}' has {done} of {total} answers classified; classifying again resumes it.")
+
         if st.button("Classify Reviews"):
-            with st.spinner('Classifying reviews...'):
+            with st.spinner('Classifying reviews...'), llm_telemetry.scope(job=job_name):
                 topics = st.session_state.schema_df.to_dict('records')
-                results = []
                 df_filtered = df[[column_name, id_column]].dropna(subset=[column_name])
+                reviews = df_filtered[column_name].tolist()
+                ids = df_filtered[id_column].tolist()
                 total_reviews = len(df_filtered)
-                
+                try:
+                    open_positions = jobs.start(job_name, reviews, ids, topics, question_text)
+                except JobMismatchError as e:
+                    st.error(str(e))
+                    st.stop()
+                st.session_state.classification_job = job_name
+                # Rows waiting on a submitted batch are not sent again
+                in_batches = jobs.batch_positions(job_name)
+                open_positions = [position for position in open_positions if position not in in_batches]
+
                 progress_bar = st.progress(0)
                 start_time = time.time()
                 time_placeholder = st.empty()
 
-                for idx, row in df_filtered.iterrows():
-                    review = row[column_name]
-                    my_id = row[id_column]
-                    classification = classify_review(str(review), topics, question_text)
-                    result = {topic['id']: 0 for topic in topics}
-                    for relevant_topic in classification['relevant_topics']:
-                        result[relevant_topic['id']] = 1
-                    result['Review'] = review
-                    result['myID'] = my_id
-                    results.append(result)
-
-                    progress = min((idx + 1) / total_reviews, 1.0)
-                    progress_bar.progress(progress)
-
-                    elapsed_time = time.time() - start_time
-                    avg_time_per_review = elapsed_time / (idx + 1)
-                    remaining_time = avg_time_per_review * (total_reviews - idx - 1)
-                    time_placeholder.text(f"Estimated remaining time: {int(remaining_time // 60)} minutes and {int(remaining_time % 60)} seconds")
-
-                results_df = pd.DataFrame(results)
-                st.write(results_df)
-                
-                # Calculate the percentage share
-                topic_counts = results_df.drop(columns=['Review', 'myID']).sum()
-                topic_percentages = (topic_counts / len(results_df)) * 100
-                topic_percentages = topic_percentages.sort_values(ascending=True)
-
-                # Map topic IDs to topic names
-                topic_id_to_name = {row['id']: row['topic'] for row in topics}
-                topic_labels = [topic_id_to_name[topic_id] for topic_id in topic_percentages.index]
-
-                # Display the horizontal bar chart
-                st.write("Percentage Share of Classified Topics:")
-                fig, ax = plt.subplots()
-                topic_percentages.plot(kind='barh', ax=ax)
-                ax.set_xlabel("Percentage (%)")
-                ax.set_ylabel("Topics")
-                ax.set_title("Percentage Share of Classified Topics")
-                
-                # Adding text labels to the side
-                ax.set_yticklabels(topic_labels)
-                for i in ax.patches:
-                    ax.text(i.get_width() + 0.5, i.get_y() + 0.5, f'{i.get_width():.2f}%', ha='center', va='center')
+                # Answers that are identical after normalization are classified
+                # once; answers classified in earlier runs come from the cache
+                groups = group_answers([reviews[position] for position in open_positions])
+                groups = {answer: [open_positions[i] for i in positions] for answer, positions in groups.items()}
+                keys = {answer: ClassificationCache.key(answer, topics, question_text, CLASSIFICATION_MODEL) for answer in groups}
+                cache = ClassificationCache()
+                cached = cache.get_many(keys.values(), topics)
+                jobs.record(job_name, {
+                    position: cached[keys[answer]]
+                    for answer, positions in groups.items() if keys[answer] in cached
+                    for position in positions
+                })
+                cache_hits = sum(len(positions) for answer, positions in groups.items() if keys[answer] in cached)
+                pending = [answer for answer in groups if keys[answer] not in cached]
+                pending_reviews = [reviews[groups[answer][0]] for answer in pending]
+                # Answers close to a cluster representative take over its codes
+                followers = {}
+                if clustered and len(pending) > 1:
+                    vectors = EMBEDDING_BACKENDS[embedding_backend](pending_reviews)
+                    leader_of, follows = representative_plan(vectors, tightness)
+                    for member in np.flatnonzero(follows):
+                        followers.setdefault(pending[leader_of[member]], []).append(pending[member])
+                    pending = [answer for answer, follow in zip(pending, follows) if not follow]
+                    pending_reviews = [reviews[groups[answer][0]] for answer in pending]
+                calls_saved = sum(len(members) for members in followers.values())
+                done = total_reviews - len(open_positions) + cache_hits
+                sent = 0
+                if total_reviews:
+                    progress_bar.progress(done / total_reviews)
+
+                def finish(answer, classification):
+                    # Job rows of the answer and of the answers following it
+                    return {
+                        position: classification
+                        for labelled in [answer] + followers.get(answer, [])
+                        for position in groups[labelled]
+                    }
+
+                def classify_answers(answers):
+                    # Sends answers to the LLM; every completed batch is
+                    # checkpointed to the job and the cache before the next
+                    # one is taken, and the ETA counts only answers sent
+                    nonlocal done, sent
+                    answer_reviews = [reviews[groups[answer][0]] for answer in answers]
+                    if batched:
+                        batches = pack_reviews(answer_reviews, topics, question_text, batch_token_budget)
+                        prompts = [batch_classification_prompt([answer_reviews[position] for position in batch], topics, question_text) for batch in batches]
+                        classify = lambda batch: classify_reviews_batch([answer_reviews[position] for position in batch], topics, question_text, limiter=limiter)
+                    else:
+                        batches = [[position] for position in range(len(answer_reviews))]
+                        prompts = [classification_prompt(str(review), topics, question_text) for review in answer_reviews]
+                        classify = lambda batch: [classify_review(str(answer_reviews[batch[0]]), topics, question_text)]
+                    # Prompt plus a small allowance per review for the JSON answer
+                    token_counts = [estimate_tokens(prompt) + 20 * len(batch) for prompt, batch in zip(prompts, batches)]
+                    classifications = map_as_completed(classify, batches, max_workers=max_workers, limiter=limiter, token_counts=token_counts)
+                    labelled = {}
+                    for batch_position, batch_classifications in classifications:
+                        new_entries = {}
+                        finished_rows = {}
+                        for answer_position, classification in zip(batches[batch_position], batch_classifications):
+                            # Unusable answers are not recorded; the rows stay
+                            # open for the next run
+                            if classification is None:
+                                continue
+                            answer = answers[answer_position]
+                            labelled[answer] = classification
+                            new_entries[keys[answer]] = classification
+                            finished_rows.update(finish(answer, classification))
+                        jobs.record(job_name, finished_rows)
+                        cache.put_many(new_entries)
+                        done += len(finished_rows)
+                        sent += len(batches[batch_position])
+
+                        progress_bar.progress(done / total_reviews)
+                        time_placeholder.text(format_eta(sent, expected_sent, time.time() - start_time))
+                    return labelled
+
+                limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+                expected_sent = len(pending)
+                cascade_model = None
+                locally_labelled = 0
+                if batch_mode:
+                    if pending:
+                        requests = [
+                            (reviews[groups[answer][0]], list(finish(answer, None)), keys[answer])
+                            for answer in pending
+                        ]
+                        batch_ids = submit_batch(jobs, job_name, batch_backend, requests, topics, question_text)
+                        st.success(
+                            f"Submitted {len(requests)} requests as {len(batch_ids)} batch(es): {', '.join(batch_ids)}. "
+                            "Fetch the results from the job below once they have finished."
+                        )
+                elif cascade and len(pending) > training_size:
+                    # The LLM labels a random sample first; the local model
+                    # trained on it labels what it is sure about, and only the
+                    # rest goes to the LLM as well
+                    order = np.random.default_rng(0).permutation(len(pending))
+                    training = [pending[i] for i in np.sort(order[:training_size])]
+                    remaining = [pending[i] for i in np.sort(order[training_size:])]
+                    expected_sent = len(training)
+                    labelled = classify_answers(training)
+                    cascade_model = CascadeClassifier([topic['id'] for topic in topics], confidence)
+                    cascade_model.fit([reviews[groups[answer][0]] for answer in labelled], list(labelled.values()))
+                    predictions, confident = cascade_model.predict([reviews[groups[answer][0]] for answer in remaining])
+                    finished_rows = {}
+                    for answer, classification, is_confident in zip(remaining, predictions, confident):
+                        if is_confident:
+                            finished_rows.update(finish(answer, classification))
+                    jobs.record(job_name, finished_rows)
+                    done += len(finished_rows)
+                    locally_labelled = int(confident.sum())
+                    remaining = [answer for answer, is_confident in zip(remaining, confident) if not is_confident]
+                    expected_sent += len(remaining)
+                    classify_answers(remaining)
+                else:
+                    classify_answers(pending)
+                cache.close()
+                if not batch_mode and jobs.pending(job_name):
+                    st.warning(f"{len(jobs.pending(job_name))} answers got no valid classification. Classify again to retry them.")
+
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("Answers", total_reviews)
+                with col2:
+                    duplicates = len(open_positions) - len(groups)
+                    st.metric("Duplicate answers", duplicates, f"{duplicates / max(total_reviews, 1):.0%}", delta_color="off")
+                with col3:
+                    st.metric("Served from cache", cache_hits, f"{cache_hits / max(total_reviews, 1):.0%}", delta_color="off")
+                with col4:
+                    answers_to_classify = len(pending) + calls_saved
+                    st.metric("Classifications saved by clustering", calls_saved, f"{calls_saved / max(answers_to_classify, 1):.0%}", delta_color="off")
+
+                if cascade_model is not None:
+                    st.write(
+                        f"Local model labelled {locally_labelled} of {len(pending) - training_size} answers after training on "
+                        f"{training_size} LLM labels. On held-out LLM labels it would have labelled "
+                        f"{cascade_model.holdout_coverage:.0%} locally, with this agreement:"
+                    )
+                    st.dataframe(cascade_model.agreement, hide_index=True)
 
-                st.pyplot(fig)
+                usage = llm_telemetry.rollup(st.session_state.get('telemetry_session'))
+                if not usage.empty:
+                    st.write("Model calls for this job so far:")
+                    st.dataframe(usage[usage['job'] == job_name], hide_index=True)
+
+    job_names = jobs.names()
+    if not job_names:
+        return
+    st.caption("Your jobs are linked to this page's address; bookmark it to come back to them.")
+    current_job = st.session_state.get('classification_job')
+    job_name = st.selectbox(
+        "Classification job", options=job_names,
+        index=job_names.index(current_job) if current_job in job_names else 0,
+        format_func=lambda name: "{} ({} of {} classified)".format(name, *jobs.progress(name)),
+    )
+    st.session_state.classification_job = job_name
+    for batch in jobs.batches(job_name):
+        requested = sum(len(request['positions']) for request in batch['requests'].values())
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.caption(f"Batch {batch['id']} ({batch['backend']}) for {requested} answers, submitted {time.strftime('%d.%m.%Y %H:%M', time.localtime(batch['submitted']))}")
+        with col2:
+            if st.button("Fetch results", key=f"batch_{batch['id']}"):
+                cache = ClassificationCache()
+                state, classified = collect_batch(jobs, cache, job_name, batch['id'])
+                cache.close()
+                if state == RUNNING:
+                    st.info("The batch is still running.")
+                elif state == COMPLETED:
+                    st.success(f"Merged {classified} of {requested} answers.")
+                else:
+                    st.warning(f"The batch failed; merged the {classified} answers it finished. Classify again to send the rest.")
+    results_df = jobs.results(job_name)
+    topics = jobs.topics(job_name)
+    if st.button("Delete job"):
+        jobs.delete(job_name)
+        del st.session_state.classification_job
+        st.rerun()
+
+    if not results_df.empty:
+        # Calculate the percentage share
+        topic_counts = results_df.drop(columns=['Review', 'myID']).sum()
+        topic_percentages = (topic_counts / len(results_df)) * 100
+        topic_percentages = topic_percentages.sort_values(ascending=True)
+
+        # Map topic IDs to topic names
+        topic_id_to_name = {row['id']: row['topic'] for row in topics}
+        topic_labels = [topic_id_to_name.get(topic_id, topic_id) for topic_id in topic_percentages.index]
+
+        # Display the horizontal bar chart
+        st.write("Percentage Share of Classified Topics:")
+        fig, ax = plt.subplots()
+        topic_percentages.plot(kind='barh', ax=ax)
+        ax.set_xlabel("Percentage (%)")
+        ax.set_ylabel("Topics")
+        ax.set_title("Percentage Share of Classified Topics")
+
+        # Adding text labels to the side
+        ax.set_yticklabels(topic_labels)
+        for i in ax.patches:
+            ax.text(i.get_width() + 0.5, i.get_y() + 0.5, f'{i.get_width():.2f}%', ha='center', va='center')
+
+        st.pyplot(fig)
 
     custom_var_name = st.text_input("Enter the base name for the columns", st.session_state.custom_var_name)
     st.session_state.custom_var_name = custom_var_name
 
-    if 'custom_var_name' in st.session_state and 'results_df' in locals():
-        custom_var_name = st.session_state.custom_var_name
-        topic_columns = [col for col in results_df.columns if col not in ['Review', 'myID']]
-        new_column_names = {col: f"{custom_var_name}r{col}" for col in topic_columns}
-        results_df.rename(columns=new_column_names, inplace=True)
-
-        st.write(results_df)
-
-        csv = results_df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="Download CSV",
-            data=csv,
-            file_name='classified_reviews.csv',
-            mime='text/csv',
-        )
-
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            results_df.to_excel(writer, index=False, sheet_name='Sheet1')
-        excel_data = output.getvalue()
-        st.download_button(
-            label="Download Excel",
-            data=excel_data,
-            file_name='classified_reviews.xlsx',
-            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        )
+    topic_columns = [col for col in results_df.columns if col not in ['Review', 'myID']]
+    new_column_names = {col: f"{custom_var_name}r{col}" for col in topic_columns}
+    results_df.rename(columns=new_column_names, inplace=True)
+
+    st.write(results_df)
+
+    # Built only when asked for, and again only when the results change
+    version = frame_version(results_df)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        download("Download CSV", lambda: to_csv(results_df), 'classified_reviews.csv', 'autocode_csv', version)
+    with col2:
+        download("Download Excel", lambda: to_xlsx({'Sheet1': results_df}), 'classified_reviews.xlsx', 'autocode_xlsx', version)
+    with col3:
+        download("Download Parquet", lambda: to_parquet(results_df), 'classified_reviews.parquet', 'autocode_parquet', version)
 
 if __name__ == "__main__":
     auto_code_tool_page()
\ No newline at end of file
@@ -1,6 +1,39 @@
 import streamlit as st
 import pandas as pd
-import io
+from io import BytesIO
+from utils.dataset_cache import upload_key
+from utils.exports import download, to_csv, to_xlsx
+from utils.id_reconciliation import reconcile
+from utils.result_cache import session_cache
+from utils.workbook import read_sheet
+
+def preview_ids_file(uploaded_file):
+    # Header and first rows only; the rest of the file is not read
+    def read():
+        if uploaded_file.name.endswith('.csv'):
+            return pd.read_csv(BytesIO(uploaded_file.getvalue()), nrows=5)
+        return read_sheet(uploaded_file.getvalue(), max_rows=5)
+    return session_cache('bad_ids_previews', 16).get_or_compute(upload_key(uploaded_file), read)
+
+def read_id_column(uploaded_file, column):
+    if uploaded_file.name.endswith('.csv'):
+        return pd.read_csv(BytesIO(uploaded_file.getvalue()), usecols=[column], dtype=str)[column]
+    return read_sheet(uploaded_file.getvalue(), columns=[column])[column]
+
+def common_columns(uploaded_files):
+    # Columns present in every file, in the order of the first one
+    columns = [preview_ids_file(uploaded_file).columns.tolist() for uploaded_file in uploaded_files]
+    return [column for column in columns[0] if all(column in other for other in columns[1:])]
+
+def unique_names(uploaded_files):
+    # Report labels per file; repeated file names get a running number
+    names = {}
+    for uploaded_file in uploaded_files:
+        name = uploaded_file.name
+        if name in names:
+            name = f"{name} ({len(names) + 1})"
+        names[name] = uploaded_file
+    return names
 
 def bad_ids_page():
     st.image("img/badids.jpg")
@@ -10,43 +43,55 @@ def bad_ids_page():
     Bad Ids identifies which survey responses were retained and which were discarded, providing panel providers with a clear report on the IDs of good and bad data used in the final analysis.
     """)
 
-    original_file = st.file_uploader("Upload the original dataset (xlsx)", type="xlsx")
-    cleaned_file = st.file_uploader("Upload the cleaned dataset (xlsx)", type="xlsx")
-
-    if original_file is not None and cleaned_file is not None:
-        original_df = pd.read_excel(original_file)
-        cleaned_df = pd.read_excel(cleaned_file)
+    original_files = st.file_uploader("Upload the original dataset, one file per wave (xlsx or csv)", type=["xlsx", "csv"], accept_multiple_files=True)
+    cleaned_files = st.file_uploader("Upload the cleaned datasets (xlsx or csv)", type=["xlsx", "csv"], accept_multiple_files=True)
 
+    if original_files and cleaned_files:
         st.write("First 5 rows of the original dataset:")
-        st.write(original_df.head())
+        st.write(preview_ids_file(original_files[0]))
 
         st.write("First 5 rows of the cleaned dataset:")
-        st.write(cleaned_df.head())
+        st.write(preview_ids_file(cleaned_files[0]))
 
-        # Let the user choose the ID variable from both datasets
+        # Let the user choose the ID variable; it must exist in every file
         st.write("Select the respondent ID variable:")
-        original_id_var = st.selectbox("Select from original dataset", options=original_df.columns)
-        cleaned_id_var = st.selectbox("Select from cleaned dataset", options=cleaned_df.columns)
+        original_id_var = st.selectbox("Select from original datasets", options=common_columns(original_files))
+        cleaned_id_var = st.selectbox("Select from cleaned datasets", options=common_columns(cleaned_files))
+        if original_id_var is None or cleaned_id_var is None:
+            st.error("The uploaded files have no column in common.")
+            return
 
+        inputs = (
+            tuple(upload_key(uploaded_file) for uploaded_file in original_files),
+            tuple(upload_key(uploaded_file) for uploaded_file in cleaned_files),
+            original_id_var, cleaned_id_var,
+        )
         if st.button("Process"):
             with st.spinner("Processing IDs..."):
-                good_ids = set(cleaned_df[cleaned_id_var])
-                all_ids = set(original_df[original_id_var])
-                bad_ids = all_ids - good_ids
-
-                good_ids_df = pd.DataFrame(good_ids, columns=[original_id_var])
-                bad_ids_df = pd.DataFrame(bad_ids, columns=[original_id_var])
-
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    good_ids_df.to_excel(writer, index=False, sheet_name='Good IDs')
-                    bad_ids_df.to_excel(writer, index=False, sheet_name='Bad IDs')
-                
-                excel_data = output.getvalue()
-
-                st.download_button(
-                    label="Download IDs Report",
-                    data=excel_data,
-                    file_name='ids_report.xlsx',
-                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
+                # Only the ID columns are read; IDs like "00123", 123 and 123.0
+                # count as the same respondent
+                waves = {name: read_id_column(uploaded_file, original_id_var) for name, uploaded_file in unique_names(original_files).items()}
+                cleaned = {name: read_id_column(uploaded_file, cleaned_id_var) for name, uploaded_file in unique_names(cleaned_files).items()}
+                st.session_state.bad_ids_report = (inputs, reconcile(waves, cleaned))
+
+        # Kept across reruns so each download button can be used
+        stored = st.session_state.get('bad_ids_report')
+        if stored is None or stored[0] != inputs:
+            return
+        report = stored[1]
+
+        st.write(report.summary)
+        if not report.unknown.empty:
+            st.warning(f"{len(report.unknown)} IDs of the cleaned data are not in any original wave.")
+        if not report.duplicates.empty:
+            st.warning(f"{len(report.duplicates)} IDs occur more than once; see the 'Duplicate IDs' sheet.")
+
+        # Each file is built only when asked for. Sheets longer than Excel
+        # allows continue on "<sheet> (2)", ...; the CSVs hold all IDs in one file
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            download("Download IDs Report", lambda: to_xlsx({name: df.rename(columns={'ID': original_id_var}) for name, df in report.sheets().items()}), 'ids_report.xlsx', 'bad_ids_report', inputs)
+        with col2:
+            download("Download Good IDs", lambda: to_csv(report.good.rename(columns={'ID': original_id_var})), 'good_ids.csv', 'bad_ids_good', inputs)
+        with col3:
+            download("Download Bad IDs", lambda: to_csv(report.bad.rename(columns={'ID': original_id_var})), 'bad_ids.csv', 'bad_ids_bad', inputs)
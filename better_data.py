@@ -1,53 +1,219 @@
 import streamlit as st
 import pandas as pd
-import re
-from io import BytesIO
-import matplotlib.pyplot as plt
 import numpy as np
+import matplotlib.pyplot as plt
+from utils.quality_checks import (
+    FLAG_COLUMNS, DEFAULT_MISSING_VALUES, CheckPlan, parse_missing_values,
+    identify_speeders, identify_inconsistencies, identify_straightliners, identify_gibberish,
+    identify_gibberish_v2, identify_straightliners_v2, identify_duplicates, identify_near_duplicates,
+)
+from utils.exports import MIME_TYPES, to_xlsx
+from utils.result_cache import session_cache
+from utils.dataset_cache import upload_key, load_dataset
+from utils.score_index import ScoreIndex
+from utils.chunked_checks import read_csv_columns, sketch_csv_times, run_plan_chunked, write_bad_ids
+from utils.speeders import ALL_RESPONDENTS, sketch_by_segment, speeder_thresholds
+import tempfile
+import shutil
+import os
+import json
+
+def load_uploaded_dataset(uploaded_file):
+    # Parsed uploads are kept per session on top of the on-disk Parquet cache
+    dataset_key = upload_key(uploaded_file)
+    df = session_cache('better_data_datasets', max_items=2).get_or_compute(dataset_key, lambda: load_dataset(uploaded_file))
+    return df, dataset_key
+
+def check_options(columns, sketches_of, whole_file_checks=True):
+    # Check widgets; returns the plan plus a placeholder per live counter.
+    # sketches_of(time_column, segment_column) gives per-segment quantile
+    # sketches of the interview times.
+    plan = CheckPlan()
+    counters = {}
+
+    check_speeders = st.checkbox('Check Speeders')
+    if check_speeders:
+        time_column = st.selectbox('Select time column', columns)
+        if time_column:
+            speeder_mode = st.radio('Speeder threshold', ['Absolute (seconds)', 'Relative to the median'], horizontal=True)
+            if speeder_mode == 'Absolute (seconds)':
+                median_time = sketches_of(time_column, None)[ALL_RESPONDENTS].median()
+                proposed_threshold = median_time / 2 if np.isfinite(median_time) else 0.0
+                time_threshold = st.number_input('Speeder Threshold (in seconds)', value=proposed_threshold)
+                speeders_weight = st.slider('Speeder Weight', min_value=0.0, max_value=3.0, value=1.0)
+                plan.add('Speeder', 'speeders', [time_column], speeders_weight, time_threshold=time_threshold)
+            else:
+                segment_column = st.selectbox('Segment thresholds by (optional)', [None] + list(columns), format_func=lambda column: 'No segments' if column is None else column)
+                speeder_ratio = st.slider('Speeder threshold as a share of the median time', min_value=0.1, max_value=1.0, value=0.5, step=0.05)
+                thresholds = speeder_thresholds(sketches_of(time_column, segment_column), speeder_ratio)
+                st.write("Speeder thresholds (in seconds):", pd.DataFrame(sorted(thresholds.items()), columns=['Segment', 'Threshold']))
+                speeders_weight = st.slider('Speeder Weight', min_value=0.0, max_value=3.0, value=1.0)
+                speeder_columns = [time_column] + ([segment_column] if segment_column else [])
+                plan.add('Speeder', 'relative_speeders', speeder_columns, speeders_weight, ratio=speeder_ratio, thresholds=sorted(thresholds.items()))
+            counters['Speeder'] = (st.empty(), "Number of speeders")
+
+    check_inconsistencies = st.checkbox('Check Inconsistencies')
+    if check_inconsistencies:
+        age_column = st.selectbox('Select age column', columns)
+        birth_year_column = st.selectbox('Select birth year column', columns)
+        inconsistencies_weight = st.slider('Inconsistencies Weight', min_value=0.0, max_value=3.0, value=1.0)
+        missing_values_inconsistencies = st.text_input('Enter missing values separated by commas', DEFAULT_MISSING_VALUES, key='missing_values_inconsistencies')
+        plan.add('Inconsistency', 'inconsistencies', [age_column, birth_year_column], inconsistencies_weight, parse_missing_values(missing_values_inconsistencies))
+        counters['Inconsistency'] = (st.empty(), "Number of inconsistencies")
+
+    check_straightliners = st.checkbox('Check Straightliners')
+    if check_straightliners:
+        question_columns = st.multiselect('Select columns for straightliners', columns)
+        straightliners_weight = st.slider('Straightliners Weight', min_value=0.0, max_value=3.0, value=1.0)
+        missing_values_straightliners = st.text_input('Enter missing values separated by commas', DEFAULT_MISSING_VALUES, key='missing_values_straightliners')
+        if question_columns:
+            plan.add('Straightliner', 'straightliners', question_columns, straightliners_weight, parse_missing_values(missing_values_straightliners))
+            counters['Straightliner'] = (st.empty(), "Number of straightliners")
+
+    check_gibberish = st.checkbox('Check Gibberish')
+    if check_gibberish:
+        open_answer_column = st.selectbox('Select open answer column', columns)
+        language = st.selectbox('Select language for gibberish detection', ['en', 'de'])
+        gibberish_weight = st.slider('Gibberish Weight', min_value=0.0, max_value=3.0, value=1.0)
+        missing_values_gibberish = st.text_input('Enter missing values separated by commas', DEFAULT_MISSING_VALUES, key='missing_values_gibberish')
+        plan.add('Gibberish', 'gibberish', [open_answer_column], gibberish_weight, parse_missing_values(missing_values_gibberish), language=language)
+        counters['Gibberish'] = (st.empty(), "Number of gibberish answers")
+
+    check_straightliners_v2 = st.checkbox('Check Straightliners v2')
+    if check_straightliners_v2:
+        question_columns_v2 = st.multiselect('Select columns for straightliners v2', columns)
+        straightliners_v2_weight = st.slider('Straightliners v2 Weight', min_value=0.0, max_value=3.0, value=1.0)
+        missing_values_straightliners_v2 = st.text_input('Enter missing values separated by commas', DEFAULT_MISSING_VALUES, key='missing_values_straightliners_v2')
+        if question_columns_v2:
+            plan.add('Straightliner_v2', 'straightliners_v2', question_columns_v2, straightliners_v2_weight, parse_missing_values(missing_values_straightliners_v2))
+            counters['Straightliner_v2'] = (st.empty(), "Number of straightliners v2")
+
+    check_gibberish_v2 = st.checkbox('Check Gibberish v2')
+    if check_gibberish_v2:
+        open_answer_column_v2 = st.selectbox('Select open answer column v2', columns)
+        language_v2 = st.selectbox('Select language for gibberish detection v2', ['en', 'de'], key='language_v2')
+        gibberish_v2_weight = st.slider('Gibberish v2 Weight', min_value=0.0, max_value=3.0, value=1.0)
+        missing_values_gibberish_v2 = st.text_input('Enter missing values separated by commas', DEFAULT_MISSING_VALUES, key='missing_values_gibberish_v2')
+        plan.add('Gibberish_v2', 'gibberish_v2', [open_answer_column_v2], gibberish_v2_weight, parse_missing_values(missing_values_gibberish_v2), language=language_v2)
+        counters['Gibberish_v2'] = (st.empty(), "Number of gibberish answers v2")
+
+    check_duplicates = st.checkbox('Check Duplicates')
+    if check_duplicates:
+        duplicate_columns = st.multiselect('Select columns to check for duplicates', columns)
+        duplicates_weight = st.slider('Duplicates Weight', min_value=0.0, max_value=3.0, value=1.0)
+        missing_values_duplicates = st.text_input('Enter missing values separated by commas', DEFAULT_MISSING_VALUES, key='missing_values_duplicates')
+        if duplicate_columns:
+            plan.add('Duplicate', 'duplicates', duplicate_columns, duplicates_weight, parse_missing_values(missing_values_duplicates))
+            counters['Duplicate'] = (st.empty(), "Number of duplicates")
+
+    # Near duplicates compare every answer with every other one, so they are
+    # only offered when the whole file is in memory
+    check_near_duplicates = whole_file_checks and st.checkbox('Check Near Duplicates (open answers)')
+    if check_near_duplicates:
+        near_duplicate_column = st.selectbox('Select open answer column for near duplicates', columns)
+        similarity_threshold = st.slider('Similarity threshold', min_value=0.5, max_value=1.0, value=0.8, step=0.05)
+        near_duplicates_weight = st.slider('Near Duplicates Weight', min_value=0.0, max_value=3.0, value=1.0)
+        missing_values_near_duplicates = st.text_input('Enter missing values separated by commas', DEFAULT_MISSING_VALUES, key='missing_values_near_duplicates')
+        plan.add('Near_Duplicate', 'near_duplicates', [near_duplicate_column], near_duplicates_weight, parse_missing_values(missing_values_near_duplicates), threshold=similarity_threshold)
+        counters['Near_Duplicate'] = (st.empty(), "Number of near duplicates")
+    return plan, counters
+
+def score_charts(score_index):
+    # Drawn from the bins and box statistics computed once after the check
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader('Score Distribution')
+        fig, ax = plt.subplots()
+        ax.hist(score_index.bin_edges[:-1], bins=score_index.bin_edges, weights=score_index.bin_counts, edgecolor='k')
+        ax.set_xlabel('Score')
+        ax.set_ylabel('Frequency')
+        st.pyplot(fig)
+
+    with col2:
+        st.subheader('Score Box Plot')
+        # An empty dataset has no box statistics to draw
+        if score_index.total == 0:
+            st.write("No scores to plot.")
+            return
+        fig, ax = plt.subplots()
+        ax.bxp([score_index.box_stats], vert=False)
+        ax.set_xlabel('Score')
+        st.pyplot(fig)
+
+def config_download(plan, id_column):
+    # The same JSON drives better_data_batch.py for headless runs over many waves
+    config = dict(plan.to_dict(), id_column=id_column)
+    st.download_button('Download check configuration', data=json.dumps(config, indent=2), file_name='better_data_config.json', mime='application/json')
+
+def discard_chunked_run():
+    # The previous run's flagged rows and bad IDs are deleted from tmp
+    result = st.session_state.pop('chunked_result', None)
+    if result is not None:
+        shutil.rmtree(os.path.dirname(result.flagged_path), ignore_errors=True)
+    for key in ('chunked_score_index', 'chunked_id_column', 'chunked_upload'):
+        st.session_state.pop(key, None)
+
+def chunked_check_page(uploaded_file):
+    # Large CSV mode: the file is streamed in row chunks and only rows with a
+    # positive score are kept, in a temp file on disk
+    if st.session_state.get('chunked_upload') != upload_key(uploaded_file):
+        discard_chunked_run()
+    columns = read_csv_columns(uploaded_file)
+    st.write("Columns:", columns)
+
+    st.header('Quality Check Options')
+    id_column = st.selectbox('Select ID column', columns)
+    def sketches_of(time_column, segment_column):
+        key = (upload_key(uploaded_file), time_column, segment_column)
+        return session_cache('better_data_sketches', max_items=16).get_or_compute(key, lambda: sketch_csv_times(uploaded_file, time_column, segment_column))
+
+    plan, counters = check_options(columns, sketches_of, whole_file_checks=False)
+    config_download(plan, id_column)
+
+    if st.button('Run Check'):
+        discard_chunked_run()
+        run_dir = tempfile.mkdtemp(prefix='betterdata_')
+        with st.spinner('Checking file in chunks...'):
+            try:
+                result = run_plan_chunked(uploaded_file, plan, os.path.join(run_dir, 'flagged_rows.csv'))
+            except Exception:
+                shutil.rmtree(run_dir, ignore_errors=True)
+                raise
+        st.session_state['chunked_result'] = result
+        st.session_state['chunked_score_index'] = ScoreIndex.from_counts(list(result.score_counts), list(result.score_counts.values()))
+        st.session_state['chunked_id_column'] = id_column
+        st.session_state['chunked_upload'] = upload_key(uploaded_file)
+
+    if 'chunked_result' in st.session_state:
+        result = st.session_state['chunked_result']
+        id_column = st.session_state['chunked_id_column']
+        for name, (placeholder, label) in counters.items():
+            placeholder.write(f"{label}: {result.flag_counts.get(name, 0)}")
+        st.write(f"Total Respondents: {result.total_rows}")
+        st.write(f"Respondents with at least one mistake: {result.respondents_with_mistakes}")
+
+        if result.respondents_with_mistakes == 0:
+            return
+
+        score_index = st.session_state['chunked_score_index']
+        score_charts(score_index)
+
+        positive_scores = score_index.values[score_index.values > 0]
+        threshold = float(positive_scores[0])
+        if score_index.max > threshold:
+            threshold = st.slider('Score Threshold for Flagging Cheaters', min_value=threshold, max_value=score_index.max, value=threshold)
+        num_affected = score_index.count_at_least(threshold)
+        st.write(f"Number of respondents affected by the threshold: {num_affected}")
+        st.write(f"Number of respondents remaining in the dataset: {result.total_rows - num_affected}")
 
-def identify_speeders(df, time_column, time_threshold):
-    speeders = df[time_column] <= time_threshold
-    return speeders.astype(int)
-
-def identify_inconsistencies(df, age_column, birth_year_column, missing_values, allowable_difference=1):
-    current_year = pd.Timestamp.now().year
-    inconsistencies = df.apply(
-        lambda row: abs(row[age_column] - (current_year - row[birth_year_column])) > allowable_difference 
-                    if row[age_column] not in missing_values and row[birth_year_column] not in missing_values 
-                    else 0,
-        axis=1
-    )
-    return inconsistencies.astype(int)
-
-def identify_straightliners(df, questions, missing_values):
-    def is_straightliner(row):
-        unique_values = row[~row.isin(missing_values)].nunique()
-        return unique_values == 1
-    straightliners = df[questions].apply(is_straightliner, axis=1)
-    return straightliners.astype(int)
-
-def identify_gibberish(df, open_answer_column, missing_values, language='en'):
-    if language == 'de':
-        gibberish_pattern = re.compile(r'^[a-zA-ZäöüÄÖÜß]{8,}$')
-    else:
-        gibberish_pattern = re.compile(r'^[a-zA-Z]{8,}$')
-    gibberish = df[open_answer_column].apply(lambda x: bool(gibberish_pattern.match(str(x))) if x not in missing_values else 0)
-    return gibberish.astype(int)
-
-def identify_gibberish_v2(df, open_answer_column, missing_values, language='en'):
-    return identify_gibberish(df, open_answer_column, missing_values, language)
-
-def identify_straightliners_v2(df, questions, missing_values):
-    return identify_straightliners(df, questions, missing_values)
-
-def identify_duplicates(df, columns, missing_values):
-    def is_duplicate(row):
-        for col in columns:
-            if row[col] in missing_values:
-                return 0
-        return 1
-    duplicates = df.duplicated(subset=columns, keep=False) & df.apply(is_duplicate, axis=1).astype(bool)
-    return duplicates.astype(int)
+        if st.button('Run'):
+            bad_ids_path = os.path.join(os.path.dirname(result.flagged_path), 'bad_ids.csv')
+            with st.spinner('Writing bad IDs...'):
+                write_bad_ids(result.flagged_path, threshold, bad_ids_path)
+            st.write("Bad IDs (first 1000):", pd.read_csv(bad_ids_path, usecols=[id_column], nrows=1000)[id_column].tolist())
+            with open(bad_ids_path, 'rb') as f:
+                st.download_button('Download Bad IDs', data=f, file_name='bad_ids.csv', mime=MIME_TYPES['csv'])
 
 def better_data_page():
     st.image("img/betterdata.jpg")
@@ -59,140 +225,46 @@ def better_data_page():
 
     uploaded_file = st.file_uploader("Choose an Excel or CSV file", type=["xlsx", "csv"])
 
+    large_file_mode = False
+    if uploaded_file is not None and uploaded_file.name.endswith('.csv'):
+        large_file_mode = st.checkbox('Large file mode (process the CSV in chunks with bounded memory)')
+        if large_file_mode:
+            st.caption("Uploads are limited to 2 GB (server.maxUploadSize in .streamlit/config.toml) and the upload itself stays in memory.")
+
+    if large_file_mode:
+        chunked_check_page(uploaded_file)
+        return
+    discard_chunked_run()
+
     if uploaded_file is not None:
-        if uploaded_file.name.endswith('.xlsx'):
-            df = pd.read_excel(uploaded_file)
-        else:
-            df = pd.read_csv(uploaded_file)
-        
+        df, dataset_key = load_uploaded_dataset(uploaded_file)
+
         original_columns = df.columns.tolist()  # Store the original order of columns
         st.write("Data Preview:", df.head())
 
         st.header('Quality Check Options')
 
         id_column = st.selectbox('Select ID column', df.columns)
-        selected_columns = {id_column}
-
-        check_speeders = st.checkbox('Check Speeders')
-        if check_speeders:
-            time_column = st.selectbox('Select time column', df.columns)
-            selected_columns.add(time_column)
-            if time_column:
-                median_time = df[time_column].median()
-                proposed_threshold = median_time / 2
-                time_threshold = st.number_input('Speeder Threshold (in seconds)', value=proposed_threshold)
-                speeders_weight = st.slider('Speeder Weight', min_value=0.0, max_value=3.0, value=1.0)
-                num_speeders = identify_speeders(df, time_column, time_threshold).sum()
-                st.write(f"Number of speeders: {num_speeders}")
-
-        check_inconsistencies = st.checkbox('Check Inconsistencies')
-        if check_inconsistencies:
-            age_column = st.selectbox('Select age column', df.columns)
-            birth_year_column = st.selectbox('Select birth year column', df.columns)
-            selected_columns.add(age_column)
-            selected_columns.add(birth_year_column)
-            inconsistencies_weight = st.slider('Inconsistencies Weight', min_value=0.0, max_value=3.0, value=1.0)
-            missing_values_inconsistencies = st.text_input('Enter missing values separated by commas', '-77,-99,np.nan', key='missing_values_inconsistencies')
-            missing_values_inconsistencies = [eval(value.strip()) for value in missing_values_inconsistencies.split(',')]
-            num_inconsistencies = identify_inconsistencies(df, age_column, birth_year_column, missing_values_inconsistencies).sum()
-            st.write(f"Number of inconsistencies: {num_inconsistencies}")
-
-        check_straightliners = st.checkbox('Check Straightliners')
-        if check_straightliners:
-            question_columns = st.multiselect('Select columns for straightliners', df.columns)
-            selected_columns.update(question_columns)
-            straightliners_weight = st.slider('Straightliners Weight', min_value=0.0, max_value=3.0, value=1.0)
-            missing_values_straightliners = st.text_input('Enter missing values separated by commas', '-77,-99,np.nan', key='missing_values_straightliners')
-            missing_values_straightliners = [eval(value.strip()) for value in missing_values_straightliners.split(',')]
-            if question_columns:
-                num_straightliners = identify_straightliners(df, question_columns, missing_values_straightliners).sum()
-                st.write(f"Number of straightliners: {num_straightliners}")
-
-        check_gibberish = st.checkbox('Check Gibberish')
-        if check_gibberish:
-            open_answer_column = st.selectbox('Select open answer column', df.columns)
-            selected_columns.add(open_answer_column)
-            language = st.selectbox('Select language for gibberish detection', ['en', 'de'])
-            gibberish_weight = st.slider('Gibberish Weight', min_value=0.0, max_value=3.0, value=1.0)
-            missing_values_gibberish = st.text_input('Enter missing values separated by commas', '-77,-99,np.nan', key='missing_values_gibberish')
-            missing_values_gibberish = [eval(value.strip()) for value in missing_values_gibberish.split(',')]
-            num_gibberish = identify_gibberish(df, open_answer_column, missing_values_gibberish, language).sum()
-            st.write(f"Number of gibberish answers: {num_gibberish}")
-
-        check_straightliners_v2 = st.checkbox('Check Straightliners v2')
-        if check_straightliners_v2:
-            question_columns_v2 = st.multiselect('Select columns for straightliners v2', df.columns)
-            selected_columns.update(question_columns_v2)
-            straightliners_v2_weight = st.slider('Straightliners v2 Weight', min_value=0.0, max_value=3.0, value=1.0)
-            missing_values_straightliners_v2 = st.text_input('Enter missing values separated by commas', '-77,-99,np.nan', key='missing_values_straightliners_v2')
-            missing_values_straightliners_v2 = [eval(value.strip()) for value in missing_values_straightliners_v2.split(',')]
-            if question_columns_v2:
-                num_straightliners_v2 = identify_straightliners_v2(df, question_columns_v2, missing_values_straightliners_v2).sum()
-                st.write(f"Number of straightliners v2: {num_straightliners_v2}")
-
-        check_gibberish_v2 = st.checkbox('Check Gibberish v2')
-        if check_gibberish_v2:
-            open_answer_column_v2 = st.selectbox('Select open answer column v2', df.columns)
-            selected_columns.add(open_answer_column_v2)
-            language_v2 = st.selectbox('Select language for gibberish detection v2', ['en', 'de'], key='language_v2')
-            gibberish_v2_weight = st.slider('Gibberish v2 Weight', min_value=0.0, max_value=3.0, value=1.0)
-            missing_values_gibberish_v2 = st.text_input('Enter missing values separated by commas', '-77,-99,np.nan', key='missing_values_gibberish_v2')
-            missing_values_gibberish_v2 = [eval(value.strip()) for value in missing_values_gibberish_v2.split(',')]
-            num_gibberish_v2 = identify_gibberish_v2(df, open_answer_column_v2, missing_values_gibberish_v2, language_v2).sum()
-            st.write(f"Number of gibberish answers v2: {num_gibberish_v2}")
-
-        check_duplicates = st.checkbox('Check Duplicates')
-        if check_duplicates:
-            duplicate_columns = st.multiselect('Select columns to check for duplicates', df.columns)
-            selected_columns.update(duplicate_columns)
-            duplicates_weight = st.slider('Duplicates Weight', min_value=0.0, max_value=3.0, value=1.0)
-            missing_values_duplicates = st.text_input('Enter missing values separated by commas', '-77,-99,np.nan', key='missing_values_duplicates')
-            missing_values_duplicates = [eval(value.strip()) for value in missing_values_duplicates.split(',')]
-            if duplicate_columns:
-                num_duplicates = identify_duplicates(df, duplicate_columns, missing_values_duplicates).sum()
-                st.write(f"Number of duplicates: {num_duplicates}")
+        plan, counters = check_options(df.columns, lambda time_column, segment_column: sketch_by_segment(df[time_column], df[segment_column] if segment_column else None))
+        config_download(plan, id_column)
+
+        # Evaluate every enabled check in one pass; the live counters and the
+        # "Run Check" results below both come from this single evaluation.
+        # Flags are cached per dataset and check parameters, so moving a weight
+        # slider only recomputes the weighted sum.
+        flags, score = plan.run(df, cache=session_cache('better_data_flags', max_items=64), dataset_key=dataset_key)
+        for name, (placeholder, label) in counters.items():
+            placeholder.write(f"{label}: {flags[name].sum()}")
+
+        selected_columns = {id_column} | plan.columns()
 
         if st.button('Run Check'):
             total_respondents = len(df)
-            score = pd.Series(0, index=df.index)
-            
-            # Initialize columns for all checks
-            df['Speeder'] = 0
-            df['Inconsistency'] = 0
-            df['Straightliner'] = 0
-            df['Gibberish'] = 0
-            df['Straightliner_v2'] = 0
-            df['Gibberish_v2'] = 0
-            df['Duplicate'] = 0
-
-            if check_speeders:
-                df['Speeder'] = identify_speeders(df, time_column, time_threshold)
-                score += df['Speeder'] * speeders_weight
-
-            if check_inconsistencies:
-                df['Inconsistency'] = identify_inconsistencies(df, age_column, birth_year_column, missing_values_inconsistencies)
-                score += df['Inconsistency'] * inconsistencies_weight
-
-            if check_straightliners:
-                df['Straightliner'] = identify_straightliners(df, question_columns, missing_values_straightliners)
-                score += df['Straightliner'] * straightliners_weight
-
-            if check_gibberish:
-                df['Gibberish'] = identify_gibberish(df, open_answer_column, missing_values_gibberish, language)
-                score += df['Gibberish'] * gibberish_weight
-
-            if check_straightliners_v2:
-                df['Straightliner_v2'] = identify_straightliners_v2(df, question_columns_v2, missing_values_straightliners_v2)
-                score += df['Straightliner_v2'] * straightliners_v2_weight
-
-            if check_gibberish_v2:
-                df['Gibberish_v2'] = identify_gibberish_v2(df, open_answer_column_v2, missing_values_gibberish_v2, language_v2)
-                score += df['Gibberish_v2'] * gibberish_v2_weight
-
-            if check_duplicates:
-                df['Duplicate'] = identify_duplicates(df, duplicate_columns, missing_values_duplicates)
-                score += df['Duplicate'] * duplicates_weight
+            df = df.copy()  # keep the cached upload free of result columns
 
+            # Initialize columns for all checks, disabled ones stay 0
+            for name in FLAG_COLUMNS:
+                df[name] = flags[name] if name in flags else 0
             df['Score'] = score
 
             num_respondents_with_mistakes = (score > 0).sum()
@@ -200,6 +272,7 @@ def better_data_page():
             st.write(f"Respondents with at least one mistake: {num_respondents_with_mistakes}")
 
             st.session_state['df'] = df
+            st.session_state['score_index'] = ScoreIndex.from_scores(score)
             st.session_state['selected_columns'] = list(selected_columns)
             st.session_state['id_column'] = id_column
             st.session_state['original_columns'] = original_columns
@@ -210,27 +283,14 @@ def better_data_page():
         selected_columns = st.session_state['selected_columns']
         id_column = st.session_state['id_column']
         original_columns = st.session_state['original_columns']
+        score_index = st.session_state['score_index']
 
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.subheader('Score Distribution')
-            fig, ax = plt.subplots()
-            ax.hist(df['Score'], bins=20, edgecolor='k')
-            ax.set_xlabel('Score')
-            ax.set_ylabel('Frequency')
-            st.pyplot(fig)
+        score_charts(score_index)
 
-        with col2:
-            st.subheader('Score Box Plot')
-            fig, ax = plt.subplots()
-            ax.boxplot(df['Score'], vert=False)
-            ax.set_xlabel('Score')
-            st.pyplot(fig)
+        threshold = st.slider('Score Threshold for Flagging Cheaters', min_value=0.0, max_value=score_index.max, value=1.0)
 
-        threshold = st.slider('Score Threshold for Flagging Cheaters', min_value=0.0, max_value=float(df['Score'].max()), value=1.0)
-
-        num_affected = (df['Score'] >= threshold).sum()
+        # Answered from the precomputed distribution, not by scanning df
+        num_affected = score_index.count_at_least(threshold)
         st.write(f"Number of respondents affected by the threshold: {num_affected}")
         st.write(f"Number of respondents remaining in the dataset: {len(df) - num_affected}")
 
@@ -239,16 +299,10 @@ def better_data_page():
             st.write("Bad IDs:", bad_ids)
 
             if bad_ids:
-                quality_check_columns = ['Speeder', 'Inconsistency', 'Straightliner', 'Gibberish', 'Straightliner_v2', 'Gibberish_v2', 'Duplicate', 'Score']
+                quality_check_columns = FLAG_COLUMNS + ['Score']
                 columns_order = original_columns + [col for col in quality_check_columns if col not in original_columns]
                 bad_ids_df = df[df[id_column].isin(bad_ids)][columns_order]
 
-                # Save to a BytesIO buffer
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    bad_ids_df.to_excel(writer, index=False)
-                output.seek(0)
-
-                st.download_button('Download Bad IDs', data=output, file_name='bad_ids.xlsx', mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                st.download_button('Download Bad IDs', data=to_xlsx({'Sheet1': bad_ids_df}), file_name='bad_ids.xlsx', mime=MIME_TYPES['xlsx'])
 
 
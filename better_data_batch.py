@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+
+import pandas as pd
+
+from utils.quality_checks import FLAG_COLUMNS, CheckPlan
+from utils.speeders import merge_sketches, sketch_by_segment, speeder_thresholds
+
+# Headless betterDATA: runs a saved check configuration (the JSON downloaded
+# from the betterDATA page) over every wave file in a directory, e.g.
+#
+#   python better_data_batch.py better_data_config.json waves/ --output-dir cleaned/ --workers 8
+
+
+def read_wave(path):
+    if path.endswith('.xlsx'):
+        return pd.read_excel(path)
+    return pd.read_csv(path)
+
+
+def sketch_wave(path, config):
+    # Interview time sketches of one wave, per relative speeder check
+    df = read_wave(path)
+    sketches = []
+    for check in config['checks']:
+        if check['kind'] != 'relative_speeders':
+            continue
+        time_column, segment_column = (check['columns'] + [None])[:2]
+        sketches.append(sketch_by_segment(df[time_column], df[segment_column] if segment_column else None))
+    return sketches
+
+
+def pool_speeder_thresholds(config, paths, executor):
+    # Relative speeder cut-offs from the merged sketches of all waves, so every
+    # wave is judged against the same medians
+    per_wave = list(executor.map(sketch_wave, paths, [config] * len(paths)))
+    checks = [check for check in config['checks'] if check['kind'] == 'relative_speeders']
+    for position, check in enumerate(checks):
+        merged = merge_sketches(wave[position] for wave in per_wave)
+        thresholds = speeder_thresholds(merged, check.get('params', {}).get('ratio', 0.5))
+        check.setdefault('params', {})['thresholds'] = sorted(thresholds.items())
+    return config
+
+
+def check_wave(path, config, output_dir, threshold):
+    plan = CheckPlan.from_dict(config)
+    id_column = config.get('id_column')
+    df = read_wave(path)
+    # A wave without its IDs can't be matched back; it is reported as failed
+    if id_column is not None and id_column not in df.columns:
+        raise ValueError(f"ID column '{id_column}' not found")
+    flags, score = plan.run(df)
+
+    output = df[[id_column]].copy() if id_column is not None else pd.DataFrame(index=df.index)
+    for name in FLAG_COLUMNS:
+        output[name] = flags[name] if name in flags else 0
+    output['Score'] = score
+    stem = os.path.splitext(os.path.basename(path))[0]
+    output_path = os.path.join(output_dir, f'{stem}_flags.csv')
+    output.to_csv(output_path, index=False)
+
+    summary = {
+        'file': os.path.basename(path),
+        'respondents': len(df),
+        'respondents_with_mistakes': int((score > 0).sum()),
+        'flagged_at_threshold': int((score >= threshold).sum()),
+    }
+    summary.update({name: int(flags[name].sum()) for name in flags.columns})
+    summary['output'] = output_path
+    return summary
+
+
+def run_batch(config, paths, output_dir, threshold=1.0, workers=None, pooled_speeders=False):
+    os.makedirs(output_dir, exist_ok=True)
+    summaries = []
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if pooled_speeders:
+            config = pool_speeder_thresholds(config, paths, executor)
+        futures = {executor.submit(check_wave, path, config, output_dir, threshold): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                summaries.append(future.result())
+                print(f"Checked {os.path.basename(path)}")
+            except Exception as e:
+                errors.append({'file': os.path.basename(path), 'error': str(e)})
+                print(f"Error checking {os.path.basename(path)}: {e}")
+    summary_df = pd.DataFrame(summaries + errors)
+    if not summary_df.empty:
+        summary_df = summary_df.sort_values('file').reset_index(drop=True)
+    summary_df.to_csv(os.path.join(output_dir, 'summary.csv'), index=False)
+    return summary_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run betterDATA quality checks over a directory of survey waves.')
+    parser.add_argument('config', help='Check configuration JSON saved from the betterDATA page')
+    parser.add_argument('input_dir', help='Directory with the wave files (.csv or .xlsx)')
+    parser.add_argument('--output-dir', default='better_data_output', help='Where per-file flags and summary.csv are written')
+    parser.add_argument('--pattern', default='*', help='Glob pattern for wave files inside input_dir')
+    parser.add_argument('--threshold', type=float, default=1.0, help='Score threshold counted as flagged in the summary')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--pooled-speeders', action='store_true', help='Recompute relative speeder thresholds from the medians of all waves together')
+    args = parser.parse_args()
+
+    with open(args.config, encoding='utf-8') as f:
+        config = json.load(f)
+    paths = sorted(
+        path for path in glob(os.path.join(args.input_dir, args.pattern))
+        if path.endswith(('.csv', '.xlsx'))
+    )
+    if not paths:
+        parser.error(f"No .csv or .xlsx files found in {args.input_dir}")
+
+    summary_df = run_batch(config, paths, args.output_dir, args.threshold, args.workers, args.pooled_speeders)
+    print(summary_df.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
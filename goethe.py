@@ -1,9 +1,5 @@
 import streamlit as st
-import os
-from openai import OpenAI
-
-# Fetch the API key from environment variables
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from utils.llm_client import chat_completion
 
 def generate_linkedin_post(insight, hashtags, use_emojis, temperature, considerations, style, language, occasion, post_length, link_url, bold_words):
     emoji_text = " Use appropriate emojis." if use_emojis else ""
@@ -25,7 +21,7 @@ def generate_linkedin_post(insight, hashtags, use_emojis, temperature, considera
     Please write in {language}.
     """
     
-    response = client.chat.completions.create(
+    response = chat_completion(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are an expert in creating LinkedIn posts."},
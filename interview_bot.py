@@ -1,11 +1,11 @@
 import os
 import streamlit as st
 import time
-from openai import OpenAI
+from utils.llm_client import call_with_retries, openai_client
 
 def interview_bot_page():
-    # Set up OpenAI client
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    # Shared OpenAI client
+    client = openai_client()
 
     # Get assistant_id from environment variables
     assistant_id = os.getenv("ASSISTANT_ID")
@@ -50,11 +50,12 @@ def interview_bot_page():
 
         # Create a thread if it doesn't exist
         if not st.session_state.thread_id:
-            thread = client.beta.threads.create()
+            thread = call_with_retries("openai", client.beta.threads.create)
             st.session_state.thread_id = thread.id
 
         # Add the user's message to the thread
-        client.beta.threads.messages.create(
+        call_with_retries(
+            "openai", client.beta.threads.messages.create,
             thread_id=st.session_state.thread_id,
             role="user",
             content=prompt
@@ -66,7 +67,8 @@ def interview_bot_page():
         with assistant_placeholder.chat_message("assistant"):
             with st.spinner("Thinking..."):
                 # Run the assistant
-                run = client.beta.threads.runs.create(
+                run = call_with_retries(
+                    "openai", client.beta.threads.runs.create,
                     thread_id=st.session_state.thread_id,
                     assistant_id=assistant_id
                 )
@@ -74,13 +76,15 @@ def interview_bot_page():
                 # Wait for the assistant to complete
                 while run.status != "completed":
                     time.sleep(1)
-                    run = client.beta.threads.runs.retrieve(
+                    run = call_with_retries(
+                        "openai", client.beta.threads.runs.retrieve,
                         thread_id=st.session_state.thread_id,
                         run_id=run.id
                     )
 
                 # Retrieve the assistant's messages
-                messages = client.beta.threads.messages.list(
+                messages = call_with_retries(
+                    "openai", client.beta.threads.messages.list,
                     thread_id=st.session_state.thread_id
                 )
 
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from utils import batch_classification
+from utils.batch_classification import COMPLETED, LocalBatchBackend, collect_batch, split_job, submit_batch
+from utils.classification_cache import ClassificationCache
+from utils.classification_jobs import ClassificationJobs
+
+TOPICS = [{'id': 1, 'topic': 'Price'}, {'id': 2, 'topic': 'Service'}]
+REVIEWS = ['too expensive', 'nobody answered', 'okay I guess', 'too expensive']
+
+
+def answer(body):
+    # Scripted model: one answer is coded, one request fails, one reply is unusable
+    prompt = body['messages'][-1]['content']
+    if 'too expensive' in prompt:
+        return json.dumps({'relevant_topics': [{'id': 1}]})
+    if 'nobody answered' in prompt:
+        raise RuntimeError('server error')
+    return 'not json'
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_classification, 'BATCH_DIR', str(tmp_path / 'batches'))
+    jobs = ClassificationJobs(str(tmp_path / 'jobs.sqlite'))
+    cache = ClassificationCache(str(tmp_path / 'cache.sqlite'))
+    yield jobs, cache
+    jobs.close()
+    cache.close()
+
+
+def test_submitted_batch_is_merged_into_the_job(stores, tmp_path):
+    jobs, cache = stores
+    jobs.start('wave', REVIEWS, [11, 12, 13, 14], TOPICS, 'Why?')
+    # Identical answers share one request
+    requests = [
+        (review, positions, ClassificationCache.key(review, TOPICS, 'Why?', 'model'))
+        for review, positions in [('too expensive', [0, 3]), ('nobody answered', [1]), ('okay I guess', [2])]
+    ]
+    backend = LocalBatchBackend(answer, directory=str(tmp_path / 'local'))
+
+    [batch_id] = submit_batch(jobs, 'wave', 'Local', requests, TOPICS, 'Why?', backend=backend)
+    assert jobs.batch_positions('wave') == {0, 1, 2, 3}
+
+    state, classified = collect_batch(jobs, cache, 'wave', batch_id, backend=backend)
+
+    assert (state, classified) == (COMPLETED, 2)
+    results = jobs.results('wave')
+    assert results['myID'].tolist() == [11, 14]
+    assert results[1].tolist() == [1, 1] and results[2].tolist() == [0, 0]
+    # Failed and unusable requests stay open for the next run
+    assert jobs.pending('wave') == [1, 2]
+    assert jobs.batches('wave') == []
+    assert list(cache.get_many([key for _, _, key in requests], TOPICS)) == [requests[0][2]]
+
+
+def test_large_jobs_are_split_into_several_batches(stores, tmp_path, monkeypatch):
+    jobs, cache = stores
+    monkeypatch.setattr(batch_classification, 'BATCH_MAX_REQUESTS', 2)
+    jobs.start('wave', REVIEWS, [11, 12, 13, 14], TOPICS, 'Why?')
+    requests = [
+        (review, [position], ClassificationCache.key(review, TOPICS, 'Why?', 'model'))
+        for position, review in enumerate(REVIEWS)
+    ]
+    backend = LocalBatchBackend(answer, directory=str(tmp_path / 'local'))
+
+    batch_ids = submit_batch(jobs, 'wave', 'Local', requests, TOPICS, 'Why?', backend=backend)
+
+    assert len(batch_ids) == 2
+    assert sorted(sorted(batch['requests']) for batch in jobs.batches('wave')) == [['0', '1'], ['2', '3']]
+    for batch_id in batch_ids:
+        collect_batch(jobs, cache, 'wave', batch_id, backend=backend)
+    assert jobs.results('wave')['myID'].tolist() == [11, 14]
+    assert jobs.pending('wave') == [1, 2]
+
+
+def test_job_files_stay_under_the_byte_limit():
+    lines = [(position, b'x' * size) for position, size in enumerate([40, 40, 30, 100, 10])]
+    chunks = list(split_job(lines, max_requests=10, max_bytes=100))
+    assert [[position for position, _ in chunk] for chunk in chunks] == [[0, 1], [2], [3], [4]]
+
+
+def test_batches_of_backends_no_longer_offered_are_dropped(stores):
+    jobs, cache = stores
+    jobs.start('wave', REVIEWS[:1], [11], TOPICS, 'Why?')
+    jobs.add_batch('wave', 'local-1', 'Local (files)', {'0': {'positions': [0], 'cache_key': 'k'}})
+
+    assert collect_batch(jobs, cache, 'wave', 'local-1') == (batch_classification.FAILED, 0)
+    assert jobs.batches('wave') == []
+    assert jobs.pending('wave') == [0]
@@ -0,0 +1,45 @@
+import json
+
+import pandas as pd
+import pytest
+
+from better_data_batch import check_wave
+from utils.quality_checks import CheckPlan
+
+CONFIG = {
+    'id_column': 'ID',
+    'checks': [{'name': 'Duplicate', 'kind': 'duplicates', 'columns': ['answer'], 'missing_values': '-99,np.nan'}],
+}
+
+
+def test_check_wave_keeps_ids(tmp_path):
+    path = tmp_path / 'wave1.csv'
+    pd.DataFrame({'ID': [11, 12, 13], 'answer': ['a', 'a', 'b']}).to_csv(path, index=False)
+
+    summary = check_wave(str(path), CONFIG, str(tmp_path), threshold=1.0)
+
+    output = pd.read_csv(summary['output'])
+    assert output['ID'].tolist() == [11, 12, 13]
+    assert summary['respondents'] == 3
+
+
+def test_check_wave_without_id_column_fails(tmp_path):
+    path = tmp_path / 'wave2.csv'
+    pd.DataFrame({'respondent': [11, 12], 'answer': ['a', 'b']}).to_csv(path, index=False)
+
+    with pytest.raises(ValueError, match="ID column 'ID' not found"):
+        check_wave(str(path), CONFIG, str(tmp_path), threshold=1.0)
+    assert not (tmp_path / 'wave2_flags.csv').exists()
+
+
+def test_saved_speeder_check_uses_the_medians_of_each_wave(tmp_path):
+    # The page's file had only mobile respondents; its cut-off is not saved
+    plan = CheckPlan().add('Speeder', 'relative_speeders', ['time', 'device'], ratio=0.5, thresholds=[['mobile', 50.0]])
+    config = dict(plan.to_dict(), id_column='ID')
+    assert config['checks'][0]['params'] == {'ratio': 0.5}
+
+    path = tmp_path / 'wave3.csv'
+    pd.DataFrame({'ID': [1, 2, 3, 4], 'time': [1000, 1000, 1000, 10], 'device': ['desktop'] * 4}).to_csv(path, index=False)
+    summary = check_wave(str(path), json.loads(json.dumps(config)), str(tmp_path), threshold=1.0)
+
+    assert summary['Speeder'] == 1
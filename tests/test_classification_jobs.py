@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from utils import classification_jobs
+from utils.classification_jobs import ClassificationJobs, JobMismatchError, jobs_path, new_owner_key
+
+TOPICS = [{'id': 1, 'topic': 'Price'}, {'id': 2, 'topic': 'Service'}]
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    jobs = ClassificationJobs(str(tmp_path / 'jobs.sqlite'))
+    yield jobs
+    jobs.close()
+
+
+def test_resume_returns_open_rows(jobs):
+    assert jobs.start('wave.xlsx', ['cheap', 'slow'], [1, 2], TOPICS, 'Why?') == [0, 1]
+    jobs.record('wave.xlsx', {0: {'relevant_topics': [{'id': 1}]}})
+    assert jobs.start('wave.xlsx', ['cheap', 'slow'], [1, 2], TOPICS, 'Why?') == [1]
+
+
+def test_new_wave_with_same_name_and_size_is_refused(jobs):
+    jobs.start('wave.xlsx', ['cheap', 'slow'], [1, 2], TOPICS, 'Why?')
+    with pytest.raises(JobMismatchError):
+        jobs.start('wave.xlsx', ['great', 'fine'], [1, 2], TOPICS, 'Why?')
+    with pytest.raises(JobMismatchError):
+        jobs.start('wave.xlsx', ['cheap', 'slow'], [3, 4], TOPICS, 'Why?')
+
+
+def test_job_without_stored_hash_is_checked_against_its_rows(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    jobs = ClassificationJobs(path)
+    jobs.start('wave.xlsx', ['cheap', 'slow'], [1, 2], TOPICS, 'Why?')
+    jobs.close()
+    with sqlite3.connect(path) as connection:
+        connection.execute('UPDATE jobs SET data_hash = NULL')
+    jobs = ClassificationJobs(path)
+    with pytest.raises(JobMismatchError):
+        jobs.start('wave.xlsx', ['great', 'fine'], [1, 2], TOPICS, 'Why?')
+    assert jobs.start('wave.xlsx', ['cheap', 'slow'], [1, 2], TOPICS, 'Why?') == [0, 1]
+    jobs.close()
+
+
+def test_owners_do_not_see_each_others_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(classification_jobs, 'JOBS_DIR', str(tmp_path))
+    alice, bob = ClassificationJobs(jobs_path(new_owner_key())), ClassificationJobs(jobs_path(new_owner_key()))
+    alice.start('wave.xlsx', ['cheap', 'slow'], [1, 2], TOPICS, 'Why?')
+    assert bob.names() == []
+    assert bob.start('wave.xlsx', ['great'], [3], TOPICS, 'Why?') == [0]
+    assert alice.progress('wave.xlsx') == (0, 2)
+    alice.close()
+    bob.close()
+
+
+@pytest.mark.parametrize('owner', [None, '', 'short', '../../etc/passwd-0123456789'])
+def test_invalid_owner_keys_are_refused(owner):
+    with pytest.raises(ValueError):
+        jobs_path(owner)
@@ -0,0 +1,63 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from utils import data_utils
+from utils.data_utils import _parse_batch_response, classify_reviews_batch
+
+TOPICS = [{'id': 1, 'topic': 'Price'}, {'id': 2, 'topic': 'Service'}]
+
+
+def reply(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def test_parse_batch_response_keeps_only_valid_items():
+    content = json.dumps({'results': [
+        {'item': 1, 'relevant_topics': [{'id': 1}, {'id': '2'}]},
+        {'item': 2, 'relevant_topics': [{'id': 9}]},
+        {'item': 3},
+        {'item': 7, 'relevant_topics': []},
+        {'item': 1, 'relevant_topics': [{'id': 2}]},
+        {'item': '4', 'relevant_topics': []},
+    ]})
+    assert _parse_batch_response(content, 4, TOPICS) == {
+        1: {'relevant_topics': [{'id': 1}, {'id': 2}]},
+        4: {'relevant_topics': []},
+    }
+    assert _parse_batch_response('not json', 4, TOPICS) == {}
+    assert _parse_batch_response('[1, 2]', 4, TOPICS) == {}
+
+
+class Limiter:
+    def __init__(self):
+        self.acquired = []
+
+    def acquire(self, tokens=1):
+        self.acquired.append(tokens)
+
+
+def test_invalid_items_are_asked_again_and_left_open(monkeypatch):
+    # Batch replies cover 'cheap' only; one by one, 'slow' gets a valid
+    # answer, 'meh' a topic outside the schema and 'odd' no topics at all
+    singles = {'slow': {'relevant_topics': [{'id': 2}]}, 'meh': {'relevant_topics': [{'id': 9}]}, 'odd': {'topics': []}}
+    prompts = []
+
+    def chat_completion(**request):
+        prompt = request['messages'][-1]['content']
+        prompts.append(prompt)
+        if 'item' in prompt:
+            return reply(json.dumps({'results': [{'item': 1, 'relevant_topics': [{'id': 1}]}] if '"cheap"' in prompt else []}))
+        review = next(review for review in singles if review in prompt)
+        return reply(json.dumps(singles[review]))
+    monkeypatch.setattr(data_utils, 'chat_completion', chat_completion)
+    limiter = Limiter()
+
+    results = classify_reviews_batch(['cheap', 'slow', 'meh', 'odd'], TOPICS, 'Why?', max_attempts=2, limiter=limiter)
+
+    assert results == [{'relevant_topics': [{'id': 1}]}, {'relevant_topics': [{'id': 2}]}, None, None]
+    # Two batch requests, then one per remaining review
+    assert len(prompts) == 5
+    # Everything after the first request goes through the limiter
+    assert len(limiter.acquired) == 4
@@ -0,0 +1,57 @@
+import hashlib
+import os
+
+from utils import dataset_cache, result_cache
+
+
+def _touch(path, size, mtime):
+    with open(path, 'wb') as output:
+        output.write(b'x' * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_evict_removes_only_own_files_oldest_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, 'CACHE_DIR', str(tmp_path))
+    key = 'a' * 64
+    _touch(tmp_path / f'{key}-0.parquet', 100, 1)
+    _touch(tmp_path / f'{key}-Sheet1.pkl', 100, 2)
+    _touch(tmp_path / f'{key}-1.parquet', 100, 3)
+    _touch(tmp_path / 'classifications.sqlite', 1000, 0)
+    (tmp_path / 'batches').mkdir()
+    _touch(tmp_path / 'batches' / 'input.jsonl', 1000, 0)
+
+    dataset_cache.evict(max_bytes=150)
+
+    assert set(os.listdir(tmp_path)) == {'batches', 'classifications.sqlite', f'{key}-1.parquet'}
+    assert os.listdir(tmp_path / 'batches') == ['input.jsonl']
+
+
+class Upload:
+    name = 'wave.csv'
+
+    def __init__(self, data):
+        self._data = data
+
+    def getvalue(self):
+        return self._data
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+
+def test_sheets_just_stored_are_not_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(dataset_cache, 'MAX_CACHE_BYTES', 1)
+    old = tmp_path / f"{'b' * 64}-0.parquet"
+    _touch(old, 100, 1)
+
+    df = dataset_cache.load_dataset(Upload(b'id,answer\n1,cheap\n2,slow\n'))
+
+    assert df['answer'].tolist() == ['cheap', 'slow']
+    assert not old.exists()
+
+
+def test_upload_key_hashes_the_buffer_in_slices(monkeypatch):
+    monkeypatch.setattr(result_cache, 'HASH_SLICE_BYTES', 7)
+    data = bytes(range(256)) * 3
+    assert dataset_cache.upload_key(Upload(data)) == hashlib.sha256(data).hexdigest()
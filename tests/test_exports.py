@@ -0,0 +1,21 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from utils import exports
+
+
+@pytest.mark.parametrize('constant_memory_cells', [0, exports.CONSTANT_MEMORY_CELLS])
+def test_long_frames_continue_on_further_sheets(monkeypatch, constant_memory_cells):
+    monkeypatch.setattr(exports, 'EXCEL_MAX_ROWS', 4)
+    monkeypatch.setattr(exports, 'CONSTANT_MEMORY_CELLS', constant_memory_cells)
+    ids = pd.DataFrame({'ID': [f'id{i}' for i in range(7)], 'Wave': ['w1'] * 7})
+    summary = pd.DataFrame({'Wave': ['w1'], 'IDs': [7]})
+
+    data = exports.to_xlsx({'Summary': summary, 'A sheet name of thirty-one ch.': ids})
+
+    sheets = pd.read_excel(BytesIO(data), sheet_name=None)
+    assert list(sheets) == ['Summary', 'A sheet name of thirty-one ch.', 'A sheet name of thirty-one (2)', 'A sheet name of thirty-one (3)']
+    pd.testing.assert_frame_equal(sheets['Summary'], summary)
+    pd.testing.assert_frame_equal(pd.concat(list(sheets.values())[1:], ignore_index=True), ids)
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from utils.id_reconciliation import canonical_ids, reconcile
+
+
+def test_canonical_ids_rewrite_only_the_text():
+    values = pd.Series(['00123', 123, 123.0, ' 42 ', '000', '1e3', '12.0', 'abc', '', None, np.nan], dtype=object)
+    assert canonical_ids(values).tolist() == ['123', '123', '123', '42', '0', '1e3', '12.0', 'abc']
+    assert canonical_ids(pd.Series([7.0, np.nan, 2.5])).tolist() == ['7', '2.5']
+
+
+def test_long_numeric_ids_stay_distinct():
+    report = reconcile({'w1': pd.Series(['123456789012345678'])}, {'clean': pd.Series([123456789012345679])})
+    assert report.bad['ID'].tolist() == ['123456789012345678']
+    assert report.unknown['ID'].tolist() == ['123456789012345679']
+    assert report.good.empty
+
+
+def test_ids_repeated_across_waves_count_in_each_wave():
+    report = reconcile(
+        {'w1': pd.Series([1, 2]), 'w2': pd.Series(['2', '3', '3'])},
+        {'clean': pd.Series(['2', '003', '9'])},
+    )
+    summary = report.summary.set_index('Wave')
+    assert summary.loc['w1', ['IDs', 'Good', 'Bad']].tolist() == [2, 1, 1]
+    assert summary.loc['w2', ['IDs', 'Good', 'Bad']].tolist() == [2, 2, 0]
+    assert summary.loc['Total', ['IDs', 'Good', 'Bad', 'Unknown']].tolist() == [4, 3, 1, 1]
+    assert report.good.values.tolist() == [['2', 'w1'], ['2', 'w2'], ['3', 'w2']]
+    assert report.duplicates.set_index('ID')['Files'].to_dict() == {'2': 'w1, w2', '3': 'w2'}
+
+
+def test_number_and_text_paths_agree():
+    values = pd.Series([
+        7, '0007', 7.0, np.uint64(2**63), str(2**63), -5, '-5', 1e17, '٣', '3',
+        '00000000000000000000012', '123456789012345678901',
+    ], dtype=object)
+    assert canonical_ids(values).tolist() == [
+        '7', '7', '7', str(2**63), str(2**63), '-5', '-5', '1e+17', '٣', '3', '12', '123456789012345678901',
+    ]
+    report = reconcile(
+        {'w1': pd.Series([7, 2**63, -5, 12], dtype=object)},
+        {'clean': pd.Series(['007', str(2**63), '-5', '000000000000000000000012'])},
+    )
+    assert report.bad.empty and report.unknown.empty
+    assert report.good['ID'].tolist() == ['7', str(2**63), '-5', '12']
+    assert canonical_ids(pd.Series([3, -3])).tolist() == ['3', '-3']
+    assert canonical_ids(pd.Series([2**64 - 1], dtype=np.uint64)).tolist() == [str(2**64 - 1)]
+    assert canonical_ids(pd.Series([1.0, 2.5, 1e17])).tolist() == ['1', '2.5', '1e+17']
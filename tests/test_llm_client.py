@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import llm_client, llm_telemetry
+
+
+class Clock:
+    # Stands in for the time module: sleeping only advances the clock
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def scripted(*outcomes):
+    # Raises or returns the outcomes in order, one per call
+    outcomes = list(outcomes)
+    calls = []
+
+    def func(**kwargs):
+        calls.append(kwargs)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    func.calls = calls
+    return func
+
+
+@pytest.fixture
+def clock(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_client, 'time', clock)
+    monkeypatch.setattr(llm_telemetry, 'LOG_PATH', str(tmp_path / 'llm_calls.jsonl'))
+    llm_client.reset_clients()
+    yield clock
+    llm_client.reset_clients()
+
+
+def test_retries_server_errors_then_succeeds(clock):
+    func = scripted(StatusError(500), StatusError(503), 'ok')
+    assert llm_client.call_with_retries('openai', func) == 'ok'
+    assert len(func.calls) == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_client_errors_are_not_retried(clock):
+    func = scripted(StatusError(400), 'ok')
+    with pytest.raises(StatusError):
+        llm_client.call_with_retries('openai', func)
+    assert len(func.calls) == 1
+
+
+def test_gives_up_after_max_retries(clock):
+    func = scripted(*[StatusError(502)] * (llm_client.MAX_RETRIES + 1))
+    with pytest.raises(StatusError):
+        llm_client.call_with_retries('openai', func)
+    assert len(func.calls) == llm_client.MAX_RETRIES + 1
+
+
+def test_retry_after_is_honoured(clock):
+    func = scripted(StatusError(429, {'retry-after': '7'}), 'ok')
+    assert llm_client.call_with_retries('openai', func) == 'ok'
+    assert 7 <= clock.sleeps[0] <= 7 + llm_client.BASE_DELAY
+
+
+def test_rate_limits_do_not_open_the_breaker(clock):
+    for _ in range(llm_client.BREAKER_FAILURES):
+        func = scripted(StatusError(429), StatusError(429, {'retry-after-ms': '100'}), 'ok')
+        assert llm_client.call_with_retries('openai', func) == 'ok'
+    assert llm_client._breakers['openai'].wait_time() == 0
+
+
+def test_open_breaker_is_waited_out(clock):
+    failures = [StatusError(500)] * llm_client.BREAKER_FAILURES
+    func = scripted(*failures, 'ok')
+    assert llm_client.call_with_retries('openai', func) == 'ok'
+    # The breaker opened on the last failure; the trial call ran after the cooldown
+    assert clock.now >= llm_client.BREAKER_COOLDOWN
+    assert llm_client._breakers['openai'].wait_time() == 0
+
+
+def test_breaker_gives_up_after_max_wait(clock):
+    breaker = llm_client._breakers['anthropic']
+    for _ in range(breaker.failures):
+        breaker.record(success=False)
+    breaker._trial_running = True
+    with pytest.raises(llm_client.CircuitOpenError):
+        llm_client.call_with_retries('anthropic', scripted('ok'))
+    assert clock.now >= llm_client.BREAKER_MAX_WAIT
+
+
+def test_sessions_only_see_their_own_calls(clock):
+    for session, page in [('a', 'autoCODE'), ('b', 'Whisper'), ('a', 'autoCODE')]:
+        with llm_telemetry.scope(session=session, page=page):
+            llm_client.call_with_retries('openai', scripted('ok'))
+    usage = llm_telemetry.rollup('a')
+    assert usage[['page', 'calls']].values.tolist() == [['autoCODE', 2]]
+    assert [record['page'] for record in llm_telemetry.records('b')] == ['Whisper']
+    assert llm_telemetry.export_jsonl('c') == b''
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.multi_hot import code_columns, multi_hot
+
+
+def _old_multi_hot(df, all_codes, code_count=5):
+    # manuCODE's original row loop, which read Code 1 to Code 5
+    def process_row(row):
+        binary = np.zeros(len(all_codes))
+        for i in range(1, code_count + 1):
+            code_col = f"Code {i}"
+            if code_col in row and pd.notna(row[code_col]):
+                code = int(row[code_col])
+                if code in all_codes:
+                    binary[all_codes.index(code)] = 1
+        return binary
+    return np.array(list(df.apply(process_row, axis=1))).astype(np.uint8)
+
+
+def _coded(rows, code_count, seed=0):
+    rng = np.random.default_rng(seed)
+    cells = [1, 2, 3, 7, 12, 2.0, 3.7, 99, -1, np.nan, np.nan]
+    return pd.DataFrame({
+        'id': np.arange(rows),
+        'answer': ['text'] * rows,
+        **{f"Code {i}": rng.choice(np.array(cells, dtype=object), rows) for i in range(1, code_count + 1)},
+    })
+
+
+@pytest.mark.parametrize('all_codes', [[1, 2, 3, 7, 12], [2, 3.0, 12], [-1, 0, 1]])
+def test_matches_the_row_loop(all_codes):
+    df = _coded(500, 5)
+    np.testing.assert_array_equal(multi_hot(df, all_codes), _old_multi_hot(df, all_codes))
+
+
+def test_reads_every_code_column():
+    df = _coded(300, 12)
+    df = df[['id', 'answer', 'Code 10', 'Code 2', 'Code 1'] + [f"Code {i}" for i in (3, 4, 5, 6, 7, 8, 9, 11, 12)]]
+    assert code_columns(df.columns)[:4] == ['Code 1', 'Code 2', 'Code 3', 'Code 4']
+    assert code_columns(df.columns)[-3:] == ['Code 10', 'Code 11', 'Code 12']
+    all_codes = [1, 2, 3, 7, 12]
+    np.testing.assert_array_equal(multi_hot(df, all_codes), _old_multi_hot(df, all_codes, code_count=12))
+    # Codes only given in Code 6 and later count as well
+    late = pd.DataFrame({'id': [1], 'Code 1': [1], 'Code 9': [7]})
+    assert multi_hot(late, all_codes).tolist() == [[1, 0, 0, 1, 0]]
+
+
+def test_non_numeric_cells_are_ignored():
+    df = pd.DataFrame({'id': [1, 2, 3], 'Code 1': ['3', 'n/a', ''], 'Code 2': [1, 'abc', 2.0]})
+    assert multi_hot(df, [1, 2, 3]).tolist() == [[1, 0, 1], [0, 0, 0], [0, 1, 0]]
+
+
+def test_text_schema_codes_never_match():
+    df = _coded(100, 5)
+    assert not multi_hot(df, ['a', 'b']).any()
+    np.testing.assert_array_equal(multi_hot(df, ['a', 'b']), _old_multi_hot(df, ['a', 'b']))
+    # Numeric codes next to text ones still match
+    matrix = multi_hot(pd.DataFrame({'Code 1': [2, 'a']}), ['a', 2])
+    assert matrix.tolist() == [[0, 1], [0, 0]]
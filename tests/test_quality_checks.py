@@ -0,0 +1,127 @@
+import io
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.chunked_checks import run_plan_chunked
+from utils.quality_checks import (
+    DEFAULT_MISSING_VALUES, CheckPlan, format_missing_values, identify_duplicates, identify_gibberish,
+    identify_inconsistencies, identify_straightliners, identify_straightliners_v2, parse_missing_values,
+)
+
+
+def test_missing_values_round_trip():
+    values = [-77, -99, 'n/a', 1.5, np.nan]
+    parsed = parse_missing_values(format_missing_values(values))
+    assert parsed[:4] == values[:4]
+    assert np.isnan(parsed[4])
+
+
+@pytest.mark.parametrize('text', ['__import__("os").getcwd()', 'np.zeros(3)', 'pd.NA'])
+def test_missing_values_are_never_evaluated(text):
+    config = {'checks': [{'name': 'Duplicate', 'kind': 'duplicates', 'columns': ['a'], 'missing_values': text}]}
+    with pytest.raises(ValueError):
+        CheckPlan.from_dict(config)
+
+
+def _survey(rows=3000, seed=0):
+    # A wave as betterDATA sees it after reading the CSV: sentinels, NaN in
+    # numeric and text columns, repeated keys
+    rng = np.random.default_rng(seed)
+    pick = lambda values: rng.choice(np.array(values, dtype=object), rows)
+    frame = pd.DataFrame({
+        'id': np.arange(rows),
+        'time': rng.gamma(4, 100, rows).round(),
+        'device': pick(['mobile', 'desktop']),
+        'age': pick([25, 40, 61, -77, np.nan]),
+        'birth_year': pick([1999, 1984, 1963, 1990, -99, np.nan]),
+        **{f"q{i}": pick([1, 2, 3, -99, np.nan]) for i in range(1, 5)},
+        'open': pick(['asdfghjkl', 'good price', 'qwertzuiop', 'Grüßeschön', '-77', np.nan]),
+        'email': pick(['a@x.de', 'b@x.de', 'c@x.de', np.nan]),
+        'phone': pick([100, 200, 300, -77, np.nan]),
+    })
+    return pd.read_csv(io.StringIO(frame.to_csv(index=False)))
+
+
+# The per-row implementations betterDATA had before the checks were vectorized
+def _old_inconsistencies(df, age_column, birth_year_column, missing_values, allowable_difference=1):
+    current_year = pd.Timestamp.now().year
+    inconsistencies = df.apply(
+        lambda row: abs(row[age_column] - (current_year - row[birth_year_column])) > allowable_difference
+                    if row[age_column] not in missing_values and row[birth_year_column] not in missing_values
+                    else 0,
+        axis=1
+    )
+    return inconsistencies.astype(int)
+
+
+def _old_straightliners(df, questions, missing_values):
+    def is_straightliner(row):
+        unique_values = row[~row.isin(missing_values)].nunique()
+        return unique_values == 1
+    return df[questions].apply(is_straightliner, axis=1).astype(int)
+
+
+def _old_gibberish(df, open_answer_column, missing_values, language='en'):
+    if language == 'de':
+        gibberish_pattern = re.compile(r'^[a-zA-ZäöüÄÖÜß]{8,}$')
+    else:
+        gibberish_pattern = re.compile(r'^[a-zA-Z]{8,}$')
+    gibberish = df[open_answer_column].apply(lambda x: bool(gibberish_pattern.match(str(x))) if x not in missing_values else 0)
+    return gibberish.astype(int)
+
+
+def _old_duplicates(df, columns, missing_values):
+    def is_duplicate(row):
+        for col in columns:
+            if row[col] in missing_values:
+                return 0
+        return 1
+    duplicates = df.duplicated(subset=columns, keep=False) & df.apply(is_duplicate, axis=1).astype(bool)
+    return duplicates.astype(int)
+
+
+@pytest.mark.parametrize('missing_text', [DEFAULT_MISSING_VALUES, '-77', ''])
+def test_vectorized_checks_flag_exactly_what_the_row_loops_flagged(missing_text):
+    df = _survey()
+    missing_values = parse_missing_values(missing_text)
+    questions = ['q1', 'q2', 'q3', 'q4']
+    pairs = [
+        (identify_inconsistencies(df, 'age', 'birth_year', missing_values), _old_inconsistencies(df, 'age', 'birth_year', missing_values)),
+        (identify_straightliners(df, questions, missing_values), _old_straightliners(df, questions, missing_values)),
+        (identify_straightliners_v2(df, questions, missing_values), _old_straightliners(df, questions, missing_values)),
+        (identify_gibberish(df, 'open', missing_values, 'de'), _old_gibberish(df, 'open', missing_values, 'de')),
+        (identify_gibberish(df, 'open', missing_values), _old_gibberish(df, 'open', missing_values)),
+    ] + [
+        (identify_duplicates(df, columns, missing_values), _old_duplicates(df, columns, missing_values))
+        for columns in (['email'], ['phone'], ['email', 'phone'], ['age', 'device'])
+    ]
+    for new, old in pairs:
+        pd.testing.assert_series_equal(new, old, check_names=False, check_dtype=False)
+
+
+def test_chunked_run_flags_the_same_rows_as_the_in_memory_run(tmp_path):
+    df = _survey()
+    path = tmp_path / 'wave.csv'
+    df.to_csv(path, index=False)
+    missing_values = parse_missing_values(DEFAULT_MISSING_VALUES)
+    plan = (
+        CheckPlan()
+        .add('Speeder', 'relative_speeders', ['time', 'device'], ratio=0.5)
+        .add('Inconsistency', 'inconsistencies', ['age', 'birth_year'], 2.0, missing_values)
+        .add('Straightliner', 'straightliners', ['q1', 'q2', 'q3', 'q4'], 1.5, missing_values)
+        .add('Gibberish', 'gibberish', ['open'], missing_values=missing_values, language='de')
+        .add('Duplicate', 'duplicates', ['email', 'phone'], missing_values=missing_values)
+    )
+
+    flags, score = plan.run(df)
+    result = run_plan_chunked(str(path), plan, str(tmp_path / 'flagged.csv'), chunksize=400)
+
+    flagged = pd.read_csv(tmp_path / 'flagged.csv')
+    expected = df.assign(**flags, Score=score)[score > 0]
+    assert flagged['id'].tolist() == expected['id'].tolist()
+    for name in list(flags.columns) + ['Score']:
+        assert flagged[name].tolist() == expected[name].tolist(), name
+    assert result.flag_counts == flags.sum().to_dict()
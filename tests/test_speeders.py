@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from utils.speeders import DEFAULT_RELATIVE_ACCURACY, QuantileSketch, merge_sketches, sketch_by_segment
+
+
+def test_median_of_two_values_is_interpolated():
+    assert QuantileSketch().add([100, 200]).median() == pytest.approx(150, rel=DEFAULT_RELATIVE_ACCURACY)
+    assert QuantileSketch().add([0, 0, 300, 400]).median() == pytest.approx(150, rel=DEFAULT_RELATIVE_ACCURACY)
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 4, 7, 10, 101])
+def test_quantiles_match_numpy_within_the_relative_accuracy(size):
+    times = np.random.default_rng(size).lognormal(6, 1, size)
+    sketch = QuantileSketch().add(times)
+    for q in [0, 0.1, 0.25, 0.5, 0.9, 1]:
+        assert sketch.quantile(q) == pytest.approx(np.quantile(times, q), rel=DEFAULT_RELATIVE_ACCURACY)
+
+
+def test_merged_segment_sketches_give_the_medians_of_all_chunks():
+    times = np.random.default_rng(0).lognormal(6, 1, 1000)
+    segments = np.where(np.arange(1000) % 3, 'mobile', 'desktop')
+    chunks = [sketch_by_segment(times[start:start + 250], segments[start:start + 250]) for start in range(0, 1000, 250)]
+    merged = merge_sketches(chunks)
+    for segment in ['mobile', 'desktop']:
+        expected = np.median(times[segments == segment])
+        assert merged[segment].median() == pytest.approx(expected, rel=DEFAULT_RELATIVE_ACCURACY)
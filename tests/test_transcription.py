@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from utils.transcription import (
+    AudioWindow, ScriptedTranscriber, TranscriptSegment, _repeated_words, mp3_frames, split_audio, stitch,
+    transcribe_audio,
+)
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, no padding: 417 bytes and 1152 samples per frame
+FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+FRAME_BYTES = 144 * 128000 // 44100
+FRAME_SECONDS = 1152 / 44100
+
+
+def frame(number):
+    return FRAME_HEADER + bytes([number % 256]) * (FRAME_BYTES - 4)
+
+
+def synthetic_mp3(frames, junk_after=None):
+    # ID3v2 tag with 20 bytes of payload, the frames, an ID3v1 tag at the end
+    data = b'ID3' + bytes([4, 0, 0, 0, 0, 0, 20]) + b'\x00' * 20
+    for number in range(frames):
+        data += frame(number)
+        if number == junk_after:
+            data += b'\x00\x11\x22'
+    return data + b'TAG' + b'\x00' * 125
+
+
+def test_mp3_frames_skip_tags_and_junk():
+    offsets, lengths, durations = mp3_frames(synthetic_mp3(50, junk_after=9))
+    assert len(offsets) == 50
+    assert offsets[0] == 30
+    assert offsets[10] == 30 + 10 * FRAME_BYTES + 3
+    assert (lengths == FRAME_BYTES).all()
+    assert np.allclose(durations, FRAME_SECONDS)
+
+
+def test_split_audio_cuts_overlapping_windows_at_frame_boundaries():
+    data = synthetic_mp3(1000)
+    duration = 1000 * FRAME_SECONDS
+    windows = split_audio(data, window=10.0, overlap=2.0)
+
+    assert len(windows) == 4
+    assert windows[0].start == 0.0
+    assert windows[-1].end == pytest.approx(duration)
+    for window in windows:
+        # Whole frames only, and their duration matches the window
+        offsets, lengths, durations = mp3_frames(window.audio)
+        assert lengths.sum() == len(window.audio)
+        assert durations.sum() == pytest.approx(window.end - window.start)
+    for previous, window in zip(windows, windows[1:]):
+        assert previous.end - window.start == pytest.approx(2.0, abs=FRAME_SECONDS)
+
+
+def test_transcribed_overlaps_are_kept_once():
+    script = [TranscriptSegment(start, start + 1.5, f"sentence {number}") for number, start in enumerate(np.arange(0.0, 24.0, 1.5))]
+    transcript = transcribe_audio(synthetic_mp3(1000), transcriber=ScriptedTranscriber(script), window=10.0, overlap=2.0, max_workers=2)
+
+    assert [segment.text for segment in transcript.segments] == [segment.text for segment in script]
+    assert [segment.start for segment in transcript.segments] == pytest.approx([segment.start for segment in script], abs=FRAME_SECONDS)
+
+
+def test_words_repeated_across_the_cut_are_dropped():
+    windows = [AudioWindow(0.0, 12.0, b''), AudioWindow(10.0, 20.0, b'')]
+    transcribed = [
+        [TranscriptSegment(0.0, 5.0, 'hello there'), TranscriptSegment(5.0, 10.5, 'how are you today')],
+        [TranscriptSegment(0.6, 3.0, 'You today we talk'), TranscriptSegment(3.0, 9.0, 'about prices')],
+    ]
+    transcript = stitch(windows, transcribed)
+    assert transcript.text == 'hello there how are you today we talk about prices'
+
+
+def test_repeated_words():
+    assert _repeated_words('how are you today', 'You Today we talk') == 2
+    assert _repeated_words('how are you', 'we talk') == 0
+    assert _repeated_words('a b c', 'a b c d', max_words=2) == 0
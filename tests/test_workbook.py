@@ -0,0 +1,52 @@
+import re
+import zipfile
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+from utils.workbook import read_sheet
+
+
+def _workbook(stale_dimension=False):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['id', 'answer', None, 'score'])
+    sheet.append([1, 'NA', 'x', '#N/A'])
+    sheet.append([])
+    sheet.append([2, '', None, 3.5])
+    sheet.append([3, 'hello', None, None])
+    # Formatted but empty cells to the right and below the data
+    sheet['F1'].number_format = '0.00'
+    sheet['G3'].font = Font(bold=True)
+    sheet['A8'].font = Font(bold=True)
+    output = BytesIO()
+    workbook.save(output)
+    if not stale_dimension:
+        return output.getvalue()
+    # Rewrite the <dimension> tag the way some export tools leave it
+    patched = BytesIO()
+    with zipfile.ZipFile(output) as source, zipfile.ZipFile(patched, 'w') as target:
+        for item in source.infolist():
+            content = source.read(item.filename)
+            if item.filename == 'xl/worksheets/sheet1.xml':
+                content = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="A1"', content)
+            target.writestr(item, content)
+    return patched.getvalue()
+
+
+def test_read_sheet_matches_read_excel():
+    data = _workbook()
+    pd.testing.assert_frame_equal(read_sheet(data), pd.read_excel(BytesIO(data)))
+
+
+def test_read_sheet_ignores_stale_dimension():
+    data = _workbook(stale_dimension=True)
+    pd.testing.assert_frame_equal(read_sheet(data), pd.read_excel(BytesIO(data)))
+
+
+def test_read_sheet_selects_columns():
+    data = _workbook()
+    expected = pd.read_excel(BytesIO(data), usecols=['id', 'answer'])
+    pd.testing.assert_frame_equal(read_sheet(data, columns=['id', 'answer']), expected)
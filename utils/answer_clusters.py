@@ -0,0 +1,80 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Representative coding for autoCODE: answers are vectorized, grouped into
+# clusters of near-paraphrases, and only one representative per cluster goes
+# to the model. Members close enough to their representative take over its
+# codes; members near the cluster edge are ambiguous and are classified
+# themselves.
+DEFAULT_TIGHTNESS = 0.8
+# Members this far below the tightness still join a cluster, but as
+# ambiguous members that are sent to the model
+AMBIGUITY_MARGIN = 0.1
+
+
+def tfidf_vectors(answers):
+    # Offline backend: character n-grams within words catch spelling
+    # variants and inflections; rows come out L2-normalized
+    vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), sublinear_tf=True, dtype=np.float32)
+    return vectorizer.fit_transform([str(answer) for answer in answers])
+
+
+def openai_vectors(answers):
+    from utils.data_utils import embed_texts
+    return embed_texts([str(answer) for answer in answers])
+
+
+EMBEDDING_BACKENDS = {
+    'TF-IDF (local)': tfidf_vectors,
+    'OpenAI embeddings': openai_vectors,
+}
+
+
+def _dense(matrix):
+    return matrix.toarray() if hasattr(matrix, 'toarray') else np.asarray(matrix)
+
+
+def leader_clusters(vectors, threshold, block_size=500):
+    # Greedy leader clustering on cosine similarity: an answer joins the most
+    # similar existing leader if that is at least threshold, otherwise it
+    # leads a new cluster. Answers are compared a block at a time, against
+    # the leaders so far and then against each other.
+    n = vectors.shape[0]
+    leader_of = np.arange(n)
+    similarity = np.ones(n, dtype=np.float32)
+    leaders = np.empty(0, dtype=np.int64)
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(n, start + block_size))
+        if len(leaders):
+            sims = _dense(vectors[rows] @ vectors[leaders].T)
+            best = sims.argmax(axis=1)
+            best_sims = sims[np.arange(len(rows)), best]
+            joined = best_sims >= threshold
+            leader_of[rows[joined]] = leaders[best[joined]]
+            similarity[rows[joined]] = best_sims[joined]
+            rows = rows[~joined]
+        if not len(rows):
+            continue
+        sims = _dense(vectors[rows] @ vectors[rows].T)
+        unassigned = np.ones(len(rows), dtype=bool)
+        new_leaders = []
+        for i in range(len(rows)):
+            if not unassigned[i]:
+                continue
+            members = unassigned & (sims[i] >= threshold)
+            members[i] = False
+            leader_of[rows[members]] = rows[i]
+            similarity[rows[members]] = sims[i, members]
+            unassigned[members] = False
+            unassigned[i] = False
+            new_leaders.append(rows[i])
+        leaders = np.concatenate([leaders, np.array(new_leaders, dtype=np.int64)])
+    return leader_of, similarity
+
+
+def representative_plan(vectors, tightness=DEFAULT_TIGHTNESS):
+    # (leader_of, follows): follows marks answers that take over the codes of
+    # their leader instead of being classified
+    leader_of, similarity = leader_clusters(vectors, max(tightness - AMBIGUITY_MARGIN, 0.0))
+    follows = (leader_of != np.arange(len(leader_of))) & (similarity >= tightness)
+    return leader_of, follows
@@ -0,0 +1,206 @@
+import json
+import os
+import uuid
+
+from utils.data_dir import DATA_DIR
+from utils.data_utils import classification_request, parse_classification
+from utils.llm_client import call_with_retries, openai_client
+
+# autoCODE batch mode for overnight runs: every classify_review request is
+# written to a JSONL job file in the OpenAI batch format, handed to a batch
+# backend, and the results are merged into the job once the backend reports
+# the batch finished. Nothing waits in the Streamlit session in between.
+BATCH_DIR = os.getenv('MIIOS_BATCH_DIR', os.path.join(DATA_DIR, 'batches'))
+BATCH_ENDPOINT = '/v1/chat/completions'
+# Limits of one batch input file at the provider; larger jobs are split
+# into several batches
+BATCH_MAX_REQUESTS = 50_000
+BATCH_MAX_BYTES = 200 * 1024 * 1024
+
+RUNNING, COMPLETED, FAILED = 'running', 'completed', 'failed'
+
+
+def job_lines(reviews, topics, question_text):
+    # One encoded JSONL line per review; the custom_id is the review's position
+    for position, review in enumerate(reviews):
+        request = {
+            'custom_id': str(position),
+            'method': 'POST',
+            'url': BATCH_ENDPOINT,
+            'body': classification_request(str(review), topics, question_text),
+        }
+        yield position, (json.dumps(request, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def split_job(lines, max_requests=BATCH_MAX_REQUESTS, max_bytes=BATCH_MAX_BYTES):
+    # Groups (position, line) pairs into job files within both limits
+    chunk, size = [], 0
+    for position, line in lines:
+        if chunk and (len(chunk) >= max_requests or size + len(line) > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append((position, line))
+        size += len(line)
+    if chunk:
+        yield chunk
+
+
+def _output_lines(text):
+    # custom_id -> message content of the successful requests in an output file
+    contents = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        response = entry.get('response') or {}
+        if entry.get('error') or response.get('status_code') != 200:
+            continue
+        try:
+            contents[entry['custom_id']] = response['body']['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            continue
+    return contents
+
+
+class OpenAIBatchBackend:
+    # The provider's batch API: half the price of interactive calls, results
+    # within the completion window
+    _STATES = {
+        'validating': RUNNING, 'in_progress': RUNNING, 'finalizing': RUNNING, 'cancelling': RUNNING,
+        'completed': COMPLETED, 'failed': FAILED, 'expired': FAILED, 'cancelled': FAILED,
+    }
+
+    def submit(self, path):
+        client = openai_client()
+        with open(path, 'rb') as job_file:
+            uploaded = call_with_retries('openai', client.files.create, file=(os.path.basename(path), job_file.read()), purpose='batch')
+        batch = call_with_retries(
+            'openai', client.batches.create, input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window='24h'
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        batch = call_with_retries('openai', openai_client().batches.retrieve, batch_id)
+        return self._STATES.get(batch.status, RUNNING)
+
+    def results(self, batch_id):
+        # Expired and cancelled batches still return the requests they finished
+        client = openai_client()
+        batch = call_with_retries('openai', client.batches.retrieve, batch_id)
+        if not batch.output_file_id:
+            return {}
+        return _output_lines(call_with_retries('openai', client.files.content, batch.output_file_id).text)
+
+
+class LocalBatchBackend:
+    # File-based stand-in for tests, not offered in autoCODE: a batch is a
+    # directory holding the job file, and it is run serially the first time
+    # its status is asked for, with handler (a function from request body to
+    # message content)
+    def __init__(self, handler, directory=None):
+        self.directory = directory or os.path.join(BATCH_DIR, 'local')
+        self.handler = handler
+
+    def _path(self, batch_id, name):
+        return os.path.join(self.directory, batch_id, name)
+
+    def submit(self, path):
+        batch_id = f"local-{uuid.uuid4().hex}"
+        os.makedirs(os.path.dirname(self._path(batch_id, 'input.jsonl')))
+        os.replace(path, self._path(batch_id, 'input.jsonl'))
+        return batch_id
+
+    def status(self, batch_id):
+        if not os.path.exists(self._path(batch_id, 'input.jsonl')):
+            return FAILED
+        if not os.path.exists(self._path(batch_id, 'output.jsonl')):
+            self._run(batch_id)
+        return COMPLETED
+
+    def _run(self, batch_id):
+        lines = []
+        with open(self._path(batch_id, 'input.jsonl'), encoding='utf-8') as job_file:
+            for line in job_file:
+                request = json.loads(line)
+                try:
+                    content = self.handler(request['body'])
+                    entry = {'response': {'status_code': 200, 'body': {'choices': [{'message': {'content': content}}]}}, 'error': None}
+                except Exception as e:
+                    entry = {'response': None, 'error': {'message': str(e)}}
+                lines.append(json.dumps({'custom_id': request['custom_id'], **entry}, ensure_ascii=False))
+        # Written in one go, so a half-run batch is simply run again
+        temporary = self._path(batch_id, 'output.jsonl.tmp')
+        with open(temporary, 'w', encoding='utf-8') as output:
+            output.write('\n'.join(lines) + '\n')
+        os.replace(temporary, self._path(batch_id, 'output.jsonl'))
+
+    def results(self, batch_id):
+        path = self._path(batch_id, 'output.jsonl')
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding='utf-8') as output:
+            return _output_lines(output.read())
+
+
+# Backends offered in autoCODE, by the name stored with each batch
+BATCH_BACKENDS = {
+    'OpenAI Batch API': OpenAIBatchBackend,
+}
+
+
+def submit_batch(jobs, name, backend_name, requests, topics, question_text, backend=None):
+    # requests: list of (review, job positions, cache key), one per request.
+    # The requests go out in as many batches as the provider's file limits
+    # need; each is recorded with the job as soon as it is submitted, with
+    # the positions and cache keys of its requests, so the results can be
+    # merged back from any later session. backend defaults to a new instance
+    # of BATCH_BACKENDS[backend_name]. Returns the batch ids.
+    backend = backend or BATCH_BACKENDS[backend_name]()
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    batch_ids = []
+    lines = job_lines([review for review, _, _ in requests], topics, question_text)
+    for chunk in split_job(lines, BATCH_MAX_REQUESTS, BATCH_MAX_BYTES):
+        path = os.path.join(BATCH_DIR, f"{uuid.uuid4().hex}.jsonl")
+        with open(path, 'wb') as job_file:
+            job_file.writelines(line for _, line in chunk)
+        try:
+            batch_id = backend.submit(path)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        jobs.add_batch(name, batch_id, backend_name, {
+            str(position): {'positions': requests[position][1], 'cache_key': requests[position][2]}
+            for position, _ in chunk
+        })
+        batch_ids.append(batch_id)
+    return batch_ids
+
+
+def collect_batch(jobs, cache, name, batch_id, backend=None):
+    # Polls one batch of the job. Once it is finished its classifications are
+    # recorded to the job and the cache, and the batch is dropped; requests
+    # that failed leave their answers open for the next run. Returns the
+    # batch state and the number of job rows classified.
+    batch = jobs.batch(name, batch_id)
+    if backend is None:
+        if batch['backend'] not in BATCH_BACKENDS:
+            # A backend no longer offered; the answers are sent again
+            jobs.remove_batch(name, batch_id)
+            return FAILED, 0
+        backend = BATCH_BACKENDS[batch['backend']]()
+    state = backend.status(batch_id)
+    if state == RUNNING:
+        return state, 0
+    topics = jobs.topics(name)
+    rows, entries = {}, {}
+    for custom_id, content in backend.results(batch_id).items():
+        request = batch['requests'].get(custom_id)
+        classification = parse_classification(content, topics)
+        if request is None or classification is None:
+            continue
+        rows.update({position: classification for position in request['positions']})
+        entries[request['cache_key']] = classification
+    jobs.record(name, rows)
+    cache.put_many(entries)
+    jobs.remove_batch(name, batch_id)
+    return state, len(rows)
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+# Local cascade for autoCODE: a TF-IDF + logistic regression model per code,
+# trained on the answers the LLM has already labelled. Answers the local model
+# is confident about for every code are labelled locally, the rest still go to
+# the LLM. Part of the LLM-labelled answers is held out to measure how often
+# the local model agrees with the LLM, code by code.
+DEFAULT_TRAINING_SIZE = 300
+DEFAULT_CONFIDENCE = 0.9
+HOLDOUT_FRACTION = 0.2
+
+
+class CascadeClassifier:
+    def __init__(self, topic_ids, confidence=DEFAULT_CONFIDENCE, holdout_fraction=HOLDOUT_FRACTION, seed=0):
+        self.topic_ids = list(topic_ids)
+        self.confidence = confidence
+        self.holdout_fraction = holdout_fraction
+        self.seed = seed
+        self.vectorizer = None
+        self.models = {}
+        self.agreement = pd.DataFrame()
+        self.holdout_coverage = np.nan
+
+    def _labels(self, classifications):
+        index = {topic_id: column for column, topic_id in enumerate(self.topic_ids)}
+        labels = np.zeros((len(classifications), len(self.topic_ids)), dtype=np.uint8)
+        for row, classification in enumerate(classifications):
+            for topic in classification['relevant_topics']:
+                if topic['id'] in index:
+                    labels[row, index[topic['id']]] = 1
+        return labels
+
+    def fit(self, answers, classifications):
+        answers = [str(answer) for answer in answers]
+        labels = self._labels(classifications)
+        order = np.random.default_rng(self.seed).permutation(len(answers))
+        holdout = order[:int(len(answers) * self.holdout_fraction)]
+        training = order[len(holdout):]
+
+        self.vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), sublinear_tf=True, dtype=np.float32)
+        features = self.vectorizer.fit_transform([answers[i] for i in training])
+        self.models = {}
+        for column, topic_id in enumerate(self.topic_ids):
+            y = labels[training, column]
+            if y.min() == y.max():
+                # A code that is always (or never) given in the training rows:
+                # Laplace-smoothed constant probability
+                self.models[topic_id] = (y.sum() + 1) / (len(y) + 2)
+            else:
+                self.models[topic_id] = LogisticRegression(C=10.0, class_weight='balanced', max_iter=1000).fit(features, y)
+
+        if len(holdout):
+            probabilities = self._probabilities([answers[i] for i in holdout])
+            self.agreement = self._agreement(probabilities, labels[holdout])
+            self.holdout_coverage = self._confident(probabilities).mean()
+        return self
+
+    def _probabilities(self, answers):
+        features = self.vectorizer.transform([str(answer) for answer in answers])
+        probabilities = np.empty((len(answers), len(self.topic_ids)))
+        for column, topic_id in enumerate(self.topic_ids):
+            model = self.models[topic_id]
+            if isinstance(model, LogisticRegression):
+                probabilities[:, column] = model.predict_proba(features)[:, 1]
+            else:
+                probabilities[:, column] = model
+        return probabilities
+
+    def _confident(self, probabilities):
+        return ((probabilities >= self.confidence) | (probabilities <= 1 - self.confidence)).all(axis=1)
+
+    def _agreement(self, probabilities, labels):
+        # Per code, over the held-out answers the cascade would have labelled
+        # locally: how often the local label matches the LLM's
+        confident = self._confident(probabilities)
+        predicted = (probabilities >= 0.5)[confident]
+        actual = labels[confident].astype(bool)
+        rows = []
+        for column, topic_id in enumerate(self.topic_ids):
+            p, a = predicted[:, column], actual[:, column]
+            rows.append({
+                'Code': topic_id,
+                'LLM positives': int(labels[:, column].sum()),
+                'Agreement': (p == a).mean() if len(p) else np.nan,
+                'Precision': (p & a).sum() / p.sum() if p.sum() else np.nan,
+                'Recall': (p & a).sum() / a.sum() if a.sum() else np.nan,
+            })
+        rows.append({
+            'Code': 'All codes',
+            'LLM positives': int(labels.any(axis=1).sum()),
+            'Agreement': (predicted == actual).all(axis=1).mean() if len(predicted) else np.nan,
+            'Precision': np.nan,
+            'Recall': np.nan,
+        })
+        return pd.DataFrame(rows)
+
+    def predict(self, answers):
+        # (classifications, confident): only confident rows should be kept
+        probabilities = self._probabilities(answers)
+        confident = self._confident(probabilities)
+        classifications = [
+            {'relevant_topics': [{'id': topic_id} for topic_id, p in zip(self.topic_ids, row) if p >= 0.5]}
+            for row in probabilities
+        ]
+        return classifications, confident
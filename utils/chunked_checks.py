@@ -0,0 +1,138 @@
+import os
+from collections import Counter
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+import pandas as pd
+
+from utils.quality_checks import FLAG_COLUMNS, WHOLE_FILE_CHECKS, CheckPlan, MissingMasks, duplicate_key_missing
+from utils.speeders import sketch_by_segment, speeder_thresholds
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def read_csv_chunks(source, chunksize=DEFAULT_CHUNKSIZE, usecols=None):
+    # source is a path or a seekable file-like object such as a Streamlit upload
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return pd.read_csv(source, chunksize=chunksize, usecols=usecols)
+
+
+def read_csv_columns(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return pd.read_csv(source, nrows=0).columns.tolist()
+
+
+def sketch_csv_times(source, time_column, segment_column=None, chunksize=DEFAULT_CHUNKSIZE):
+    # Per-segment quantile sketches of the interview times, one chunk at a time
+    sketches = {}
+    columns = [time_column] + ([segment_column] if segment_column else [])
+    for chunk in read_csv_chunks(source, chunksize, usecols=columns):
+        sketch_by_segment(chunk[time_column], chunk[segment_column] if segment_column else None, sketches)
+    return sketches
+
+
+def _fix_speeder_thresholds(source, plan, chunksize):
+    # Relative speeder cut-offs must come from the whole file, not per chunk
+    checks = []
+    for check in plan.checks:
+        if check.kind == 'relative_speeders' and check.params.get('thresholds') is None:
+            segment_column = check.columns[1] if len(check.columns) > 1 else None
+            sketches = sketch_csv_times(source, check.columns[0], segment_column, chunksize)
+            thresholds = speeder_thresholds(sketches, check.params.get('ratio', 0.5))
+            check = replace(check, params=dict(check.params, thresholds=sorted(thresholds.items())))
+        checks.append(check)
+    return CheckPlan(checks)
+
+
+def _canonical_text(values):
+    # Dtypes are inferred per chunk, so the same key can arrive as 7, 7.0 or "7".
+    # Hash a text form that is identical for all three.
+    numeric = pd.to_numeric(values, errors='coerce')
+    integral = numeric.notna() & (numeric % 1 == 0)
+    text = values.astype(str)
+    text[integral] = numeric[integral].astype('int64').astype(str)
+    return text
+
+
+def key_hashes(chunk, columns):
+    keys = pd.DataFrame({column: _canonical_text(chunk[column]) for column in columns})
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def find_duplicate_keys(source, columns, missing_values, chunksize=DEFAULT_CHUNKSIZE):
+    # First pass over the key columns only: a running set of key hashes tells
+    # which keys occur more than once anywhere in the file
+    seen = set()
+    duplicated = set()
+    for chunk in read_csv_chunks(source, chunksize, usecols=columns):
+        missing = duplicate_key_missing(chunk, columns, MissingMasks(chunk).block(columns, missing_values))
+        hashes = key_hashes(chunk, columns)[~missing]
+        unique, counts = np.unique(hashes, return_counts=True)
+        duplicated.update(unique[counts > 1].tolist())
+        keys = unique.tolist()
+        duplicated.update(seen.intersection(keys))
+        seen.update(keys)
+    return np.fromiter(duplicated, dtype=np.uint64, count=len(duplicated))
+
+
+@dataclass
+class ChunkedResult:
+    total_rows: int = 0
+    flagged_path: str = None
+    flag_counts: Counter = field(default_factory=Counter)
+    score_counts: Counter = field(default_factory=Counter)
+
+    @property
+    def respondents_with_mistakes(self):
+        return sum(count for score, count in self.score_counts.items() if score > 0)
+
+
+def run_plan_chunked(source, plan, flagged_path, chunksize=DEFAULT_CHUNKSIZE):
+    # Row-local checks run per chunk; duplicates are resolved against the key
+    # hashes collected in a first pass. Only rows with a positive score are
+    # written to flagged_path, so memory stays bounded by the chunk size.
+    if any(check.kind == 'near_duplicates' for check in plan.checks):
+        raise ValueError("The near-duplicate check needs the whole file and is not available in chunked mode")
+    plan = _fix_speeder_thresholds(source, plan, chunksize)
+    row_checks = CheckPlan([check for check in plan.checks if check.kind not in WHOLE_FILE_CHECKS])
+    duplicate_checks = [check for check in plan.checks if check.kind == 'duplicates']
+    duplicate_keys = {
+        check.name: find_duplicate_keys(source, check.columns, check.missing_values, chunksize)
+        for check in duplicate_checks
+    }
+
+    result = ChunkedResult(flagged_path=flagged_path)
+    header = True
+    with open(flagged_path, 'w', newline='', encoding='utf-8') as output:
+        for chunk in read_csv_chunks(source, chunksize):
+            flags = row_checks.evaluate(chunk)
+            for check in duplicate_checks:
+                missing = duplicate_key_missing(chunk, check.columns, MissingMasks(chunk).block(check.columns, check.missing_values))
+                is_duplicate = np.isin(key_hashes(chunk, check.columns), duplicate_keys[check.name]) & ~missing
+                flags[check.name] = is_duplicate.astype(int)
+            score = plan.score(flags)
+
+            result.total_rows += len(chunk)
+            result.flag_counts.update(flags.sum().to_dict())
+            result.score_counts.update(score.value_counts().to_dict())
+
+            for name in FLAG_COLUMNS:
+                chunk[name] = flags[name] if name in flags else 0
+            chunk['Score'] = score
+            chunk[score > 0].to_csv(output, index=False, header=header)
+            header = False
+    return result
+
+
+def write_bad_ids(flagged_path, threshold, output_path, chunksize=DEFAULT_CHUNKSIZE):
+    # Stream the flagged rows back and keep the ones at or above the threshold
+    header = True
+    with open(output_path, 'w', newline='', encoding='utf-8') as output:
+        if os.path.getsize(flagged_path) == 0:
+            return output_path
+        for chunk in pd.read_csv(flagged_path, chunksize=chunksize):
+            chunk[chunk['Score'] >= threshold].to_csv(output, index=False, header=header)
+            header = False
+    return output_path
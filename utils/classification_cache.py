@@ -0,0 +1,80 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+from utils.data_dir import DATA_DIR
+from utils.result_cache import content_hash
+
+# autoCODE classifications on disk, keyed by the normalized answer, the coding
+# schema, the question and the model. Repeated answers ("nichts", "k.A.") and
+# re-runs with an unchanged schema are answered from here instead of the API.
+CACHE_PATH = os.getenv('MIIOS_CLASSIFICATION_CACHE', os.path.join(DATA_DIR, 'classifications.sqlite'))
+
+_PUNCTUATION = re.compile(r'^[\W_]+|[\W_]+$')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_answer(answer):
+    text = unicodedata.normalize('NFKC', str(answer)).casefold()
+    text = _WHITESPACE.sub(' ', text).strip()
+    # "Nichts." and "nichts!" are the same answer; "k.A." keeps its inner dot
+    return _PUNCTUATION.sub('', text) or text
+
+
+def group_answers(answers):
+    # Normalized answer -> positions, in order of first appearance
+    groups = {}
+    for position, answer in enumerate(answers):
+        groups.setdefault(normalize_answer(answer), []).append(position)
+    return groups
+
+
+def schema_hash(topics):
+    return content_hash(json.dumps(topics, sort_keys=True, default=str).encode('utf-8'))
+
+
+class ClassificationCache:
+    def __init__(self, path=CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS classifications (key TEXT PRIMARY KEY, topic_ids TEXT NOT NULL)'
+            )
+
+    @staticmethod
+    def key(normalized_answer, topics, question_text, model):
+        parts = [normalized_answer, schema_hash(topics), question_text, model]
+        return content_hash(json.dumps(parts).encode('utf-8'))
+
+    def get_many(self, keys, topics):
+        # Stored topic ids are mapped back onto the schema's own id values
+        topic_ids = {str(topic['id']): topic['id'] for topic in topics}
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, topic_ids FROM classifications WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, stored in rows:
+                    ids = json.loads(stored)
+                    if all(topic_id in topic_ids for topic_id in ids):
+                        found[key] = {'relevant_topics': [{'id': topic_ids[topic_id]} for topic_id in ids]}
+        return found
+
+    def put_many(self, classifications):
+        rows = [
+            (key, json.dumps([str(topic['id']) for topic in classification['relevant_topics']]))
+            for key, classification in classifications.items()
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO classifications VALUES (?, ?)', rows)
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from utils.data_dir import DATA_DIR
+from utils.result_cache import content_hash
+
+# Named autoCODE jobs with one row per answer. Classifications are written as
+# each batch completes, so a rerun, a closed tab or a crash loses at most the
+# batches in flight: starting the job again sends only the rows still open,
+# and the finished rows can be downloaded at any point. Each owner key has a
+# store of its own, so jobs and their answers are never listed to others.
+JOBS_DIR = os.getenv('MIIOS_CLASSIFICATION_JOBS', os.path.join(DATA_DIR, 'classification_jobs'))
+_OWNER_KEY = re.compile(r'[A-Za-z0-9_-]{16,64}')
+
+
+def new_owner_key():
+    return secrets.token_urlsafe(16)
+
+
+def is_owner_key(owner):
+    return isinstance(owner, str) and _OWNER_KEY.fullmatch(owner) is not None
+
+
+def jobs_path(owner):
+    if not is_owner_key(owner):
+        raise ValueError("Invalid job owner key.")
+    return os.path.join(JOBS_DIR, f'{owner}.sqlite')
+
+
+class JobMismatchError(ValueError):
+    pass
+
+
+class ClassificationJobs:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'name TEXT PRIMARY KEY, question TEXT NOT NULL, topics TEXT NOT NULL, '
+                'total INTEGER NOT NULL, created REAL NOT NULL)'
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS job_rows ('
+                'job TEXT NOT NULL, position INTEGER NOT NULL, review TEXT, my_id TEXT, topic_ids TEXT, '
+                'PRIMARY KEY (job, position))'
+            )
+            # Batches submitted for the job and not yet merged back, with the
+            # job rows and cache key behind each request
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS job_batches ('
+                'job TEXT NOT NULL, batch_id TEXT NOT NULL, backend TEXT NOT NULL, requests TEXT NOT NULL, '
+                'submitted REAL NOT NULL, PRIMARY KEY (job, batch_id))'
+            )
+            # Jobs created before the data hash was stored get it on resume
+            columns = [row[1] for row in self._connection.execute('PRAGMA table_info(jobs)')]
+            if 'data_hash' not in columns:
+                self._connection.execute('ALTER TABLE jobs ADD COLUMN data_hash TEXT')
+
+    def _job(self, name):
+        return self._connection.execute(
+            'SELECT question, topics, total, data_hash FROM jobs WHERE name = ?', (name,)
+        ).fetchone()
+
+    @staticmethod
+    def _rows(reviews, ids):
+        return [(json.dumps(review, default=str), json.dumps(my_id, default=str)) for review, my_id in zip(reviews, ids)]
+
+    @staticmethod
+    def _data_hash(rows):
+        # Answers and IDs in order, so a new wave with the same file name and
+        # row count is not mistaken for the job's data
+        return content_hash(json.dumps([list(row) for row in rows]).encode('utf-8'))
+
+    def _stored_data_hash(self, name):
+        rows = self._connection.execute(
+            'SELECT review, my_id FROM job_rows WHERE job = ? ORDER BY position', (name,)
+        ).fetchall()
+        return self._data_hash(rows)
+
+    def start(self, name, reviews, ids, topics, question_text):
+        # Creates the job, or resumes it if it exists with the same schema,
+        # question and answers. Returns the positions still to classify.
+        topics_json = json.dumps(topics, default=str)
+        rows = self._rows(reviews, ids)
+        data_hash = self._data_hash(rows)
+        with self._lock, self._connection:
+            job = self._job(name)
+            if job is None:
+                self._connection.execute(
+                    'INSERT INTO jobs (name, question, topics, total, created, data_hash) VALUES (?, ?, ?, ?, ?, ?)',
+                    (name, question_text, topics_json, len(rows), time.time(), data_hash),
+                )
+                self._connection.executemany(
+                    'INSERT INTO job_rows VALUES (?, ?, ?, ?, NULL)',
+                    [(name, position, review, my_id) for position, (review, my_id) in enumerate(rows)],
+                )
+                return self._pending(name)
+            stored_hash = job[3]
+            if stored_hash is None:
+                stored_hash = self._stored_data_hash(name)
+                self._connection.execute('UPDATE jobs SET data_hash = ? WHERE name = ?', (stored_hash, name))
+            if job[:3] != (question_text, topics_json, len(rows)) or stored_hash != data_hash:
+                raise JobMismatchError(
+                    f"Job '{name}' was started with a different question, coding schema or data. Choose another job name."
+                )
+            return self._pending(name)
+
+    def _pending(self, name):
+        rows = self._connection.execute(
+            'SELECT position FROM job_rows WHERE job = ? AND topic_ids IS NULL ORDER BY position', (name,)
+        ).fetchall()
+        return [position for position, in rows]
+
+    def pending(self, name):
+        with self._lock:
+            return self._pending(name)
+
+    def record(self, name, classifications):
+        # position -> classification; one transaction per completed batch
+        rows = [
+            (json.dumps([topic['id'] for topic in classification['relevant_topics']], default=str), name, position)
+            for position, classification in classifications.items()
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany('UPDATE job_rows SET topic_ids = ? WHERE job = ? AND position = ?', rows)
+
+    def progress(self, name):
+        with self._lock:
+            done, total = self._connection.execute(
+                'SELECT COUNT(topic_ids), COUNT(*) FROM job_rows WHERE job = ?', (name,)
+            ).fetchone()
+        return done, total
+
+    def names(self):
+        with self._lock:
+            rows = self._connection.execute('SELECT name FROM jobs ORDER BY created DESC').fetchall()
+        return [name for name, in rows]
+
+    def topics(self, name):
+        with self._lock:
+            job = self._job(name)
+        return json.loads(job[1]) if job else []
+
+    def results(self, name):
+        # Binary layout of the classified rows so far, in input order: one
+        # column per topic id, then Review and myID
+        topics = self.topics(name)
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT review, my_id, topic_ids FROM job_rows '
+                'WHERE job = ? AND topic_ids IS NOT NULL ORDER BY position', (name,)
+            ).fetchall()
+        results = []
+        for review, my_id, topic_ids in rows:
+            result = {topic['id']: 0 for topic in topics}
+            for topic_id in json.loads(topic_ids):
+                result[topic_id] = 1
+            result['Review'] = json.loads(review)
+            result['myID'] = json.loads(my_id)
+            results.append(result)
+        columns = [topic['id'] for topic in topics] + ['Review', 'myID']
+        return pd.DataFrame(results, columns=None if results else columns)
+
+    def add_batch(self, name, batch_id, backend, requests):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT INTO job_batches VALUES (?, ?, ?, ?, ?)',
+                (name, batch_id, backend, json.dumps(requests), time.time()),
+            )
+
+    def batches(self, name):
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT batch_id, backend, requests, submitted FROM job_batches WHERE job = ? ORDER BY submitted', (name,)
+            ).fetchall()
+        return [
+            {'id': batch_id, 'backend': backend, 'requests': json.loads(requests), 'submitted': submitted}
+            for batch_id, backend, requests, submitted in rows
+        ]
+
+    def batch(self, name, batch_id):
+        return next(batch for batch in self.batches(name) if batch['id'] == batch_id)
+
+    def batch_positions(self, name):
+        # Job rows waiting on a submitted batch
+        return {
+            position
+            for batch in self.batches(name)
+            for request in batch['requests'].values()
+            for position in request['positions']
+        }
+
+    def remove_batch(self, name, batch_id):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM job_batches WHERE job = ? AND batch_id = ?', (name, batch_id))
+
+    def delete(self, name):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM job_batches WHERE job = ?', (name,))
+            self._connection.execute('DELETE FROM job_rows WHERE job = ?', (name,))
+            self._connection.execute('DELETE FROM jobs WHERE name = ?', (name,))
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,6 @@
+import os
+
+# Stores that must outlive sessions, restarts and tmp cleanup: autoCODE jobs,
+# classifications and batch files, and the LLM call log. Unlike the upload
+# cache in utils.dataset_cache, nothing in here is ever evicted.
+DATA_DIR = os.getenv('MIIOS_DATA_DIR', os.path.join(os.path.expanduser('~'), '.miios'))
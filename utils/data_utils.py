@@ -1,14 +1,9 @@
-from openai import OpenAI
 import json
-import os
-import anthropic
-from docx import Document
+import numpy as np
+from utils.llm_client import anthropic_message, cached_text, chat_completion, create_embeddings
+from utils.llm_pool import estimate_tokens
 
-openai_api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=openai_api_key)
-
-anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
-anthropic_client = anthropic.Anthropic(api_key=anthropic_api_key)
+CLASSIFICATION_MODEL = "gpt-4o"
 
 def generate_coding_schema(reviews_text, num_codes, question_text, temperature, language):
     prompt = f"""As an expert data analyst, your task is to create a comprehensive coding schema for analyzing open-ended survey responses. The survey question was:
@@ -41,7 +36,7 @@ Output your schema in the following JSON format:
 
 Ensure that your specific codes collectively cover the major themes in the responses, with "Sonstige" capturing any outliers or less common themes."""
 
-    response = client.chat.completions.create(
+    response = chat_completion(
         model="gpt-4o",
         response_format={"type": "json_object"},
         messages=[
@@ -53,42 +48,152 @@ Ensure that your specific codes collectively cover the major themes in the respo
     
     return response.choices[0].message.content
 
-def classify_review(review, topics, question_text):
+# Question, schema and instructions come first and the review last, so
+# consecutive requests share a prefix the provider can serve from its cache
+def classification_prompt(review, topics, question_text):
     topics_str = ", ".join([f'{topic["id"]}: {topic["topic"]}' for topic in topics])
-    prompt = f"""Given the following question and coding schema, classify the review:
+    return f"""Given the following question and coding schema, classify the review:
 
 Question: {question_text}
 
 Coding Schema:
 {topics_str}
 
-Review: {review}
+Respond with the topic IDs that are relevant to this review in JSON format. The JSON format should look like this: {{"relevant_topics": [{{"id": 1}}, {{"id": 2}}]}} if topics with id 1 and 2 are relevant.
 
-Respond with the topic IDs that are relevant to this review in JSON format. The JSON format should look like this: {{"relevant_topics": [{{"id": 1}}, {{"id": 2}}]}} if topics with id 1 and 2 are relevant."""
-    
-    response = client.chat.completions.create(
-        model="gpt-4o",
+Review: {review}"""
+
+# Chat completion arguments for one review; also the body of a batch request
+def classification_request(review, topics, question_text):
+    return dict(
+        model=CLASSIFICATION_MODEL,
         response_format={"type": "json_object"},
         messages=[
             {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
+            {"role": "user", "content": classification_prompt(review, topics, question_text)}
         ],
         temperature=0
     )
-    return json.loads(response.choices[0].message.content)
 
+def classify_review(review, topics, question_text):
+    # None if the answer is unusable, so the review stays open
+    response = chat_completion(**classification_request(review, topics, question_text))
+    return parse_classification(response.choices[0].message.content, topics)
+
+def parse_classification(content, topics):
+    # A single-review answer mapped onto the schema's ids, or None if it is
+    # not valid JSON or names topics the schema does not have
+    topic_ids = {str(topic["id"]): topic["id"] for topic in topics}
+    try:
+        relevant = [str(topic["id"]) for topic in json.loads(content)["relevant_topics"]]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+    if not all(topic_id in topic_ids for topic_id in relevant):
+        return None
+    return {"relevant_topics": [{"id": topic_ids[topic_id]} for topic_id in relevant]}
+
+# Batched classification: the question and schema are sent once per batch
+# instead of once per review. Batches are packed up to a prompt token budget.
+BATCH_TOKEN_BUDGET = 3000
+BATCH_MAX_ITEMS = 25
+BATCH_MAX_ATTEMPTS = 3
+
+def batch_classification_prompt(reviews, topics, question_text):
+    topics_str = ", ".join([f'{topic["id"]}: {topic["topic"]}' for topic in topics])
+    items = "\n".join(json.dumps({"item": item, "review": str(review)}, ensure_ascii=False) for item, review in enumerate(reviews, start=1))
+    return f"""Given the following question and coding schema, classify each of the reviews below independently:
+
+Question: {question_text}
 
+Coding Schema:
+{topics_str}
 
-def transcribe_audio_file(audio_file_path):
-    with open(audio_file_path, 'rb') as audio_file:
-        transcription = client.audio.transcriptions.create(
-            file=audio_file,
-            model="whisper-1",
+Respond with the topic IDs that are relevant to each review in JSON format, with exactly one entry per review and its item number. The JSON format should look like this: {{"results": [{{"item": 1, "relevant_topics": [{{"id": 1}}, {{"id": 2}}]}}, {{"item": 2, "relevant_topics": [{{"id": 3}}]}}]}} if topics 1 and 2 are relevant to review 1 and topic 3 to review 2.
+
+Reviews, one JSON object per line:
+{items}"""
+
+def pack_reviews(reviews, topics, question_text, token_budget=BATCH_TOKEN_BUDGET, max_items=BATCH_MAX_ITEMS):
+    # Positions of the reviews, grouped so that each batch prompt stays within
+    # the token budget; a review too long for any batch travels alone
+    preamble = estimate_tokens(batch_classification_prompt([], topics, question_text))
+    batches, batch, tokens = [], [], preamble
+    for position, review in enumerate(reviews):
+        review_tokens = estimate_tokens(str(review)) + 10
+        if batch and (tokens + review_tokens > token_budget or len(batch) >= max_items):
+            batches.append(batch)
+            batch, tokens = [], preamble
+        batch.append(position)
+        tokens += review_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _parse_batch_response(content, count, topics):
+    # Classifications by item number, keeping only items that map back to a
+    # review and name topics from the schema
+    topic_ids = {str(topic["id"]): topic["id"] for topic in topics}
+    try:
+        entries = json.loads(content).get("results", [])
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+    parsed = {}
+    for entry in entries if isinstance(entries, list) else []:
+        try:
+            item = int(entry["item"])
+            relevant = [str(topic["id"]) for topic in entry["relevant_topics"]]
+        except (KeyError, TypeError, ValueError):
+            continue
+        if not 1 <= item <= count or item in parsed or not all(topic_id in topic_ids for topic_id in relevant):
+            continue
+        parsed[item] = {"relevant_topics": [{"id": topic_ids[topic_id]} for topic_id in relevant]}
+    return parsed
+
+def classify_reviews_batch(reviews, topics, question_text, max_attempts=BATCH_MAX_ATTEMPTS, limiter=None):
+    # One request for all reviews; missing or invalid items are asked again in
+    # a smaller batch and, after max_attempts, one by one with classify_review.
+    # Returns the classifications in the order of reviews, None for reviews
+    # still without a valid answer. The first request is budgeted by the
+    # caller; the limiter, if given, covers every further one.
+    results = [None] * len(reviews)
+    pending = list(range(len(reviews)))
+    for attempt in range(max_attempts):
+        if not pending:
+            break
+        prompt = batch_classification_prompt([reviews[position] for position in pending], topics, question_text)
+        if attempt and limiter is not None:
+            limiter.acquire(estimate_tokens(prompt) + 20 * len(pending))
+        response = chat_completion(
+            model=CLASSIFICATION_MODEL,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0
         )
-    return transcription.text 
-
+        parsed = _parse_batch_response(response.choices[0].message.content, len(pending), topics)
+        for item, classification in parsed.items():
+            results[pending[item - 1]] = classification
+        pending = [position for position in pending if results[position] is None]
+    for position in pending:
+        if limiter is not None:
+            limiter.acquire(estimate_tokens(classification_prompt(str(reviews[position]), topics, question_text)) + 20)
+        results[position] = classify_review(str(reviews[position]), topics, question_text)
+    return results
+
+def embed_texts(texts, model="text-embedding-3-small", batch_size=1000):
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        response = create_embeddings(model=model, input=texts[start:start + batch_size])
+        vectors.extend(item.embedding for item in response.data)
+    vectors = np.array(vectors, dtype=np.float32).reshape(len(texts), -1)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+# The transcript goes first: follow-up prompts on the same transcript then
+# share a cacheable prefix
 def analyze_with_gpt(transcription, prompt):
-    response = client.chat.completions.create(
+    response = chat_completion(
         model="gpt-4o",
         temperature=0,
         messages=[
@@ -98,14 +203,14 @@ def analyze_with_gpt(transcription, prompt):
             },
             {
                 "role": "user",
-                "content": f"{prompt}\n\nTranscript:\n{transcription}"
+                "content": f"Transcript:\n{transcription}\n\n{prompt}"
             }
         ]
     )
     return response.choices[0].message.content 
 
 def analyze_with_claude(transcription, prompt):
-    response = anthropic_client.messages.create(
+    response = anthropic_message(
         model="claude-3-5-sonnet-20240620",
         max_tokens=1000,
         temperature=0,
@@ -113,9 +218,10 @@ def analyze_with_claude(transcription, prompt):
             {
                 "role": "user",
                 "content": [
+                    cached_text(f"Transkript:\n{transcription}"),
                     {
                         "type": "text",
-                        "text": f"{prompt}\n\nTranskript:\n{transcription}"
+                        "text": prompt
                     }
                 ]
             }
@@ -128,8 +234,3 @@ def analyze_transcription(transcription, model, prompt):
         return analyze_with_gpt(transcription, prompt)
     elif model == "Claude":
         return analyze_with_claude(transcription, prompt)
-
-def save_analysis_to_docx(analysis, filename):
-    doc = Document()
-    doc.add_paragraph(analysis)
-    doc.save(filename)
\ No newline at end of file
@@ -0,0 +1,162 @@
+import os
+import re
+import stat
+import tempfile
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.result_cache import content_hash
+from utils.workbook import read_sheets
+
+# Uploads are parsed once and stored as Parquet, keyed by content hash, so a
+# rerun or another page can memory-map just the columns it needs instead of
+# parsing the xlsx/csv again. Frames Arrow cannot represent (mixed-type object
+# columns, non-string headers) fall back to a pickle in the same directory.
+CACHE_DIR = os.getenv('MIIOS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'miios_dataset_cache'))
+MAX_CACHE_BYTES = int(os.getenv('MIIOS_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# "<sha256>-<sheet>.parquet" / ".pkl", as written by _store; eviction leaves
+# anything else in CACHE_DIR alone
+_CACHE_FILE = re.compile(r'^[0-9a-f]{64}-.+\.(parquet|pkl)$')
+
+_hashes = {}
+
+
+def upload_key(uploaded_file):
+    # Streamlit gives every upload a file_id; hash the content once per upload,
+    # through its buffer so the upload is not copied
+    file_id = getattr(uploaded_file, 'file_id', None)
+    if file_id is not None and file_id in _hashes:
+        return _hashes[file_id]
+    key = content_hash(uploaded_file.getbuffer())
+    if file_id is not None:
+        _hashes[file_id] = key
+    return key
+
+
+def _parse_upload(uploaded_file, sheet_names):
+    # Sheet name -> DataFrame; a workbook is opened once for all of them
+    if uploaded_file.name.endswith('.csv'):
+        return {sheet_name: pd.read_csv(BytesIO(uploaded_file.getvalue())) for sheet_name in sheet_names}
+    return read_sheets(uploaded_file.getvalue(), {sheet_name: None for sheet_name in sheet_names})
+
+
+def _cache_paths(key, sheet_name):
+    stem = os.path.join(CACHE_DIR, f"{key}-{sheet_name}")
+    return stem + '.parquet', stem + '.pkl'
+
+
+def evict(max_bytes=MAX_CACHE_BYTES, keep=()):
+    # Least recently used first; hits refresh the mtime. Only this module's
+    # cache files count and are removed; paths in keep count but are never
+    # removed, even if they alone exceed max_bytes.
+    keep = {os.path.abspath(path) for path in keep}
+    entries = []
+    kept = 0
+    for name in os.listdir(CACHE_DIR):
+        if not _CACHE_FILE.match(name):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if not stat.S_ISREG(status.st_mode):
+            continue
+        if os.path.abspath(path) in keep:
+            kept += status.st_size
+        else:
+            entries.append((status.st_mtime, status.st_size, path))
+    total = kept + sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _write_atomically(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _existing_path(key, sheet_name):
+    for path in _cache_paths(key, sheet_name):
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+    return None
+
+
+def _store(key, sheet_name, df):
+    parquet_path, pickle_path = _cache_paths(key, sheet_name)
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        _write_atomically(parquet_path, lambda tmp_path: pq.write_table(table, tmp_path))
+        return parquet_path
+    except (pa.ArrowException, TypeError, ValueError):
+        _write_atomically(pickle_path, df.to_pickle)
+        return pickle_path
+
+
+def cached_paths(uploaded_file, sheet_names):
+    # Sheets not cached yet are parsed together, in one pass over the workbook
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = upload_key(uploaded_file)
+    paths = {sheet_name: _existing_path(key, sheet_name) for sheet_name in sheet_names}
+    missing = [sheet_name for sheet_name, path in paths.items() if path is None]
+    if missing:
+        for sheet_name, df in _parse_upload(uploaded_file, missing).items():
+            paths[sheet_name] = _store(key, sheet_name, df)
+        # The sheets about to be read are never evicted
+        evict(MAX_CACHE_BYTES, keep=paths.values())
+    return paths
+
+
+def cached_path(uploaded_file, sheet_name=0):
+    return cached_paths(uploaded_file, [sheet_name])[sheet_name]
+
+
+def dataset_columns(uploaded_file, sheet_name=0):
+    path = cached_path(uploaded_file, sheet_name)
+    if path.endswith('.parquet'):
+        return pq.read_schema(path).names
+    return pd.read_pickle(path).columns.tolist()
+
+
+def preview_dataset(uploaded_file, rows=5, sheet_name=0):
+    path = cached_path(uploaded_file, sheet_name)
+    if path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        batch = next(parquet_file.iter_batches(batch_size=rows), None)
+        if batch is None:
+            return parquet_file.schema_arrow.empty_table().to_pandas()
+        return batch.to_pandas()
+    return pd.read_pickle(path).head(rows)
+
+
+def _read_cached(path, columns):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+    df = pd.read_pickle(path)
+    return df[columns] if columns is not None else df
+
+
+def load_dataset(uploaded_file, columns=None, sheet_name=0):
+    return _read_cached(cached_path(uploaded_file, sheet_name), columns)
+
+
+def load_sheets(uploaded_file, sheet_names):
+    # Several whole sheets of one workbook, parsed in a single pass
+    return {sheet_name: _read_cached(path, None) for sheet_name, path in cached_paths(uploaded_file, sheet_names).items()}
@@ -0,0 +1,119 @@
+import tempfile
+
+import pandas as pd
+import streamlit as st
+import xlsxwriter
+from docx import Document
+
+from utils.result_cache import session_cache
+
+# All downloads are built here, in memory or in per-request spooled temp
+# files, never under a fixed name that concurrent users would share. Pages
+# show download() buttons, which build their payload only when asked for and
+# keep it for the session until the data it was built from changes.
+SPOOL_BYTES = 32 * 1024 ** 2
+# Above this many cells a workbook is written row by row in xlsxwriter's
+# constant-memory mode instead of through pandas
+CONSTANT_MEMORY_CELLS = 1_000_000
+ROW_CHUNK = 10_000
+# Rows per Excel sheet, header included; longer frames continue on
+# "<sheet> (2)", "<sheet> (3)", ...
+EXCEL_MAX_ROWS = 1_048_576
+
+MIME_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'jsonl': 'application/jsonl',
+}
+
+
+def _spooled(write):
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as output:
+        write(output)
+        output.seek(0)
+        return output.read()
+
+
+def to_csv(df):
+    return df.to_csv(index=False).encode('utf-8')
+
+
+def to_parquet(df):
+    return _spooled(lambda output: df.to_parquet(output, index=False))
+
+
+def _sheet_parts(sheets):
+    # Splits frames that don't fit on one Excel sheet; names stay within
+    # Excel's 31 characters
+    per_sheet = EXCEL_MAX_ROWS - 1
+    for sheet_name, df in sheets.items():
+        if len(df) <= per_sheet:
+            yield sheet_name, df
+            continue
+        for part, start in enumerate(range(0, len(df), per_sheet), 1):
+            suffix = f" ({part})" if part > 1 else ""
+            yield f"{sheet_name[:31 - len(suffix)].rstrip()}{suffix}", df.iloc[start:start + per_sheet]
+
+
+def _write_rows(workbook, sheet_name, df):
+    # Rows must be written in order in constant-memory mode; values go in a
+    # chunk at a time as Python objects, missing values as blank cells
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, [str(column) for column in df.columns], workbook.add_format({'bold': True}))
+    row = 1
+    for start in range(0, len(df), ROW_CHUNK):
+        chunk = df.iloc[start:start + ROW_CHUNK].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        for values in chunk.itertuples(index=False, name=None):
+            # xlsxwriter returns -1 instead of raising past the last row
+            if worksheet.write_row(row, 0, values) == -1:
+                raise ValueError(f"Sheet '{sheet_name}' has more rows than Excel allows.")
+            row += 1
+
+
+def to_xlsx(sheets):
+    # sheets: sheet name -> DataFrame, written in this order
+    parts = list(_sheet_parts(sheets))
+    if sum(df.size for df in sheets.values()) <= CONSTANT_MEMORY_CELLS:
+        def write(output):
+            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+                for sheet_name, df in parts:
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+    else:
+        def write(output):
+            workbook = xlsxwriter.Workbook(output, {
+                'constant_memory': True, 'tmpdir': tempfile.gettempdir(), 'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+            })
+            for sheet_name, df in parts:
+                _write_rows(workbook, sheet_name, df)
+            workbook.close()
+    return _spooled(write)
+
+
+def to_docx(text):
+    def write(output):
+        document = Document()
+        document.add_paragraph(text)
+        document.save(output)
+    return _spooled(write)
+
+
+def frame_version(df):
+    # Cheap fingerprint of a DataFrame's columns and content for download()
+    return tuple(map(str, df.columns)), len(df), int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def download(label, build, file_name, key, version=None):
+    # build() makes the payload; it runs once the user asks for the file and
+    # again only when version (anything identifying the data) changes
+    payloads = session_cache('export_payloads', 8)
+    payload = payloads.get((key, version))
+    if payload is None:
+        if not st.button(f"Prepare {file_name}", key=f"prepare_{key}"):
+            return
+        with st.spinner(f"Preparing {file_name}..."):
+            payload = build()
+        payloads.put((key, version), payload)
+    st.download_button(label, data=payload, file_name=file_name, mime=MIME_TYPES[file_name.rsplit('.', 1)[-1]], key=f"download_{key}")
@@ -0,0 +1,88 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Character bigram models for gibberish v2. gibberish_models.json holds, per
+# language, the alphabet (index 0 is the word boundary) and the table of
+# log P(next char | char), estimated from word-frequency weighted vocabularies.
+MODELS_PATH = os.path.join(os.path.dirname(__file__), 'gibberish_models.json')
+
+# Answers whose mean bigram log-likelihood falls below this are keyboard mash
+# rather than words; real text in the model's language scores well above it
+DEFAULT_MIN_LOG_LIKELIHOOD = -3.6
+# Answers made of only a couple of distinct letters ("jkjkjkjk", "aaaaaaaa")
+DEFAULT_MIN_ENTROPY = 1.3
+DEFAULT_MIN_LETTERS = 6
+DEFAULT_MIN_LETTERS_ENTROPY = 8
+
+_LOOKUP_SIZE = 0x250
+
+
+@lru_cache(maxsize=None)
+def load_model(language):
+    with open(MODELS_PATH, encoding='utf-8') as f:
+        models = json.load(f)
+    if language not in models:
+        raise ValueError(f"No gibberish model for language: {language}")
+    alphabet = models[language]['alphabet']
+    log_probs = np.array(models[language]['log_probs'], dtype=np.float32).ravel()
+    # Code point -> alphabet index; everything outside the alphabet counts as a boundary
+    lookup = np.zeros(_LOOKUP_SIZE, dtype=np.uint8)
+    for index, char in enumerate(alphabet):
+        lookup[ord(char)] = index
+        lookup[ord(char.upper())] = index
+    return len(alphabet), log_probs, lookup
+
+
+def _score_block(texts, size, log_probs, lookup):
+    n = len(texts)
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=n)
+    code_points = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32)
+    chars = lookup[np.minimum(code_points, _LOOKUP_SIZE - 1)].astype(np.int32)
+    docs = np.repeat(np.arange(n, dtype=np.int32), lengths)
+
+    # Every answer is wrapped in boundaries, so pairs across answers are
+    # boundary -> boundary and drop out together with runs of spaces/digits
+    pairs = chars[:-1] * size + chars[1:]
+    valid = pairs > 0
+    pair_docs = docs[:-1][valid]
+    pair_counts = np.bincount(pair_docs, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_likelihood = np.bincount(pair_docs, weights=log_probs[pairs[valid]], minlength=n) / pair_counts
+
+    is_letter = chars > 0
+    letter_counts = np.bincount(docs[is_letter] * size + chars[is_letter], minlength=n * size).reshape(n, size)
+    letters = letter_counts.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = letter_counts / letters[:, None]
+        entropy = -np.where(p > 0, p * np.log2(p), 0.0).sum(axis=1)
+    return log_likelihood, entropy, letters
+
+
+def score_answers(answers, language='en', block_size=50_000):
+    # Mean bigram log-likelihood, letter entropy (bits) and letter count per
+    # answer. Answers are scored in blocks, each block as one code point array.
+    size, log_probs, lookup = load_model(language)
+    # The vocabularies behind the models spell ß as ss
+    texts = (' ' + answers.astype(str).str.replace('ß', 'ss', regex=False) + ' ').tolist()
+    blocks = [
+        _score_block(texts[start:start + block_size], size, log_probs, lookup)
+        for start in range(0, len(texts), block_size)
+    ]
+    columns = [np.concatenate(parts) if parts else np.empty(0) for parts in zip(*blocks)] or [np.empty(0)] * 3
+    return pd.DataFrame({
+        'log_likelihood': columns[0],
+        'entropy': columns[1],
+        'letters': columns[2],
+    }, index=answers.index)
+
+
+def gibberish_mask(answers, language='en', min_log_likelihood=DEFAULT_MIN_LOG_LIKELIHOOD,
+                   min_entropy=DEFAULT_MIN_ENTROPY, min_letters=DEFAULT_MIN_LETTERS):
+    scores = score_answers(answers, language)
+    unlikely = (scores['letters'] >= min_letters) & (scores['log_likelihood'] < min_log_likelihood)
+    repetitive = (scores['letters'] >= DEFAULT_MIN_LETTERS_ENTROPY) & (scores['entropy'] < min_entropy)
+    return (unlikely | repetitive).to_numpy()
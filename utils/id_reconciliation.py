@@ -0,0 +1,194 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Bad Ids reconciliation across survey waves and cleaned files. IDs are
+# brought into one canonical form ("00123", 123 and 123.0 from Excel all
+# become 123) and hashed to uint64 once; the joins are lookups in one hash
+# table over those hashes, so millions of IDs reconcile in seconds. Whole numbers,
+# the usual panel IDs, are kept and hashed as uint64 and only turned into
+# text for the report; other IDs take the slower path through Python strings.
+
+# Every whole number of up to 19 digits fits in uint64
+MAX_NUMBER_DIGITS = 19
+# Integral floats below this print as "<digits>.0", so the number path and
+# the text path agree on them
+MAX_EXACT_FLOAT = 1e16
+
+
+def _canonical_text(values):
+    # Text of IDs that are not plain whole numbers, and where it is all
+    # digits. Only the text is rewritten, never through a float, so long
+    # numeric IDs stay exact
+    text = values.astype(str).str.strip()
+    if pd.api.types.is_float_dtype(values):
+        from_float = pd.Series(True, index=values.index)
+    elif pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        from_float = pd.Series(False, index=values.index)
+    else:
+        from_float = values.map(lambda value: isinstance(value, (float, np.floating)))
+    text[from_float] = text[from_float].str.replace(r'\.0$', '', regex=True)
+    text = text.to_numpy(dtype=object)
+    whole = np.fromiter((value.isascii() and value.isdigit() for value in text), dtype=bool, count=len(text))
+    return text, whole
+
+
+@dataclass
+class CanonicalIds:
+    # IDs in row order: whole numbers as uint64 where is_number, canonical
+    # text in strings elsewhere
+    is_number: np.ndarray
+    numbers: np.ndarray
+    strings: np.ndarray
+
+    @classmethod
+    def concat(cls, parts):
+        return cls(*(np.concatenate([getattr(part, name) for part in parts]) for name in ('is_number', 'numbers', 'strings')))
+
+    def __len__(self):
+        return len(self.is_number)
+
+    def hashes(self):
+        hashes = np.empty(len(self), dtype=np.uint64)
+        hashes[self.is_number] = pd.util.hash_array(self.numbers[self.is_number])
+        hashes[~self.is_number] = pd.util.hash_array(self.strings[~self.is_number])
+        return hashes
+
+    def text(self, positions):
+        text = self.strings[positions]
+        numbers = self.is_number[positions]
+        text[numbers] = self.numbers[positions][numbers].astype(str)
+        return text
+
+
+def _canonical(values):
+    # CanonicalIds of the non-missing values, and the index of the rows kept
+    values = values[values.notna()]
+    count = len(values)
+    is_number = np.zeros(count, dtype=bool)
+    numbers = np.zeros(count, dtype=np.uint64)
+    if pd.api.types.is_unsigned_integer_dtype(values.dtype):
+        is_number[:] = True
+        numbers[:] = values.to_numpy(dtype=np.uint64)
+    elif pd.api.types.is_integer_dtype(values.dtype):
+        array = values.to_numpy(dtype=np.int64)
+        is_number = array >= 0
+        numbers[is_number] = array[is_number]
+    elif pd.api.types.is_float_dtype(values.dtype):
+        array = values.to_numpy(dtype=float)
+        is_number = (array >= 0) & (array < MAX_EXACT_FLOAT) & (np.floor(array) == array)
+        numbers[is_number] = array[is_number]
+    strings = np.full(count, None, dtype=object)
+    rest = np.flatnonzero(~is_number)
+    if len(rest):
+        text, whole = _canonical_text(values.iloc[rest])
+        # Leading zeros only need stripping from digits too long for uint64
+        long = np.flatnonzero(whole)[[len(value) > MAX_NUMBER_DIGITS for value in text[whole]]]
+        text[long] = [value.lstrip('0') or '0' for value in text[long]]
+        whole[long] = [len(value) <= MAX_NUMBER_DIGITS for value in text[long]]
+        numbers[rest[whole]] = text[whole].astype(np.uint64)
+        is_number[rest[whole]] = True
+        strings[rest[~whole]] = text[~whole]
+    keep = is_number | (strings != '')
+    return CanonicalIds(is_number[keep], numbers[keep], strings[keep]), values.index[keep]
+
+
+def canonical_ids(values):
+    # Canonical text of the non-missing IDs, index kept
+    ids, index = _canonical(values)
+    return pd.Series(ids.text(np.arange(len(ids))), index=index, dtype=object)
+
+
+def _occurrences(sources):
+    # Canonical IDs and source numbers of every row of every source
+    parts = [_canonical(ids)[0] for ids in sources.values()]
+    if not parts:
+        return CanonicalIds(np.array([], dtype=bool), np.array([], dtype=np.uint64), np.array([], dtype=object)), np.array([], dtype=np.int64)
+    return CanonicalIds.concat(parts), np.repeat(np.arange(len(parts)), [len(part) for part in parts])
+
+
+def _per_source(codes, source_of, sources):
+    # Position of the first row of each (source, ID) pair
+    pairs = pd.Series(codes.astype(np.int64) * sources + source_of)
+    return np.flatnonzero(~pairs.duplicated().to_numpy())
+
+
+def _present(codes, size):
+    # Lookup table: is the ID with this code among codes
+    present = np.zeros(size, dtype=bool)
+    present[codes] = True
+    return present
+
+
+def _duplicates(names, codes, source_of, ids, size):
+    # IDs occurring more than once, within a file or across files of a group
+    repeated = np.flatnonzero(np.bincount(codes, minlength=size)[codes] > 1)
+    if not len(repeated):
+        return pd.DataFrame(columns=['ID', 'Files', 'Occurrences'])
+    rows = pd.DataFrame({
+        'code': codes[repeated], 'ID': ids.text(repeated),
+        'file': np.asarray(names, dtype=object)[source_of[repeated]],
+    })
+    grouped = rows.groupby('code', sort=False)
+    duplicates = pd.DataFrame({
+        'ID': grouped['ID'].first(),
+        'Files': grouped['file'].agg(lambda files: ', '.join(dict.fromkeys(files))),
+        'Occurrences': grouped.size(),
+    })
+    return duplicates.reset_index(drop=True)
+
+
+@dataclass
+class Reconciliation:
+    good: pd.DataFrame       # in an original wave and a cleaned file
+    bad: pd.DataFrame        # in an original wave only
+    unknown: pd.DataFrame    # in a cleaned file but in no original wave
+    duplicates: pd.DataFrame
+    summary: pd.DataFrame
+
+    def sheets(self):
+        return {
+            'Summary': self.summary, 'Good IDs': self.good, 'Bad IDs': self.bad,
+            'Unknown IDs': self.unknown, 'Duplicate IDs': self.duplicates,
+        }
+
+
+def reconcile(originals, cleaned):
+    # originals, cleaned: file name -> Series of IDs (each wave, each cleaned file).
+    # Every wave is joined on its own, so a panel ID in several waves is
+    # counted, and reported, in each of them
+    wave_names, cleaned_names = list(originals), list(cleaned)
+    original_ids, original_sources = _occurrences(originals)
+    cleaned_ids, cleaned_sources = _occurrences(cleaned)
+    # One hash table over the hashes of all IDs; every join after it is an
+    # array lookup by the ID's code
+    codes, uniques = pd.factorize(np.concatenate([original_ids.hashes(), cleaned_ids.hashes()]))
+    original_codes, cleaned_codes = codes[:len(original_ids)], codes[len(original_ids):]
+    in_wave = _per_source(original_codes, original_sources, len(wave_names))
+    in_file = _per_source(cleaned_codes, cleaned_sources, len(cleaned_names))
+    wave_of, file_of = original_sources[in_wave], cleaned_sources[in_file]
+
+    is_good = _present(cleaned_codes, len(uniques))[original_codes[in_wave]]
+    is_unknown = ~_present(original_codes, len(uniques))[cleaned_codes[in_file]]
+    waves = np.asarray(wave_names, dtype=object)
+    files = np.asarray(cleaned_names, dtype=object)
+
+    good = pd.DataFrame({'ID': original_ids.text(in_wave[is_good]), 'Wave': waves[wave_of[is_good]]})
+    bad = pd.DataFrame({'ID': original_ids.text(in_wave[~is_good]), 'Wave': waves[wave_of[~is_good]]})
+    unknown = pd.DataFrame({'ID': cleaned_ids.text(in_file[is_unknown]), 'Cleaned file': files[file_of[is_unknown]]})
+    duplicates = pd.concat([
+        _duplicates(wave_names, original_codes, original_sources, original_ids, len(uniques)).assign(Group='Original'),
+        _duplicates(cleaned_names, cleaned_codes, cleaned_sources, cleaned_ids, len(uniques)).assign(Group='Cleaned'),
+    ], ignore_index=True)
+
+    summary = pd.DataFrame({
+        'Wave': wave_names,
+        'IDs': np.bincount(wave_of, minlength=len(wave_names)),
+        'Good': np.bincount(wave_of[is_good], minlength=len(wave_names)),
+        'Bad': np.bincount(wave_of[~is_good], minlength=len(wave_names)),
+    })
+    summary.loc[len(summary)] = ['Total', len(in_wave), int(is_good.sum()), int((~is_good).sum())]
+    summary['Unknown'] = [''] * (len(summary) - 1) + [int(is_unknown.sum())]
+    summary['Duplicates'] = [''] * (len(summary) - 1) + [len(duplicates)]
+    return Reconciliation(good, bad, unknown, duplicates, summary)
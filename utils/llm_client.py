@@ -0,0 +1,215 @@
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+
+import anthropic
+import httpx
+from openai import OpenAI, APIConnectionError as OpenAIConnectionError
+
+from utils import llm_telemetry
+
+# One place for all model calls. Clients are created once per process and
+# share a pooled HTTP connection; calls are retried with jittered exponential
+# backoff on 429/5xx and connection errors, honouring retry-after; and a
+# circuit breaker per provider holds calls back while a provider is down
+# instead of piling up retries. Rate limiting (429, retry-after) is waited out
+# and does not count as the provider failing. Base URLs come from
+# OPENAI_BASE_URL/ANTHROPIC_BASE_URL, so everything can be pointed at a local
+# fake server. Every call is recorded by utils.llm_telemetry.
+MAX_RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+REQUEST_TIMEOUT = 120.0
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30.0
+# A call gives up only after waiting this long for an open breaker to close
+BREAKER_MAX_WAIT = 600.0
+BREAKER_MIN_SLEEP = 0.05
+
+# Anthropic serves cached prompt prefixes behind this beta flag; blocks marked
+# with cache_control (see cached_text) end the cached prefix
+ANTHROPIC_PROMPT_CACHING = {"anthropic-beta": "prompt-caching-2024-07-31"}
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    # Opens after BREAKER_FAILURES consecutive failed calls; after the cooldown
+    # one trial call is let through and closes it again on success
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def wait_time(self):
+        # Seconds until a call may be sent; 0 lets it through, once the
+        # cooldown is over as the trial call
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                return remaining
+            if self._trial_running:
+                return BASE_DELAY
+            self._trial_running = True
+            return 0.0
+
+    def record(self, success):
+        with self._lock:
+            self._trial_running = False
+            if success:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self._consecutive += 1
+            if self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        # A throttled call says nothing about whether the provider is up
+        with self._lock:
+            self._trial_running = False
+
+
+_breakers = {"openai": CircuitBreaker(), "anthropic": CircuitBreaker()}
+
+
+@lru_cache(maxsize=None)
+def _http_client():
+    return httpx.Client(
+        timeout=REQUEST_TIMEOUT,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        event_hooks={"response": [llm_telemetry.on_response]},
+    )
+
+
+@lru_cache(maxsize=None)
+def openai_client():
+    # Retries are ours, not the SDK's, so they go through backoff and breaker
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        http_client=_http_client(),
+        max_retries=0,
+    )
+
+
+@lru_cache(maxsize=None)
+def anthropic_client():
+    return anthropic.Anthropic(
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        base_url=os.getenv("ANTHROPIC_BASE_URL") or None,
+        http_client=_http_client(),
+        max_retries=0,
+    )
+
+
+def reset_clients():
+    # After changing keys or base URLs, e.g. in tests
+    openai_client.cache_clear()
+    anthropic_client.cache_clear()
+    for provider in _breakers:
+        _breakers[provider] = CircuitBreaker()
+
+
+def _retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(error, (OpenAIConnectionError, anthropic.APIConnectionError))
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _throttled(error):
+    return getattr(error, "status_code", None) == 429 or _retry_after(error) is not None
+
+
+def backoff_delay(attempt, retry_after=None):
+    # Exponential backoff with full jitter, unless the server says how long
+    # to wait; then that, plus a little jitter so workers don't return at once
+    if retry_after is not None:
+        return min(MAX_DELAY, retry_after) + random.uniform(0, BASE_DELAY / 4)
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def _wait_for_breaker(breaker, provider):
+    # Jobs wait for the provider to recover instead of failing mid-run. The
+    # sleep has a floor: a remaining cooldown can round to a few nanoseconds,
+    # and sleeping that long could spin without the clock moving on
+    waited = 0.0
+    while (delay := breaker.wait_time()) > 0:
+        if waited >= BREAKER_MAX_WAIT:
+            raise CircuitOpenError(f"{provider} has been failing for {waited:.0f} seconds. Please try again later.")
+        delay = max(delay, BREAKER_MIN_SLEEP)
+        time.sleep(delay)
+        waited += delay
+
+
+def call_with_retries(provider, func, *args, **kwargs):
+    breaker = _breakers[provider]
+    operation = getattr(func, "__qualname__", type(func).__name__)
+    with llm_telemetry.track(provider, operation, kwargs.get("model")) as call:
+        for attempt in range(MAX_RETRIES + 1):
+            _wait_for_breaker(breaker, provider)
+            call.attempt()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                retryable = _retryable(e)
+                if retryable and _throttled(e):
+                    breaker.release()
+                else:
+                    breaker.record(success=not retryable)
+                if not retryable or attempt == MAX_RETRIES:
+                    raise
+                time.sleep(backoff_delay(attempt, _retry_after(e)))
+                continue
+            breaker.record(success=True)
+            call.succeeded(result)
+            return result
+
+
+def chat_completion(**kwargs):
+    return call_with_retries("openai", openai_client().chat.completions.create, **kwargs)
+
+
+def create_embeddings(**kwargs):
+    return call_with_retries("openai", openai_client().embeddings.create, **kwargs)
+
+
+def create_transcription(**kwargs):
+    return call_with_retries("openai", openai_client().audio.transcriptions.create, **kwargs)
+
+
+def anthropic_message(**kwargs):
+    headers = {**ANTHROPIC_PROMPT_CACHING, **kwargs.pop("extra_headers", {})}
+    return call_with_retries("anthropic", anthropic_client().messages.create, extra_headers=headers, **kwargs)
+
+
+def cached_text(text):
+    # Anthropic content block that ends a cacheable prompt prefix
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
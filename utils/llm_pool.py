@@ -0,0 +1,96 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Concurrent model calls under the provider's rate limits. Calls spend almost
+# all their time waiting on the network, so threads are enough; the limiter
+# keeps the pool inside the requests- and tokens-per-minute budget instead of
+# running into 429s.
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 30_000
+
+
+def estimate_tokens(text):
+    # Rough count for budgeting, about four characters per token
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    # Two token buckets, refilled continuously; acquire() blocks until both
+    # have room. A limit of None (or 0) is not enforced.
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = requests_per_minute or 0
+        self._tokens = tokens_per_minute or 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens=1):
+        if self.tokens_per_minute:
+            # A single request larger than the whole budget would wait forever
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                waits = []
+                if self.requests_per_minute and self._requests < 1:
+                    waits.append((1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    waits.append((tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if not waits:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+                wait = max(waits)
+            time.sleep(wait)
+
+
+def map_as_completed(func, items, max_workers=DEFAULT_MAX_WORKERS, limiter=None, token_counts=None):
+    # Yields (position, result) in completion order; callers slot results back
+    # into input order by position. After the first failing call nothing new
+    # is started, but calls already running are still yielded (they are paid
+    # for) before the error is raised. Each call runs in a copy of the
+    # caller's context, so telemetry scopes reach the worker threads.
+    def call(position, item):
+        if limiter is not None:
+            limiter.acquire(token_counts[position] if token_counts is not None else 1)
+        return position, func(item)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    error = None
+    try:
+        futures = [executor.submit(contextvars.copy_context().run, call, position, item) for position, item in enumerate(items)]
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                if error is None:
+                    error = e
+                    for pending in futures:
+                        pending.cancel()
+                continue
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    if error is not None:
+        raise error
+
+
+def format_eta(done, total, elapsed):
+    remaining = elapsed / done * (total - done) if done else 0
+    return f"Estimated remaining time: {int(remaining // 60)} minutes and {int(remaining % 60)} seconds"
@@ -0,0 +1,182 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+from utils.data_dir import DATA_DIR
+
+# One record per model call made through utils.llm_client: wall time
+# including retries and backoff, time until the response started arriving,
+# prompt/completion tokens, retries, the final error and an estimated cost.
+# Records carry the session, page and job they were made for (see scope), are
+# kept in memory for the usage panels and appended to a JSONL log for later
+# analysis. The process serves every browser session, so the panels only
+# read the records of their own session.
+LOG_PATH = os.getenv('MIIOS_LLM_LOG', os.path.join(DATA_DIR, 'llm_calls.jsonl'))
+MAX_RECORDS = 10_000
+
+# USD per million prompt and completion tokens
+PRICES = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'text-embedding-3-small': (0.02, 0.0),
+    'claude-3-5-sonnet-20240620': (3.00, 15.00),
+}
+
+_scope = contextvars.ContextVar('llm_telemetry_scope', default={})
+_attempt = threading.local()
+_records = deque(maxlen=MAX_RECORDS)
+_lock = threading.Lock()
+
+
+@contextmanager
+def scope(**labels):
+    # Labels (session, page, job) for the calls made inside; nested scopes add to the
+    # outer ones. Worker threads see them if started through copy_context().
+    token = _scope.set({**_scope.get(), **labels})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def on_response(response):
+    # httpx response hook: runs in the calling thread once the headers are in.
+    # Non-streamed completions only send headers when generation is done, so
+    # there this is the server time and the rest is download and parsing.
+    call = getattr(_attempt, 'call', None)
+    if call is not None and call.ttft is None:
+        call.ttft = time.monotonic() - call.attempt_started
+
+
+def _first(usage, *names):
+    for name in names:
+        value = getattr(usage, name, None)
+        if value is not None:
+            return value
+    return None
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    if model not in PRICES or prompt_tokens is None:
+        return None
+    prompt_price, completion_price = PRICES[model]
+    return (prompt_tokens * prompt_price + (completion_tokens or 0) * completion_price) / 1_000_000
+
+
+class CallRecord:
+    def __init__(self, provider, operation, model):
+        self.provider = provider
+        self.operation = operation
+        self.model = model
+        self.labels = _scope.get()
+        self.started = time.time()
+        self.attempt_started = time.monotonic()
+        self._monotonic_start = self.attempt_started
+        self.ttft = None
+        self.retries = -1
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.error = None
+
+    def attempt(self):
+        self.retries += 1
+        self.ttft = None
+        self.attempt_started = time.monotonic()
+
+    def succeeded(self, result):
+        usage = getattr(result, 'usage', None)
+        if usage is None:
+            return
+        self.prompt_tokens = _first(usage, 'prompt_tokens', 'input_tokens')
+        # Anthropic counts cached prompt tokens separately
+        for name in ('cache_read_input_tokens', 'cache_creation_input_tokens'):
+            if self.prompt_tokens is not None and _first(usage, name):
+                self.prompt_tokens += _first(usage, name)
+        self.completion_tokens = _first(usage, 'completion_tokens', 'output_tokens')
+
+    def failed(self, error):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def as_dict(self):
+        return {
+            'time': self.started,
+            'session': self.labels.get('session'),
+            'page': self.labels.get('page'),
+            'job': self.labels.get('job'),
+            'provider': self.provider,
+            'operation': self.operation,
+            'model': self.model,
+            'wall_time': time.monotonic() - self._monotonic_start,
+            'ttft': self.ttft,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'retries': max(self.retries, 0),
+            'error': self.error,
+            'cost': cost(self.model, self.prompt_tokens, self.completion_tokens),
+        }
+
+
+@contextmanager
+def track(provider, operation, model):
+    call = CallRecord(provider, operation, model)
+    _attempt.call = call
+    try:
+        yield call
+    except Exception as e:
+        call.failed(e)
+        raise
+    finally:
+        _attempt.call = None
+        _record(call.as_dict())
+
+
+def _record(record):
+    with _lock:
+        _records.append(record)
+        try:
+            os.makedirs(os.path.dirname(LOG_PATH) or '.', exist_ok=True)
+            with open(LOG_PATH, 'a', encoding='utf-8') as log:
+                log.write(json.dumps(record, default=str) + '\n')
+        except OSError:
+            # Telemetry must never break a model call
+            pass
+
+
+def records(session):
+    # Records of one session, oldest first
+    with _lock:
+        return [record for record in _records if record['session'] == session]
+
+
+def export_jsonl(session):
+    return ''.join(json.dumps(record, default=str) + '\n' for record in records(session)).encode('utf-8')
+
+
+def rollup(session=None, calls=None):
+    # Per page and job of the session's calls (or of calls, when given): calls,
+    # time, tokens, retries, errors and cost
+    calls = pd.DataFrame(records(session) if calls is None else calls)
+    if calls.empty:
+        return calls
+    calls[['page', 'job']] = calls[['page', 'job']].fillna('-')
+    numeric = ['wall_time', 'ttft', 'prompt_tokens', 'completion_tokens', 'retries', 'cost']
+    calls[numeric] = calls[numeric].apply(pd.to_numeric)
+    calls['failed'] = calls['error'].notna()
+    return calls.groupby(['page', 'job'], sort=False).agg(
+        calls=('operation', 'size'),
+        wall_time=('wall_time', 'sum'),
+        mean_wall_time=('wall_time', 'mean'),
+        p95_wall_time=('wall_time', lambda times: times.quantile(0.95)),
+        mean_ttft=('ttft', 'mean'),
+        prompt_tokens=('prompt_tokens', 'sum'),
+        completion_tokens=('completion_tokens', 'sum'),
+        retries=('retries', 'sum'),
+        errors=('failed', 'sum'),
+        cost=('cost', 'sum'),
+    ).reset_index()
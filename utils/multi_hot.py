@@ -0,0 +1,42 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# manuCODE's binary coding: every "Code N" column of the coded responses,
+# however many there are, is looked up against the schema codes in one
+# searchsorted and scattered into a uint8 respondents x codes matrix.
+CODE_COLUMN = re.compile(r'^Code (\d+)$')
+
+
+def code_columns(columns):
+    # "Code 1", "Code 2", ... in numeric order
+    numbered = [(int(match.group(1)), column) for column in columns if (match := CODE_COLUMN.match(str(column)))]
+    return [column for _, column in sorted(numbered, key=lambda item: item[0])]
+
+
+def _numeric_codes(codes):
+    # Schema codes as floats; text codes never match a cell, as before
+    return np.array([
+        float(code) if isinstance(code, (int, float, np.integer, np.floating)) and not isinstance(code, bool) else np.nan
+        for code in codes
+    ], dtype=np.float64)
+
+
+def multi_hot(df, codes):
+    # Column j is 1 where any Code N cell, cut to its integer part, equals
+    # codes[j]; empty cells and codes outside the schema are ignored
+    matrix = np.zeros((len(df), len(codes)), dtype=np.uint8)
+    columns = code_columns(df.columns)
+    if not columns or not len(codes):
+        return matrix
+    schema = _numeric_codes(codes)
+    order = np.argsort(schema, kind='stable')
+    ordered = schema[order]
+    values = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    rows, cells = np.nonzero(~np.isnan(values))
+    found = np.trunc(values[rows, cells])
+    positions = np.minimum(np.searchsorted(ordered, found), len(ordered) - 1)
+    known = ordered[positions] == found
+    matrix[rows[known], order[positions[known]]] = 1
+    return matrix
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+# Near-duplicate detection for open answers: character shingles -> MinHash
+# signatures -> LSH banding for candidate pairs -> clusters via union of
+# candidate pairs whose estimated Jaccard similarity clears the threshold.
+
+_SHINGLE_BASE = np.uint64(0x100000001B3)
+_BAND_BASE = np.uint64(0x9E3779B97F4A7C15)
+
+
+def normalize_answers(answers):
+    text = answers.astype(str).str.lower()
+    text = text.str.replace(r'[\W_]+', ' ', regex=True).str.strip()
+    return text
+
+
+def _mix64(values):
+    # splitmix64 finalizer, spreads the rolling hash over all 64 bits
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def shingle_hashes(texts, shingle_size):
+    # All texts are encoded into one code point array and every k-gram is
+    # hashed with a rolling polynomial in a single vectorized pass. Returns the
+    # hashes plus the document each hash belongs to.
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    code_points = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    n_windows = len(code_points) - shingle_size + 1
+    if n_windows <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+
+    with np.errstate(over='ignore'):
+        hashes = np.zeros(n_windows, dtype=np.uint64)
+        for offset in range(shingle_size):
+            hashes *= _SHINGLE_BASE
+            hashes += code_points[offset:offset + n_windows]
+        hashes = _mix64(hashes)
+
+    doc_ends = np.cumsum(lengths)
+    doc_of_window = np.repeat(np.arange(len(texts)), lengths)[:n_windows]
+    inside = np.arange(n_windows) + shingle_size <= doc_ends[doc_of_window]
+    return hashes[inside], doc_of_window[inside]
+
+
+def minhash_signatures(hashes, docs, n_docs, num_perm=128, seed=0):
+    # Multiply-shift permutations, one vectorized pass over all shingles per
+    # permutation; minimum.reduceat takes the per-document minimum
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    increments = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    signatures = np.full((n_docs, num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    if len(hashes) == 0:
+        return signatures
+    has_shingles, starts = np.unique(docs, return_index=True)
+    permuted = np.empty_like(hashes)
+    with np.errstate(over='ignore'):
+        for perm in range(num_perm):
+            np.multiply(hashes, multipliers[perm], out=permuted)
+            permuted += increments[perm]
+            permuted >>= np.uint64(32)
+            signatures[has_shingles, perm] = np.minimum.reduceat(permuted, starts)
+    return signatures
+
+
+def lsh_params(num_perm, threshold):
+    # Pick bands x rows so that the LSH S-curve turns at about the threshold
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        turning_point = (1.0 / bands) ** (1.0 / rows)
+        error = abs(turning_point - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def _connected_labels(n, left, right):
+    # Vectorized union-find: propagate the smallest index along every edge and
+    # compress pointers until nothing changes
+    labels = np.arange(n)
+    while len(left):
+        previous = labels.copy()
+        np.minimum.at(labels, left, labels[right])
+        np.minimum.at(labels, right, labels[left])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+    return labels
+
+
+def near_duplicate_clusters(texts, threshold=0.8, num_perm=128, shingle_size=5, seed=0):
+    # Returns a cluster id per text; -1 means the text has no near duplicate
+    texts = list(texts)
+    n = len(texts)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    hashes, docs = shingle_hashes(texts, shingle_size)
+    signatures = minhash_signatures(hashes, docs, n, num_perm, seed)
+    usable = np.zeros(n, dtype=bool)
+    usable[docs] = True
+
+    bands, rows = lsh_params(num_perm, threshold)
+    candidates = np.flatnonzero(usable)
+    left, right = [], []
+    for band in range(bands):
+        band_signatures = signatures[candidates, band * rows:(band + 1) * rows].astype(np.uint64)
+        with np.errstate(over='ignore'):
+            keys = np.zeros(len(candidates), dtype=np.uint64)
+            for column in range(rows):
+                keys = keys * _BAND_BASE + band_signatures[:, column]
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        new_bucket = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        bucket_leader = order[np.flatnonzero(new_bucket)[np.cumsum(new_bucket) - 1]]
+        members = ~new_bucket
+        left.append(candidates[bucket_leader[members]])
+        right.append(candidates[order[members]])
+
+    left = np.concatenate(left) if left else np.empty(0, dtype=np.int64)
+    right = np.concatenate(right) if right else np.empty(0, dtype=np.int64)
+    if len(left):
+        pairs = np.unique(np.column_stack([left, right]), axis=0)
+        left, right = pairs[:, 0], pairs[:, 1]
+        similarity = (signatures[left] == signatures[right]).mean(axis=1)
+        keep = similarity >= threshold
+        left, right = left[keep], right[keep]
+
+    labels = _connected_labels(n, left, right)
+    sizes = np.bincount(labels, minlength=n)
+    in_cluster = sizes[labels] > 1
+    clusters = np.full(n, -1, dtype=np.int64)
+    clusters[in_cluster] = pd.factorize(labels[in_cluster])[0]
+    return clusters
+
+
+def find_near_duplicates(answers, skip, threshold=0.8, min_length=10, num_perm=128, shingle_size=5):
+    # Cluster ids aligned with answers; skipped and too short answers get -1
+    text = normalize_answers(answers)
+    eligible = ~skip & (text.str.len() >= max(min_length, shingle_size)).to_numpy()
+    clusters = np.full(len(answers), -1, dtype=np.int64)
+    clusters[eligible] = near_duplicate_clusters(text[eligible].tolist(), threshold, num_perm, shingle_size)
+    return clusters
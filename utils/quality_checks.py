@@ -0,0 +1,285 @@
+import ast
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from utils.gibberish import gibberish_mask
+from utils.near_duplicates import find_near_duplicates
+from utils.speeders import sketch_by_segment, speeder_thresholds, relative_speeder_mask
+
+# Flag columns written by betterDATA, in export order
+FLAG_COLUMNS = ['Speeder', 'Inconsistency', 'Straightliner', 'Gibberish', 'Straightliner_v2', 'Gibberish_v2', 'Duplicate', 'Near_Duplicate']
+
+DEFAULT_MISSING_VALUES = '-77,-99,np.nan'
+
+
+NAN_TOKENS = {'np.nan', 'np.NaN', 'np.NAN'}
+
+
+def _parse_missing_value(token):
+    if token in NAN_TOKENS:
+        return np.nan
+    try:
+        return ast.literal_eval(token)
+    except (ValueError, SyntaxError):
+        raise ValueError(f"Invalid missing value {token!r}: use numbers, quoted strings or np.nan.") from None
+
+
+def parse_missing_values(text):
+    # Same syntax the betterDATA text inputs always accepted, e.g. "-77,-99,np.nan".
+    # Only literals are parsed, never evaluated, since plans come from shared config files
+    return [_parse_missing_value(value.strip()) for value in text.split(',') if value.strip()]
+
+
+def format_missing_values(missing_values):
+    # Inverse of parse_missing_values, used when a plan is saved to JSON
+    return ','.join('np.nan' if _is_nan(value) else repr(value) for value in missing_values)
+
+
+def _is_nan(value):
+    return isinstance(value, float) and np.isnan(value)
+
+
+def compile_missing_values(missing_values):
+    # Split the list into hashable sentinels and a NaN switch so that equal lists
+    # compile to the same key and the NaN test is done with isna() instead of isin()
+    sentinels = tuple(sorted({value for value in missing_values if not _is_nan(value)}, key=repr))
+    has_nan = any(_is_nan(value) for value in missing_values)
+    return sentinels, has_nan
+
+
+class MissingMasks:
+    def __init__(self, df):
+        self.df = df
+        self._masks = {}
+
+    def column(self, column, missing_values):
+        sentinels, has_nan = compile_missing_values(missing_values)
+        key = (column, sentinels, has_nan)
+        if key not in self._masks:
+            values = self.df[column]
+            mask = values.isin(sentinels).to_numpy() if sentinels else np.zeros(len(values), dtype=bool)
+            if has_nan:
+                mask |= values.isna().to_numpy()
+            self._masks[key] = mask
+        return self._masks[key]
+
+    def block(self, columns, missing_values):
+        if not columns:
+            return np.zeros((len(self.df), 0), dtype=bool)
+        return np.column_stack([self.column(column, missing_values) for column in columns])
+
+
+def _rowwise_nunique(values, missing):
+    # Factorize the whole block once so that every cell becomes an integer code,
+    # then count distinct codes per row on a sorted copy. Missing cells get -1.
+    codes, _ = pd.factorize(values.ravel())
+    codes = codes.reshape(values.shape)
+    codes[missing] = -1
+    codes.sort(axis=1)
+    distinct = codes >= 0
+    distinct[:, 1:] &= codes[:, 1:] != codes[:, :-1]
+    return distinct.sum(axis=1)
+
+
+def _speeder_flags(df, columns, missing, time_threshold):
+    return (df[columns[0]] <= time_threshold).to_numpy()
+
+
+def _relative_speeder_flags(df, columns, missing, ratio=0.5, thresholds=None):
+    # columns: time column, optionally followed by a segment column (device,
+    # quota cell, ...). thresholds is a list of [segment, seconds] pairs fixed
+    # in advance, e.g. from sketches over all chunks or files; without it they
+    # come from this frame's own per-segment medians.
+    times = df[columns[0]]
+    segments = df[columns[1]] if len(columns) > 1 else None
+    if thresholds is None:
+        thresholds = speeder_thresholds(sketch_by_segment(times, segments), ratio)
+    return relative_speeder_mask(times, segments, dict(thresholds))
+
+
+def _inconsistency_flags(df, columns, missing, allowable_difference=1):
+    age_column, birth_year_column = columns
+    current_year = pd.Timestamp.now().year
+    delta = (df[age_column] - (current_year - df[birth_year_column])).abs()
+    return (delta > allowable_difference).to_numpy() & ~missing.any(axis=1)
+
+
+def _straightliner_flags(df, columns, missing):
+    return _rowwise_nunique(df[columns].to_numpy(), missing) == 1
+
+
+def _gibberish_flags(df, columns, missing, language='en'):
+    if language == 'de':
+        gibberish_pattern = re.compile(r'^[a-zA-ZäöüÄÖÜß]{8,}$')
+    else:
+        gibberish_pattern = re.compile(r'^[a-zA-Z]{8,}$')
+    matches = df[columns[0]].astype(str).str.match(gibberish_pattern).to_numpy()
+    return matches & ~missing[:, 0]
+
+
+def _gibberish_v2_flags(df, columns, missing, language='en'):
+    # Character bigram model instead of the single-token regex of v1
+    return gibberish_mask(df[columns[0]], language) & ~missing[:, 0]
+
+
+def duplicate_key_missing(df, columns, missing):
+    # Rows whose duplicate key has a missing value. The check has always
+    # tested `value in missing_values`, which finds NaN only by identity:
+    # the np.nan object pandas puts in text columns is missing, while NaN in
+    # numeric columns (and None, NaT) is a key value like any other
+    nan = df[columns].isna().to_numpy()
+    for position, column in enumerate(columns):
+        if df[column].dtype == object:
+            rows = np.flatnonzero(nan[:, position])
+            nan[rows, position] = [value is not np.nan for value in df[column].to_numpy()[rows]]
+    return (missing & ~nan).any(axis=1)
+
+
+def _duplicate_flags(df, columns, missing):
+    return df.duplicated(subset=columns, keep=False).to_numpy() & ~duplicate_key_missing(df, columns, missing)
+
+
+def _near_duplicate_flags(df, columns, missing, threshold=0.8, min_length=10):
+    return find_near_duplicates(df[columns[0]], missing[:, 0], threshold, min_length) >= 0
+
+
+# Check kinds a plan entry can refer to. straightliners_v2 currently shares
+# the v1 implementation and only differs in the flag column it writes.
+CHECKS = {
+    'speeders': _speeder_flags,
+    'relative_speeders': _relative_speeder_flags,
+    'inconsistencies': _inconsistency_flags,
+    'straightliners': _straightliner_flags,
+    'gibberish': _gibberish_flags,
+    'straightliners_v2': _straightliner_flags,
+    'gibberish_v2': _gibberish_v2_flags,
+    'duplicates': _duplicate_flags,
+    'near_duplicates': _near_duplicate_flags,
+}
+
+# Kinds that compare respondents with each other and need the whole file
+WHOLE_FILE_CHECKS = {'duplicates', 'near_duplicates'}
+
+
+@dataclass
+class CheckSpec:
+    name: str
+    kind: str
+    columns: list
+    weight: float = 1.0
+    missing_values: list = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+
+    def cache_key(self):
+        # Everything that changes the flags; the weight only enters the score
+        return (self.kind, tuple(self.columns), compile_missing_values(self.missing_values), repr(sorted(self.params.items())))
+
+
+def _portable_params(check):
+    # Relative speeder cut-offs belong to the file they were computed on; a
+    # saved plan keeps only the ratio, so every wave it runs on uses its own
+    # medians (or the pooled ones of better_data_batch.py --pooled-speeders)
+    if check.kind == 'relative_speeders':
+        return {name: value for name, value in check.params.items() if name != 'thresholds'}
+    return check.params
+
+
+@dataclass
+class CheckPlan:
+    checks: list = field(default_factory=list)
+
+    def add(self, name, kind, columns, weight=1.0, missing_values=(), **params):
+        if kind not in CHECKS:
+            raise ValueError(f"Unknown check kind: {kind}")
+        self.checks.append(CheckSpec(name, kind, list(columns), weight, list(missing_values), params))
+        return self
+
+    def columns(self):
+        return {column for check in self.checks for column in check.columns}
+
+    def to_dict(self):
+        return {'checks': [
+            {'name': check.name, 'kind': check.kind, 'columns': check.columns, 'weight': check.weight,
+             'missing_values': format_missing_values(check.missing_values), 'params': _portable_params(check)}
+            for check in self.checks
+        ]}
+
+    @classmethod
+    def from_dict(cls, config):
+        plan = cls()
+        for check in config['checks']:
+            plan.add(check['name'], check['kind'], check['columns'], check.get('weight', 1.0),
+                     parse_missing_values(check.get('missing_values', '')), **check.get('params', {}))
+        return plan
+
+    def evaluate(self, df, masks=None, cache=None, dataset_key=None):
+        # One pass over the enabled checks; masks are shared between checks that
+        # look at the same column with the same missing values. With a cache,
+        # flag vectors are reused for checks whose parameters did not change.
+        masks = masks if masks is not None else MissingMasks(df)
+        flags = {}
+        for check in self.checks:
+            key = (dataset_key, check.cache_key())
+            if cache is not None and key in cache:
+                flags[check.name] = cache.get(key)
+                continue
+            missing = masks.block(check.columns, check.missing_values)
+            flags[check.name] = CHECKS[check.kind](df, check.columns, missing, **check.params)
+            if cache is not None:
+                cache.put(key, flags[check.name])
+        return pd.DataFrame({name: values.astype(int) for name, values in flags.items()}, index=df.index)
+
+    def score(self, flags):
+        score = pd.Series(0.0, index=flags.index)
+        for check in self.checks:
+            score += flags[check.name] * check.weight
+        return score
+
+    def run(self, df, cache=None, dataset_key=None):
+        flags = self.evaluate(df, cache=cache, dataset_key=dataset_key)
+        return flags, self.score(flags)
+
+
+def _single_check(df, kind, columns, missing_values, **params):
+    flags = CheckPlan().add(kind, kind, columns, missing_values=missing_values, **params).evaluate(df)
+    return flags[kind]
+
+
+def identify_speeders(df, time_column, time_threshold):
+    return _single_check(df, 'speeders', [time_column], [], time_threshold=time_threshold)
+
+
+def identify_relative_speeders(df, time_column, ratio=0.5, segment_column=None, thresholds=None):
+    columns = [time_column] + ([segment_column] if segment_column else [])
+    return _single_check(df, 'relative_speeders', columns, [], ratio=ratio, thresholds=thresholds)
+
+
+def identify_inconsistencies(df, age_column, birth_year_column, missing_values, allowable_difference=1):
+    return _single_check(df, 'inconsistencies', [age_column, birth_year_column], missing_values, allowable_difference=allowable_difference)
+
+
+def identify_straightliners(df, questions, missing_values):
+    return _single_check(df, 'straightliners', questions, missing_values)
+
+
+def identify_gibberish(df, open_answer_column, missing_values, language='en'):
+    return _single_check(df, 'gibberish', [open_answer_column], missing_values, language=language)
+
+
+def identify_gibberish_v2(df, open_answer_column, missing_values, language='en'):
+    return _single_check(df, 'gibberish_v2', [open_answer_column], missing_values, language=language)
+
+
+def identify_straightliners_v2(df, questions, missing_values):
+    return _single_check(df, 'straightliners_v2', questions, missing_values)
+
+
+def identify_duplicates(df, columns, missing_values):
+    return _single_check(df, 'duplicates', columns, missing_values)
+
+
+def identify_near_duplicates(df, open_answer_column, missing_values, threshold=0.8, min_length=10):
+    return _single_check(df, 'near_duplicates', [open_answer_column], missing_values, threshold=threshold, min_length=min_length)
@@ -0,0 +1,56 @@
+import hashlib
+from collections import OrderedDict
+
+import streamlit as st
+
+
+# Large buffers are hashed in slices of this size, without copying them
+HASH_SLICE_BYTES = 16 * 1024 * 1024
+
+
+def content_hash(data):
+    # data: bytes or any buffer, such as an upload's getbuffer()
+    view = memoryview(data).cast('B')
+    digest = hashlib.sha256()
+    for start in range(0, view.nbytes, HASH_SLICE_BYTES):
+        digest.update(view[start:start + HASH_SLICE_BYTES])
+    return digest.hexdigest()
+
+
+class LRUCache:
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        if key in self._items:
+            return self.get(key)
+        value = compute()
+        self.put(key, value)
+        return value
+
+
+def session_cache(name, max_items):
+    # One cache per browser session, kept across Streamlit reruns
+    key = f'_cache_{name}'
+    if key not in st.session_state:
+        st.session_state[key] = LRUCache(max_items)
+    return st.session_state[key]
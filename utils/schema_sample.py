@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from utils.classification_cache import normalize_answer
+from utils.llm_pool import estimate_tokens
+
+# Sample of answers for generate_coding_schema: deduplicated, drawn evenly
+# from short to long answers, reproducible for a seed and capped at a prompt
+# token budget so long open-ends cannot blow past the context window.
+DEFAULT_TOKEN_BUDGET = 6000
+MAX_ANSWER_TOKENS = 200
+LENGTH_STRATA = 4
+
+
+def _truncate(text, max_tokens=MAX_ANSWER_TOKENS):
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(' ', 1)[0] + ' …'
+
+
+def build_schema_sample(answers, sample_size, token_budget=DEFAULT_TOKEN_BUDGET, seed=0):
+    answers = pd.Series(answers).dropna().astype(str)
+    answers = answers[answers.str.strip() != '']
+    answers = answers[~answers.map(normalize_answer).duplicated()].reset_index(drop=True)
+    if answers.empty:
+        return []
+
+    # Length strata by rank, taken round-robin, each in seeded random order
+    rng = np.random.default_rng(seed)
+    strata = pd.qcut(answers.str.len().rank(method='first'), q=min(LENGTH_STRATA, len(answers)), labels=False)
+    queues = [rng.permutation(np.flatnonzero(strata.to_numpy() == stratum)) for stratum in range(strata.max() + 1)]
+    order = [queue[i] for i in range(max(len(queue) for queue in queues)) for queue in queues if i < len(queue)]
+
+    sample, tokens = [], 0
+    for position in order:
+        text = _truncate(answers[position])
+        cost = estimate_tokens(text) + 1
+        if tokens + cost > token_budget:
+            # A shorter answer further down may still fit
+            continue
+        sample.append(text)
+        tokens += cost
+        if len(sample) >= sample_size:
+            break
+    return sample
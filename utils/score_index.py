@@ -0,0 +1,64 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class ScoreIndex:
+    # Score distribution condensed once after "Run Check": the sorted distinct
+    # scores with their counts, plus histogram bins and box plot statistics.
+    # Threshold questions are then a binary search instead of a full-frame scan.
+    values: np.ndarray
+    counts: np.ndarray
+    bin_counts: np.ndarray
+    bin_edges: np.ndarray
+    box_stats: dict
+
+    @classmethod
+    def from_scores(cls, scores, bins=20):
+        values, counts = np.unique(np.asarray(scores, dtype=float), return_counts=True)
+        return cls.from_counts(values, counts, bins)
+
+    @classmethod
+    def from_counts(cls, values, counts, bins=20):
+        values = np.asarray(values, dtype=float)
+        counts = np.asarray(counts, dtype=np.int64)
+        order = np.argsort(values)
+        values, counts = values[order], counts[order]
+        bin_counts, bin_edges = np.histogram(values, bins=bins, weights=counts)
+        index = cls(values, counts, bin_counts, bin_edges, {})
+        index.box_stats = index._box_stats()
+        return index
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    @property
+    def max(self):
+        return float(self.values[-1]) if len(self.values) else 0.0
+
+    def count_at_least(self, threshold):
+        start = np.searchsorted(self.values, threshold, side='left')
+        return int(self.counts[start:].sum())
+
+    def quantile(self, q):
+        # Linear interpolation between positions of the (virtually) expanded
+        # sorted score array, as np.quantile does
+        cumulative = np.cumsum(self.counts)
+        position = q * (self.total - 1)
+        lower = np.floor(position)
+        lower_value = self.values[np.searchsorted(cumulative, lower, side='right')]
+        upper_value = self.values[np.searchsorted(cumulative, min(lower + 1, self.total - 1), side='right')]
+        return float(lower_value + (upper_value - lower_value) * (position - lower))
+
+    def _box_stats(self, whis=1.5):
+        # Same definitions as matplotlib's boxplot, for ax.bxp
+        if self.total == 0:
+            return {}
+        q1, median, q3 = self.quantile(0.25), self.quantile(0.5), self.quantile(0.75)
+        iqr = q3 - q1
+        inside = self.values[(self.values >= q1 - whis * iqr) & (self.values <= q3 + whis * iqr)]
+        whislo, whishi = (inside.min(), inside.max()) if len(inside) else (q1, q3)
+        fliers = self.values[(self.values < whislo) | (self.values > whishi)]
+        return {'med': median, 'q1': q1, 'q3': q3, 'whislo': whislo, 'whishi': whishi, 'fliers': fliers}
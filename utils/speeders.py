@@ -0,0 +1,122 @@
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+# Mergeable quantile sketch for interview times, in the style of DDSketch:
+# values fall into logarithmic buckets so every quantile is returned with a
+# bounded relative error. Sketches from chunks, files or worker processes are
+# merged by adding bucket counts, so medians never need all times in memory.
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+ALL_RESPONDENTS = '__all__'
+
+
+@dataclass
+class QuantileSketch:
+    relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY
+    buckets: Counter = field(default_factory=Counter)
+    zero_count: int = 0
+
+    @property
+    def gamma(self):
+        return (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.buckets.values())
+
+    def bucket_indices(self, values):
+        return np.ceil(np.log(values) / math.log(self.gamma)).astype(np.int64)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        indices, counts = np.unique(self.bucket_indices(positive), return_counts=True)
+        self.buckets.update(dict(zip(indices.tolist(), counts.tolist())))
+        return self
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        self.buckets.update(other.buckets)
+        self.zero_count += other.zero_count
+        return self
+
+    def quantile(self, q):
+        # Linear interpolation between the two nearest ranks, as np.quantile
+        # does, on the bucket values; each is within relative_accuracy of the
+        # true value, so the result is too, also for small segments
+        total = self.count
+        if total == 0:
+            return float('nan')
+        indices = np.array(sorted(self.buckets), dtype=np.int64)
+        # Bucket midpoint in the relative sense, error <= relative_accuracy
+        values = np.concatenate([[0.0], 2 * self.gamma ** indices.astype(float) / (self.gamma + 1)])
+        cumulative = np.cumsum([self.zero_count] + [self.buckets[index] for index in indices])
+        rank = q * (total - 1)
+        lower = math.floor(rank)
+        lower_value, upper_value = values[np.searchsorted(cumulative, [lower, min(lower + 1, total - 1)], side='right')]
+        return float(lower_value + (upper_value - lower_value) * (rank - lower))
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+def sketch_by_segment(times, segments=None, sketches=None, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    # One grouped, vectorized pass: count (segment, bucket) pairs and fold them
+    # into one sketch per segment. Pass existing sketches to keep accumulating
+    # over chunks or files.
+    sketches = sketches if sketches is not None else {}
+    times = pd.to_numeric(pd.Series(times), errors='coerce').reset_index(drop=True)
+    if segments is None:
+        sketches.setdefault(ALL_RESPONDENTS, QuantileSketch(relative_accuracy))
+        segments = pd.Series(ALL_RESPONDENTS, index=times.index)
+    else:
+        segments = pd.Series(segments).reset_index(drop=True).astype(str)
+    valid = times.notna()
+    times, segments = times[valid], segments[valid]
+
+    template = QuantileSketch(relative_accuracy)
+    positive = times > 0
+    buckets = pd.Series(template.bucket_indices(times[positive].to_numpy()), index=times.index[positive])
+    bucket_counts = buckets.groupby(segments[positive]).value_counts()
+    zero_counts = segments[~positive].value_counts()
+
+    for segment in segments.unique():
+        sketches.setdefault(segment, QuantileSketch(relative_accuracy))
+    for (segment, index), count in bucket_counts.items():
+        sketches[segment].buckets[int(index)] += int(count)
+    for segment, count in zero_counts.items():
+        sketches[segment].zero_count += int(count)
+    return sketches
+
+
+def merge_sketches(sketch_maps):
+    merged = {}
+    for sketches in sketch_maps:
+        for segment, sketch in sketches.items():
+            if segment in merged:
+                merged[segment].merge(sketch)
+            else:
+                merged[segment] = QuantileSketch(sketch.relative_accuracy).merge(sketch)
+    return merged
+
+
+def speeder_thresholds(sketches, ratio=0.5):
+    # Cut-off per segment: a fraction of that segment's median interview time
+    return {segment: sketch.median() * ratio for segment, sketch in sketches.items()}
+
+
+def relative_speeder_mask(times, segments, thresholds):
+    times = pd.to_numeric(pd.Series(times), errors='coerce').to_numpy(dtype=float)
+    if segments is None:
+        limits = np.full(len(times), thresholds.get(ALL_RESPONDENTS, np.nan))
+    else:
+        limits = pd.Series(segments).astype(str).map(thresholds).to_numpy(dtype=float)
+    # Respondents from a segment without a threshold are never flagged
+    return np.nan_to_num(times, nan=np.inf) <= np.nan_to_num(limits, nan=-np.inf)
@@ -0,0 +1,212 @@
+from dataclasses import dataclass, field
+from io import BytesIO
+
+import numpy as np
+
+from utils.llm_client import create_transcription
+from utils.llm_pool import map_as_completed
+
+# Long recordings for Whisper: the MP3 is cut at frame boundaries into
+# overlapping windows (at pauses if silence splitting is on), each window
+# stays under the 25 MB upload limit, the windows are transcribed
+# concurrently by a transcription backend, and the timed segments are
+# stitched back together with the overlap transcribed twice kept only once.
+MAX_SEGMENT_BYTES = 24 * 1024 ** 2
+DEFAULT_WINDOW = 600.0
+DEFAULT_OVERLAP = 5.0
+# How far before a window's end a pause is looked for when splitting on silence
+SILENCE_SEARCH = 60.0
+DEFAULT_MAX_WORKERS = 8
+
+# Layer III bitrates in kbit/s by bitrate index, sample rates in Hz by index
+_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def mp3_frames(data):
+    # (offsets, lengths, durations) of the MPEG audio Layer III frames; tags
+    # and junk between frames are skipped
+    offsets, lengths, durations = [], [], []
+    position = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        position = 10 + size + (10 if data[5] & 0x10 else 0)
+    while position + 4 <= len(data):
+        b1, b2 = data[position + 1], data[position + 2]
+        version, layer = (b1 >> 3) & 0x3, (b1 >> 1) & 0x3
+        bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 0x3
+        if data[position] != 0xFF or b1 & 0xE0 != 0xE0 or version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            if data[position:position + 3] == b'TAG':
+                break
+            position += 1
+            continue
+        mpeg1 = version == 3
+        bitrate = _BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+        sample_rate = _SAMPLE_RATES[version][rate_index]
+        length = (144 if mpeg1 else 72) * bitrate // sample_rate + ((b2 >> 1) & 0x1)
+        offsets.append(position)
+        lengths.append(length)
+        durations.append((1152 if mpeg1 else 576) / sample_rate)
+        position += length
+    return np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64), np.array(durations)
+
+
+def silence_points(data, min_silence=700, threshold=-40):
+    # Midpoints of pauses in seconds; needs pydub and ffmpeg to decode
+    from pydub import AudioSegment
+    from pydub.silence import detect_silence
+    audio = AudioSegment.from_file(BytesIO(data), format='mp3').set_channels(1).set_frame_rate(16000)
+    # threshold is relative to the recording's average loudness
+    loudness = audio.dBFS if np.isfinite(audio.dBFS) else 0.0
+    pauses = detect_silence(audio, min_silence_len=min_silence, silence_thresh=loudness + threshold)
+    return np.array([(start + end) / 2000 for start, end in pauses])
+
+
+def plan_windows(duration, window, overlap, pauses=None):
+    # (start, end) in seconds; each window ends at the last pause in the
+    # search range before its nominal end, if there is one
+    windows, start = [], 0.0
+    while True:
+        end = start + window
+        if end >= duration:
+            windows.append((start, duration))
+            return windows
+        if pauses is not None and len(pauses):
+            candidates = pauses[(pauses > max(end - SILENCE_SEARCH, start + 2 * overlap)) & (pauses <= end)]
+            if len(candidates):
+                end = float(candidates[-1])
+        windows.append((start, end))
+        start = end - overlap
+
+
+@dataclass
+class AudioWindow:
+    start: float
+    end: float
+    audio: bytes
+
+
+@dataclass
+class TranscriptSegment:
+    start: float
+    end: float
+    text: str
+
+
+@dataclass
+class Transcript:
+    segments: list = field(default_factory=list)
+
+    @property
+    def text(self):
+        return ' '.join(segment.text for segment in self.segments)
+
+    def timestamped(self):
+        return '\n'.join(f"[{_timestamp(segment.start)}] {segment.text}" for segment in self.segments)
+
+
+def _timestamp(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def split_audio(data, window=DEFAULT_WINDOW, overlap=DEFAULT_OVERLAP, on_silence=False):
+    offsets, lengths, durations = mp3_frames(data)
+    if not len(offsets):
+        raise ValueError("No MP3 audio frames found in the file.")
+    starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+    duration = float(starts[-1] + durations[-1])
+    # Keep every window under the upload limit at the file's average bitrate
+    bytes_per_second = lengths.sum() / duration
+    window = max(min(window, 0.95 * MAX_SEGMENT_BYTES / bytes_per_second), 4 * overlap)
+    pauses = silence_points(data) if on_silence else None
+    windows = []
+    for start, end in plan_windows(duration, window, overlap, pauses):
+        first, last = np.searchsorted(starts, start), np.searchsorted(starts, end)
+        chunk = b''.join(data[offset:offset + length] for offset, length in zip(offsets[first:last], lengths[first:last]))
+        windows.append(AudioWindow(float(starts[first]), float(starts[last - 1] + durations[last - 1]), chunk))
+    return windows
+
+
+def _field(item, name):
+    return item[name] if isinstance(item, dict) else getattr(item, name)
+
+
+def openai_transcriber(window):
+    # Timed segments of one window, relative to its start
+    response = create_transcription(
+        file=(f"window-{window.start:.0f}.mp3", window.audio),
+        model="whisper-1",
+        response_format="verbose_json",
+    )
+    timed = getattr(response, 'segments', None) or []
+    if not timed:
+        return [TranscriptSegment(0.0, window.end - window.start, response.text.strip())]
+    return [TranscriptSegment(_field(item, 'start'), _field(item, 'end'), _field(item, 'text').strip()) for item in timed]
+
+
+class ScriptedTranscriber:
+    # Local fake for tests: "transcribes" a window by returning the parts of
+    # a known script (TranscriptSegments in absolute time) it overlaps
+    def __init__(self, script):
+        self.script = script
+
+    def __call__(self, window):
+        return [
+            TranscriptSegment(item.start - window.start, item.end - window.start, item.text)
+            for item in self.script
+            if item.end > window.start and item.start < window.end
+        ]
+
+
+# Transcribers offered on the Whisper page, by name
+TRANSCRIPTION_BACKENDS = {
+    'OpenAI Whisper': openai_transcriber,
+}
+
+
+def _repeated_words(previous, text, max_words=20):
+    # Number of leading words of text that repeat the end of previous
+    before, after = previous.split(), text.split()
+    for size in range(min(max_words, len(before), len(after)), 0, -1):
+        if [word.casefold() for word in before[-size:]] == [word.casefold() for word in after[:size]]:
+            return size
+    return 0
+
+
+def stitch(windows, transcribed):
+    # Each overlap is cut at its middle: a segment is kept from the window on
+    # whose side of the cut its midpoint lies, and words repeated across the
+    # cut are dropped
+    segments = []
+    for position, (window, parts) in enumerate(zip(windows, transcribed)):
+        low = (window.start + windows[position - 1].end) / 2 if position else float('-inf')
+        high = (windows[position + 1].start + window.end) / 2 if position + 1 < len(windows) else float('inf')
+        at_cut = bool(segments)
+        for part in parts:
+            start, end = window.start + part.start, window.start + part.end
+            if not low <= (start + end) / 2 < high or not part.text:
+                continue
+            text = part.text
+            if at_cut:
+                text = ' '.join(text.split()[_repeated_words(segments[-1].text, text):])
+                if not text:
+                    continue
+                at_cut = False
+            segments.append(TranscriptSegment(start, end, text))
+    return Transcript(segments)
+
+
+def transcribe_audio(data, transcriber=openai_transcriber, window=DEFAULT_WINDOW, overlap=DEFAULT_OVERLAP,
+                     on_silence=False, max_workers=DEFAULT_MAX_WORKERS, progress=None):
+    # progress(done, total) is called as windows finish
+    windows = split_audio(data, window, overlap, on_silence)
+    transcribed = [None] * len(windows)
+    for done, (position, parts) in enumerate(map_as_completed(transcriber, windows, max_workers=max_workers), start=1):
+        transcribed[position] = parts
+        if progress is not None:
+            progress(done, len(windows))
+    return stitch(windows, transcribed)
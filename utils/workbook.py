@@ -0,0 +1,86 @@
+from io import BytesIO
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from pandas._libs.parsers import STR_NA_VALUES
+
+# xlsx uploads are opened once, in openpyxl's read-only mode, which streams
+# each sheet's rows instead of building the whole workbook in memory. Only
+# the requested sheets are read and only the requested columns are kept;
+# other sheets are never touched. The result matches pd.read_excel: its
+# default NA strings become missing and blank trailing columns and rows are
+# dropped.
+
+
+def _header(row):
+    # Column names as pandas gives them: blanks become "Unnamed: i" and
+    # repeated names get ".1", ".2" suffixes
+    names, seen = [], {}
+    for position, value in enumerate(row):
+        name = f"Unnamed: {position}" if value is None else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _cell(value):
+    return None if isinstance(value, str) and value in STR_NA_VALUES else value
+
+
+def _trimmed(row):
+    # Formatted but empty cells at the end of a row are not data
+    end = len(row)
+    while end and _cell(row[end - 1]) is None:
+        end -= 1
+    return row[:end]
+
+
+def _sheet_frame(worksheet, columns, max_rows):
+    # The stored <dimension> tag can be stale (e.g. "A1" from export tools);
+    # without this read-only mode trusts it and truncates every row
+    worksheet.reset_dimensions()
+    rows = worksheet.iter_rows(values_only=True)
+    header_row = _trimmed(next(rows, ()))
+    if columns is None:
+        rows = [_trimmed(row) for row in islice(rows, max_rows)]
+        width = max([len(header_row)] + [len(row) for row in rows])
+        header = _header(header_row + (None,) * (width - len(header_row)))
+        positions = list(range(width))
+    else:
+        header = _header(header_row)
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValueError(f"Columns not found in sheet '{worksheet.title}': {missing}")
+        positions = [header.index(column) for column in columns]
+        rows = islice(rows, max_rows)
+    records = [
+        tuple(_cell(row[position]) if position < len(row) else None for position in positions)
+        for row in rows
+    ]
+    # Read-only sheets can report formatted but empty rows at the end
+    while records and all(value is None for value in records[-1]):
+        records.pop()
+    return pd.DataFrame.from_records(records, columns=[header[position] for position in positions]).infer_objects().fillna(np.nan)
+
+
+def read_sheets(data, sheets, max_rows=None):
+    # data: bytes or a path; sheets: sheet name or index -> list of columns,
+    # or None for all columns. Returns a DataFrame per requested sheet.
+    workbook = load_workbook(BytesIO(data) if isinstance(data, bytes) else data, read_only=True, data_only=True)
+    try:
+        return {
+            sheet: _sheet_frame(workbook.worksheets[sheet] if isinstance(sheet, int) else workbook[sheet], columns, max_rows)
+            for sheet, columns in sheets.items()
+        }
+    finally:
+        workbook.close()
+
+
+def read_sheet(data, sheet=0, columns=None, max_rows=None):
+    return read_sheets(data, {sheet: columns}, max_rows)[sheet]
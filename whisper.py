@@ -1,7 +1,7 @@
 import streamlit as st
-import tempfile
-import os
-from utils.data_utils import transcribe_audio_file, analyze_transcription, save_analysis_to_docx
+from utils.data_utils import analyze_transcription
+from utils.transcription import TRANSCRIPTION_BACKENDS, transcribe_audio
+from utils.exports import MIME_TYPES, to_docx
 from docx import Document
 
 def whisper_page():
@@ -9,36 +9,36 @@ def whisper_page():
     st.title("🎙️ Whisper")
 
     # Introduction text
-    st.write("""Verwandeln Sie Audiodateien mühelos in Text! Laden Sie Ihre Audiodateien (bis 25 MB) hoch und erhalten Sie präzise 
-             Transkripte. Ideal für die Analyse von Interviews, Fokusgruppen oder anderen gesprochenen Inhalten. Hier können Sie das Audiofile ggf. komprimieren.
-             
-             https://www.onlineconverter.com/compress-mp3""")
+    st.write("""Verwandeln Sie Audiodateien mühelos in Text! Laden Sie Ihre Audiodateien hoch und erhalten Sie präzise 
+             Transkripte. Ideal für die Analyse von Interviews, Fokusgruppen oder anderen gesprochenen Inhalten. Lange Aufnahmen 
+             werden automatisch in Abschnitte geteilt und parallel transkribiert.""")
 
     # Step 1: Transcription
     st.header("📝 Transcribe Audio")
     uploaded_file = st.file_uploader("Upload an MP3 file", type="mp3")
+    backend = st.selectbox("Transcription backend", options=list(TRANSCRIPTION_BACKENDS))
+    col1, col2 = st.columns(2)
+    with col1:
+        on_silence = st.checkbox("Split at pauses", value=False, help="Cuts long recordings where nobody speaks instead of at fixed times. Needs ffmpeg.")
+    with col2:
+        with_timestamps = st.checkbox("Timestamps in the transcript", value=False)
 
     if st.button("📝 Transcribe"):
         if uploaded_file is not None:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-                temp_file.write(uploaded_file.read())
-                temp_file_path = temp_file.name
-
             try:
                 with st.spinner("Transcribing..."):
-                    transcription = transcribe_audio_file(temp_file_path)
+                    progress_bar = st.progress(0)
+                    transcript = transcribe_audio(
+                        uploaded_file.getvalue(), transcriber=TRANSCRIPTION_BACKENDS[backend], on_silence=on_silence,
+                        progress=lambda done, total: progress_bar.progress(done / total),
+                    )
+                    transcription = transcript.timestamped() if with_timestamps else transcript.text
                     st.subheader("Transcript")
                     st.write(transcription)
 
-                    docx_file_path = os.path.join(tempfile.gettempdir(), "transcription.docx")
-                    save_analysis_to_docx(transcription, docx_file_path)
-
-                    with open(docx_file_path, "rb") as f:
-                        st.download_button("Download Transcription as DOCX", f, file_name="transcription.docx")
+                    st.download_button("Download Transcription as DOCX", to_docx(transcription), file_name="transcription.docx", mime=MIME_TYPES['docx'])
             except Exception as e:
                 st.error(f"An error occurred: {e}")
-            finally:
-                os.remove(temp_file_path)
 
     # Step 2: Analysis (optional)
     st.header("🔍Interrogate Transcript")
@@ -59,10 +59,6 @@ def whisper_page():
                     st.subheader("Analysis")
                     st.write(analysis)
 
-                    docx_analysis_file_path = os.path.join(tempfile.gettempdir(), "analysis.docx")
-                    save_analysis_to_docx(analysis, docx_analysis_file_path)
-
-                    with open(docx_analysis_file_path, "rb") as f:
-                        st.download_button("Download Analysis as DOCX", f, file_name="analysis.docx")
+                    st.download_button("Download Analysis as DOCX", to_docx(analysis), file_name="analysis.docx", mime=MIME_TYPES['docx'])
             except Exception as e:
                 st.error(f"An error occurred: {e}")
\ No newline at end of file